@@ -0,0 +1,205 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import model_registry
+import rate_limit
+import reporting
+import run_journal
+import tracing
+
+# Batch mode: solve a whole problem set with any architecture.
+#
+#     python batch_runner.py king example_problems.txt --out results/king.jsonl --concurrency 8 --provider-cap openai=6 --provider-cap mistral=2
+#
+# Problems run concurrently under a global cap (--concurrency) while every provider call
+# also respects a per-provider in-flight cap (--provider-cap). Each finished problem is
+# appended to the JSONL output straight away; re-running the same command skips the
+# problems that already have a successful result there, so an interrupted batch resumes.
+# At the end one HTML report covers the whole problem set (see reporting.write_batch_report).
+
+PINK = '\033[95m'
+CYAN = '\033[96m'
+YELLOW = '\033[93m'
+NEON_GREEN = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+# Settings (MOI_* environment variables, by prefix) that change the answers of a run, so
+# batches that differ in any of them never resume from each other's journals
+ANSWER_SETTINGS = ("MOI_CONSENSUS", "MOI_DISCUSSION", "MOI_DUOPOLY", "MOI_ROSTER", "MOI_HEDGE", "MOI_SEMANTIC",
+                   "MOI_FINAL_PROMPT_BUDGET", "MOI_COMPACTION_MODEL", "MOI_OPENAI_BASE_URL", "MOI_MISTRAL_BASE_URL",
+                   "MOI_GEMINI_BASE_URL")
+
+
+# Architecture name -> (module, function); modules are imported only when selected
+ARCHITECTURES = {
+    "king": ("king_architecture", "the_king"),
+    "duopoly": ("duopoly_architecture", "duopoly"),
+    "democracy": ("democracy_architecture", "the_democracy"),
+    # Hybrids built from the three on the graph engine (see dag.py)
+    "democracy-king": ("hybrid_architectures", "democracy_king"),
+    "council": ("hybrid_architectures", "council"),
+}
+
+
+def load_architecture(name):
+    module_name, function_name = ARCHITECTURES[name]
+    module = __import__(module_name)
+    return getattr(module, function_name)
+
+
+def problem_id(text):
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()[:16]
+
+
+# Identifies a batch: its results file, architecture and answer-affecting settings. The run
+# journals of its problems are named after it, so re-running the same command resumes them
+# while another batch (or the same one with other settings) starts its problems afresh.
+def batch_id(architecture, out_path, call_model_fn=None):
+    settings = {name: value for name, value in sorted(os.environ.items()) if name.startswith(ANSWER_SETTINGS)}
+    calls = getattr(call_model_fn, "__qualname__", type(call_model_fn).__name__) if call_model_fn else "providers.call_model"
+    identity = json.dumps([os.path.abspath(out_path), architecture, settings, model_registry.roster_settings(), calls],
+                          sort_keys=True, default=str)
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:12]
+
+
+# Split a problem set file into problems. Problems are separated by blank lines; a block
+# whose first line ends with ':' (as in example_problems.txt) uses that line as its title.
+def parse_problem_file(path):
+    with open(path, 'r', encoding='utf-8') as infile:
+        blocks = [block.strip() for block in infile.read().split("\n\n") if block.strip()]
+    problems = []
+    for block in blocks:
+        first_line, _, rest = block.partition("\n")
+        if first_line.rstrip().endswith(":") and rest.strip():
+            title, text = first_line.rstrip()[:-1], rest.strip()
+        else:
+            title, text = first_line[:80], block
+        problems.append({"id": problem_id(text), "title": title, "problem": text})
+    return problems
+
+
+# A file holds a problem set; a directory holds one problem per *.txt file
+def load_problems(path):
+    if os.path.isdir(path):
+        problems = []
+        for file_path in sorted(glob.glob(os.path.join(path, "*.txt"))):
+            with open(file_path, 'r', encoding='utf-8') as infile:
+                text = infile.read().strip()
+            if text:
+                problems.append({"id": problem_id(text), "title": os.path.splitext(os.path.basename(file_path))[0], "problem": text})
+        return problems
+    return parse_problem_file(path)
+
+
+# This architecture's records in a results file by problem id; the latest one wins, unless
+# an earlier one succeeded and it did not
+def load_records(out_path, architecture):
+    records = {}
+    if not os.path.exists(out_path):
+        return records
+    with open(out_path, 'r', encoding='utf-8') as infile:
+        for line in infile:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue    # a line cut short by an interruption
+            if record.get("architecture") != architecture:
+                continue
+            if record["id"] not in records or not record.get("error") or records[record["id"]].get("error"):
+                records[record["id"]] = record
+    return records
+
+
+# Problem ids that already have a successful result for this architecture
+def completed_ids(out_path, architecture):
+    return {problem_id for problem_id, record in load_records(out_path, architecture).items() if not record.get("error")}
+
+
+# call_model_fn replaces providers.call_model, e.g. with a FakeProvider for offline runs
+def run_batch(architecture, problems, out_path, concurrency=4, provider_caps=None, call_model_fn=None):
+    if provider_caps:
+        rate_limit.set_concurrency_limits(provider_caps)
+    solve = load_architecture(architecture)
+
+    done = completed_ids(out_path, architecture)
+    todo = [problem for problem in problems if problem["id"] not in done]
+    print(f"{NEON_GREEN}📦 --- Batch: {len(problems)} problems, {len(problems) - len(todo)} already solved, {len(todo)} to run with {architecture} --- 📦{RESET_COLOR}")
+    if not todo:
+        return []
+
+    batch = batch_id(architecture, out_path, call_model_fn)
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    os.makedirs(out_dir, exist_ok=True)
+    write_lock = threading.Lock()
+
+    def run_one(problem):
+        started = time.monotonic()
+        record = {"id": problem["id"], "title": problem["title"], "architecture": architecture, "problem": problem["problem"]}
+        # One journal per problem of the batch, so a problem that failed resumes on the next run
+        journal = run_journal.open_run(architecture, problem["problem"], f"batch-{architecture}-{batch}-{problem['id']}")
+        with tracing.collect_phases() as phases:
+            try:
+                with tracing.start_span(problem["title"], "run", id=problem["id"]):
+                    record["answer"] = solve(problem["problem"], call_model_fn=call_model_fn, stream=False, journal=journal)
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+        record["seconds"] = round(time.monotonic() - started, 3)
+        # For the batch report: how long each phase took, and every intermediate answer
+        record["phases"] = phases
+        record["steps"] = journal.results() if journal else {}
+        with write_lock, open(out_path, 'a', encoding='utf-8') as outfile:
+            outfile.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    records = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_one, problem) for problem in todo]
+        for count, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            records.append(record)
+            status = f"{YELLOW}failed: {record['error']}" if record.get("error") else f"{NEON_GREEN}solved in {record['seconds']}s"
+            print(f"{CYAN}[{count}/{len(todo)}] {record['title']}:{RESET_COLOR} {status}{RESET_COLOR}")
+    return records
+
+
+def parse_provider_caps(values):
+    caps = {}
+    for value in values or []:
+        provider, _, limit = value.partition("=")
+        caps[provider.strip()] = int(limit)
+    return caps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve a set of problems with one of the Mixture of Idiots architectures.")
+    parser.add_argument("architecture", choices=sorted(ARCHITECTURES))
+    parser.add_argument("problems", help="problem set file (blank-line separated) or directory of .txt files")
+    parser.add_argument("--out", help="JSONL results file (default: results/<architecture>.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=4, help="problems solved at the same time")
+    parser.add_argument("--provider-cap", action="append", metavar="PROVIDER=N",
+                        help="max in-flight requests to a provider, e.g. openai=8 (repeatable)")
+    parser.add_argument("--report", help="HTML report of the whole batch (default: <MOI_REPORT_DIR>/batch-<results file name>.html)")
+    args = parser.parse_args(argv)
+
+    out_path = args.out or os.path.join("results", f"{args.architecture}.jsonl")
+    report_path = args.report or os.path.join(reporting.REPORT_DIR, f"batch-{os.path.splitext(os.path.basename(out_path))[0]}.html")
+    problems = load_problems(args.problems)
+    started = time.monotonic()
+    records = run_batch(args.architecture, problems, out_path,
+                        concurrency=args.concurrency, provider_caps=parse_provider_caps(args.provider_cap))
+    failed = sum(1 for record in records if record.get("error"))
+    print(f"\n{NEON_GREEN}✅ --- Batch complete: {len(records) - failed} solved, {failed} failed in {time.monotonic() - started:.1f}s → {out_path} --- ✅{RESET_COLOR}")
+    # The report covers the problems solved in earlier runs of the batch too
+    recorded = load_records(out_path, args.architecture)
+    reporting.write_batch_report(args.architecture, [recorded[problem["id"]] for problem in problems if problem["id"] in recorded], report_path)
+    tracing.finish_run(f"batch-{args.architecture}")
+
+
+if __name__ == "__main__":
+    main()
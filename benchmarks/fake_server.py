@@ -0,0 +1,353 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Local stand-in for the OpenAI, Mistral and Gemini HTTP APIs, for benchmarking the
+# architectures without network jitter or API costs.
+#
+#     python benchmarks/fake_server.py --port 8765 --time-scale 0.1
+#
+# Routes (point providers.py at them with MOI_<PROVIDER>_BASE_URL):
+#   POST /openai/v1/chat/completions                      OpenAI chat completions (JSON or SSE)
+#   POST /mistral/v1/chat/completions                     Mistral chat completions (JSON or SSE)
+#   POST /v1beta/models/<model>:generateContent           Gemini (JSON)
+#   POST /v1beta/models/<model>:streamGenerateContent     Gemini (SSE with alt=sse)
+#   GET  /stats, POST /reset                              request/token/byte counters
+#
+# Every model has a latency profile: a log-normal time to first token, a decoding speed,
+# a completion length range and error rates. All randomness is seeded per model and call
+# number, so the same run against the same profile sees the same latencies.
+#
+# OpenAI's automatic prompt caching is simulated too: a prompt of 1024 tokens or more whose
+# beginning was already sent to the same model has that prefix (in 128-token blocks)
+# reported as cached tokens, and its time to first token shortened by CACHED_TTFT_SAVING
+# for the cached share of the prompt.
+
+# Seconds to first token (median, log-normal sigma), tokens per second, completion tokens
+# (min, max), and the share of calls answered with a 429 / a 500
+DEFAULT_PROFILE = {
+    "openai": {"ttft_median": 0.6, "ttft_sigma": 0.4, "tokens_per_second": 90, "completion_tokens": [250, 600],
+               "rate_limit_rate": 0.0, "error_rate": 0.0},
+    "mistral": {"ttft_median": 0.5, "ttft_sigma": 0.5, "tokens_per_second": 70, "completion_tokens": [250, 600],
+                "rate_limit_rate": 0.0, "error_rate": 0.0},
+    "gemini": {"ttft_median": 0.8, "ttft_sigma": 0.6, "tokens_per_second": 120, "completion_tokens": [300, 800],
+               "rate_limit_rate": 0.0, "error_rate": 0.0},
+    "models": {
+        "gpt-4-turbo": {"ttft_median": 1.2, "tokens_per_second": 35},
+        "gpt-4-turbo-preview": {"ttft_median": 1.2, "tokens_per_second": 35},
+        "open-mixtral-8x22b": {"tokens_per_second": 50},
+        "models/gemini-2.5-pro-exp-03-25": {"ttft_median": 4.0, "ttft_sigma": 0.8},
+        "models/gemini-2.5-flash-preview-04-17-thinking": {"ttft_median": 2.5},
+        "models/gemma-3-27b-it": {"ttft_median": 1.5, "tokens_per_second": 40},
+    },
+}
+
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+CACHED_TTFT_SAVING = 0.5
+
+_WORDS = ("the", "solution", "uses", "a", "loop", "over", "each", "value", "and", "returns", "result", "because",
+          "complexity", "is", "linear", "we", "check", "edge", "cases", "first", "then", "combine", "answer", "step")
+_OPTION = re.compile(r"Option ([A-Z]{1,2}\d*) \(from ")
+
+
+def _tokens_of(text):
+    return max(1, len(text) // 4)
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}
+        self.errors = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.calls_per_model = {}
+
+    def record(self, provider, model_name, status, prompt_tokens, completion_tokens, bytes_in, bytes_out):
+        with self._lock:
+            self.requests[provider] = self.requests.get(provider, 0) + 1
+            self.calls_per_model[model_name] = self.calls_per_model.get(model_name, 0) + 1
+            if status != 200:
+                self.errors[str(status)] = self.errors.get(str(status), 0) + 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def as_dict(self):
+        with self._lock:
+            return {"requests": dict(self.requests), "errors": dict(self.errors), "calls_per_model": dict(self.calls_per_model),
+                    "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens,
+                    "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open many concurrent connections at once
+    request_queue_size = 128
+
+    def __init__(self, address, profile=None, time_scale=1.0, seed=0):
+        super().__init__(address, FakeProviderHandler)
+        self.profile = profile or DEFAULT_PROFILE
+        self.time_scale = time_scale
+        self.seed = seed
+        self.stats = Stats()
+        self._call_numbers = {}
+        self._prefixes = {}     # model -> digests of the prompt prefixes seen, for the simulated prompt cache
+        self._lock = threading.Lock()
+
+    def model_profile(self, provider, model_name):
+        settings = dict(self.profile[provider])
+        settings.update(self.profile.get("models", {}).get(model_name, {}))
+        return settings
+
+    # A random generator for the model's next call, seeded by model name and call number
+    def rng_for(self, model_name):
+        with self._lock:
+            number = self._call_numbers.get(model_name, 0)
+            self._call_numbers[model_name] = number + 1
+        return random.Random(zlib.crc32(f"{self.seed}:{model_name}:{number}".encode("utf-8")))
+
+    # Tokens at the start of the prompt that an earlier prompt to the model already began with
+    def cached_tokens(self, model_name, prompt):
+        if _tokens_of(prompt) < CACHE_MIN_TOKENS:
+            return 0
+        block = CACHE_BLOCK_TOKENS * 4      # characters, see _tokens_of
+        digest = hashlib.sha1(prompt[:CACHE_MIN_TOKENS * 4 - block].encode("utf-8"))
+        cached, hitting = 0, True
+        with self._lock:
+            seen = self._prefixes.setdefault(model_name, set())
+            for end in range(CACHE_MIN_TOKENS * 4, len(prompt) + 1, block):
+                digest.update(prompt[end - block:end].encode("utf-8"))
+                key = digest.hexdigest()
+                hitting = hitting and key in seen
+                if hitting:
+                    cached = end
+                seen.add(key)
+        return cached // 4
+
+    def reset(self):
+        with self._lock:
+            self._call_numbers.clear()
+            self._prefixes.clear()
+        self.stats.reset()
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- plumbing -------------------------------------------------------------------------
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return raw, (json.loads(raw) if raw else {})
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        return len(body)
+
+    def _start_sse(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _send_event(self, data):
+        payload = f"data: {data}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+        self.wfile.flush()
+        return len(payload)
+
+    def _end_sse(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    # --- routing --------------------------------------------------------------------------
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/stats":
+            self._send_json(200, self.server.stats.as_dict())
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown route {self.path}"}})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path == "/reset":
+            self._read_body()
+            self.server.reset()
+            self._send_json(200, {"ok": True})
+            return
+        raw, request = self._read_body()
+        if path in ("/openai/v1/chat/completions", "/mistral/v1/chat/completions"):
+            provider = path.split("/")[1]
+            prompt = "\n".join(str(message.get("content", "")) for message in request.get("messages", []))
+            self._answer(provider, request.get("model", ""), prompt, bool(request.get("stream")), len(raw))
+            return
+        match = re.match(r"^/v1beta/(models/[^:]+):(generateContent|streamGenerateContent)$", path)
+        if match:
+            prompt = "\n".join(part.get("text", "") for content in request.get("contents", []) for part in content.get("parts", []))
+            self._answer("gemini", match.group(1), prompt, match.group(2) == "streamGenerateContent", len(raw))
+            return
+        self._send_json(404, {"error": {"message": f"Unknown route {path}"}})
+
+    # --- answers --------------------------------------------------------------------------
+
+    def _answer(self, provider, model_name, prompt, stream, bytes_in):
+        server = self.server
+        settings = server.model_profile(provider, model_name)
+        rng = server.rng_for(model_name)
+        prompt_tokens = _tokens_of(prompt)
+        ttft = settings["ttft_median"] * math.exp(rng.gauss(0.0, settings["ttft_sigma"])) * server.time_scale
+        cached_tokens = server.cached_tokens(model_name, prompt) if provider == "openai" else 0
+        ttft *= 1 - CACHED_TTFT_SAVING * cached_tokens / prompt_tokens
+
+        roll = rng.random()
+        if roll < settings["rate_limit_rate"]:
+            time.sleep(min(ttft, 0.05))
+            sent = self._send_error(provider, 429, "Rate limit exceeded", {"Retry-After": "1"})
+            server.stats.record(provider, model_name, 429, prompt_tokens, 0, bytes_in, sent)
+            return
+        if roll < settings["rate_limit_rate"] + settings["error_rate"]:
+            time.sleep(ttft)
+            sent = self._send_error(provider, 500, "Internal error")
+            server.stats.record(provider, model_name, 500, prompt_tokens, 0, bytes_in, sent)
+            return
+
+        text = self._completion_text(prompt, settings, rng)
+        words = text.split(" ")
+        seconds_per_token = server.time_scale / settings["tokens_per_second"]
+        time.sleep(ttft)
+        if stream:
+            sent = self._stream(provider, model_name, words, seconds_per_token, prompt_tokens, cached_tokens)
+        else:
+            time.sleep(seconds_per_token * len(words))
+            sent = self._send_json(200, self._full_response(provider, model_name, text, prompt_tokens, len(words), cached_tokens))
+        server.stats.record(provider, model_name, 200, prompt_tokens, len(words), bytes_in, sent)
+
+    # Filler text of the profile's length; ballots (see vote_tally.py) get a valid JSON ballot
+    def _completion_text(self, prompt, settings, rng):
+        options = list(dict.fromkeys(_OPTION.findall(prompt)))
+        if options and '"ranking"' in prompt:
+            rng.shuffle(options)
+            return json.dumps({"ranking": options, "confidence": round(rng.uniform(0.4, 1.0), 2)})
+        low, high = settings["completion_tokens"]
+        return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(low, high)))
+
+    def _send_error(self, provider, status, message, headers=None):
+        if provider == "gemini":
+            payload = {"error": {"code": status, "message": message,
+                                 "status": "RESOURCE_EXHAUSTED" if status == 429 else "INTERNAL"}}
+        else:
+            payload = {"error": {"message": message, "type": "rate_limit_exceeded" if status == 429 else "server_error",
+                                 "code": str(status)}}
+        return self._send_json(status, payload, headers)
+
+    def _full_response(self, provider, model_name, text, prompt_tokens, completion_tokens, cached_tokens=0):
+        if provider == "gemini":
+            return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+                    "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens,
+                                      "totalTokenCount": prompt_tokens + completion_tokens}}
+        return {"id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model_name,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens,
+                          "prompt_tokens_details": {"cached_tokens": cached_tokens}}}
+
+    def _chunk(self, provider, model_name, text, finished, prompt_tokens, completion_tokens, cached_tokens=0):
+        if provider == "gemini":
+            chunk = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}]}
+            if finished:
+                chunk["candidates"][0]["finishReason"] = "STOP"
+                chunk["usageMetadata"] = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens,
+                                          "totalTokenCount": prompt_tokens + completion_tokens}
+            return chunk
+        chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model_name,
+                 "choices": [{"index": 0, "delta": {"content": text} if text else {}, "finish_reason": "stop" if finished else None}]}
+        if finished:
+            chunk["usage"] = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens,
+                              "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+        return chunk
+
+    # Tokens go out a few words per event, at the profile's decoding speed
+    def _stream(self, provider, model_name, words, seconds_per_token, prompt_tokens, cached_tokens=0, words_per_event=4):
+        self._start_sse()
+        sent = 0
+        try:
+            for start in range(0, len(words), words_per_event):
+                piece = " ".join(words[start:start + words_per_event])
+                if start:
+                    piece = " " + piece
+                last = start + words_per_event >= len(words)
+                sent += self._send_event(json.dumps(self._chunk(provider, model_name, piece, last and provider == "gemini",
+                                                                prompt_tokens, len(words))))
+                time.sleep(seconds_per_token * min(words_per_event, len(words) - start))
+            if provider != "gemini":
+                sent += self._send_event(json.dumps(self._chunk(provider, model_name, "", True, prompt_tokens, len(words), cached_tokens)))
+                sent += self._send_event("[DONE]")
+            self._end_sse()
+        except (BrokenPipeError, ConnectionResetError):
+            pass    # the client cancelled the stream
+        return sent
+
+
+def start_server(port=0, profile=None, time_scale=1.0, seed=0):
+    server = FakeProviderServer(("127.0.0.1", port), profile=profile, time_scale=time_scale, seed=seed)
+    thread = threading.Thread(target=server.serve_forever, name="fake-provider-server", daemon=True)
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI, Mistral and Gemini APIs.")
+    parser.add_argument("--port", type=int, default=0, help="port to listen on (0 picks a free one)")
+    parser.add_argument("--profile", help="JSON latency profile (default: DEFAULT_PROFILE)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiply every latency by this factor")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    profile = None
+    if args.profile:
+        with open(args.profile, 'r', encoding='utf-8') as infile:
+            profile = json.load(infile)
+    server = FakeProviderServer(("127.0.0.1", args.port), profile=profile, time_scale=args.time_scale, seed=args.seed)
+    # The benchmark runner reads the port from this first line
+    print(f"PORT {server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from contextlib import redirect_stderr, redirect_stdout
+
+# Benchmark the architectures against the local stand-in server (fake_server.py).
+#
+#     python benchmarks/run.py                          # all architectures, 3 runs each
+#     python benchmarks/run.py king --repeat 5 --time-scale 0.2
+#     python benchmarks/run.py --compare benchmarks/results/<older>.json
+#
+# Each architecture runs end to end through the real provider layer (SDK clients, pooling,
+# rate limiting, retries) against a server speaking the OpenAI, Mistral and Gemini wire
+# formats, so nothing is spent and nothing depends on the network. Latencies are seeded,
+# so runs of the same profile and seed are comparable across commits. Reported per
+# architecture: wall time, the critical path of provider calls, calls and retries, tokens
+# and bytes moved, and peak memory. Results are saved as JSON under benchmarks/results/.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+# A fixed problem, so results stay comparable when problem.txt changes
+BENCHMARK_PROBLEM = ("Write a Python function that returns the length of the longest substring without repeating "
+                     "characters, explain its time complexity, and list the edge cases it handles.")
+
+ARCHITECTURES = ("king", "duopoly", "democracy")
+
+PINK = '\033[95m'
+CYAN = '\033[96m'
+YELLOW = '\033[93m'
+NEON_GREEN = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+
+def start_fake_server(profile=None, time_scale=1.0, seed=0):
+    command = [sys.executable, os.path.join(REPO_ROOT, "benchmarks", "fake_server.py"),
+               "--time-scale", str(time_scale), "--seed", str(seed)]
+    if profile:
+        command += ["--profile", profile]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline().strip()
+    if not line.startswith("PORT "):
+        process.kill()
+        raise RuntimeError(f"Fake server did not start: {line!r}")
+    return process, f"http://127.0.0.1:{line.split()[1]}"
+
+
+def _server_request(base_url, path, method="GET"):
+    request = urllib.request.Request(base_url + path, data=b"{}" if method == "POST" else None, method=method)
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+# Point the provider layer at the server. Must run before providers is imported.
+def configure_environment(base_url):
+    os.environ.update({
+        "MOI_OPENAI_BASE_URL": f"{base_url}/openai/v1",
+        "MOI_MISTRAL_BASE_URL": f"{base_url}/mistral",
+        "MOI_GEMINI_BASE_URL": base_url,
+        "OPENAI_API_KEY": "benchmark", "MISTRAL_API_KEY": "benchmark", "GEMINI_API_KEY": "benchmark",
+        "MOI_CACHE": "0",
+        "MOI_TRACE": "1",
+        # A scratch cache directory: the learned model statistics (and the other stats kept
+        # there) neither steer the benchmark nor learn the fake server's latencies
+        "MOI_CACHE_DIR": tempfile.mkdtemp(prefix="moi-benchmark-"),
+    })
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+
+# The chain of provider calls that gated the end of the run: starting from the end, the
+# call that finished last, then the call that finished last before that one started, ...
+def critical_path(provider_spans, run_start, run_end, tolerance_us=2000):
+    spans = [span for span in provider_spans if span["ts"] >= run_start]
+    path = []
+    cursor = run_end
+    while True:
+        candidates = [span for span in spans if span["ts"] < cursor and span["ts"] + span["dur"] <= cursor + tolerance_us
+                      and span not in path]
+        if not candidates:
+            break
+        span = max(candidates, key=lambda item: item["ts"] + item["dur"])
+        path.append(span)
+        cursor = span["ts"]
+    return list(reversed(path))
+
+
+def run_once(architecture, stream, base_url):
+    import batch_runner
+    import model_registry
+    import rate_limit
+    import tracing
+
+    solve = batch_runner.load_architecture(architecture)
+    # Every run starts from the same state: no run selects advisors from an earlier one's calls
+    if os.path.exists(model_registry.STATS_PATH):
+        os.remove(model_registry.STATS_PATH)
+    model_registry.reset()
+    rate_limit.reset()
+    tracing.reset()
+    _server_request(base_url, "/reset", "POST")
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    run_span = tracing.start_span(architecture, "run")
+    error = None
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        try:
+            solve(BENCHMARK_PROBLEM, stream=stream)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    run_span.end()
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    path = critical_path(tracing.spans("provider"), run_span.started, run_span.ended)
+    rows = tracing.summary()
+    server = _server_request(base_url, "/stats")
+    return {
+        "wall_seconds": round(wall, 3),
+        "critical_path_seconds": round(sum(span["dur"] for span in path) / 1_000_000, 3),
+        "critical_path": [f"{span['name']} ({span['dur'] / 1_000_000:.2f}s)" for span in path],
+        "calls": sum(row["calls"] for row in rows),
+        "http_requests": sum(server["requests"].values()),
+        "retries": sum(row["retries"] for row in rows),
+        "http_errors": server["errors"],
+        "prompt_tokens": server["prompt_tokens"],
+        "completion_tokens": server["completion_tokens"],
+        "cached_token_ratio": round(tracing.cached_token_ratio(rows), 3),
+        "bytes_sent": server["bytes_in"],
+        "bytes_received": server["bytes_out"],
+        "peak_python_mb": round(peak / 1_048_576, 2),
+        "error": error,
+    }
+
+
+# Median of each numeric field over the runs; the critical path of the median run
+def combine(runs):
+    combined = {}
+    for field in runs[0]:
+        values = [run[field] for run in runs]
+        if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+            combined[field] = round(statistics.median(values), 3)
+    median_run = sorted(runs, key=lambda run: run["wall_seconds"])[len(runs) // 2]
+    combined["critical_path"] = median_run["critical_path"]
+    combined["wall_seconds_min"] = min(run["wall_seconds"] for run in runs)
+    combined["wall_seconds_max"] = max(run["wall_seconds"] for run in runs)
+    combined["errors"] = [run["error"] for run in runs if run["error"]]
+    return combined
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+        return revision + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results, baseline=None):
+    print(f"\n{NEON_GREEN}📏 --- Benchmark Results ({results['revision']}, {results['settings']['repeat']} runs each, median) --- 📏{RESET_COLOR}")
+    print(f"{CYAN}{'architecture':<12} {'wall':>8} {'critical':>9} {'calls':>6} {'http':>6} {'retries':>7} {'tokens in/out':>15} {'peak MB':>8}{RESET_COLOR}")
+    for architecture, result in results["architectures"].items():
+        delta = ""
+        if baseline and architecture in baseline.get("architectures", {}):
+            before = baseline["architectures"][architecture]["wall_seconds"]
+            if before:
+                change = (result["wall_seconds"] - before) / before * 100
+                color = NEON_GREEN if change <= 0 else YELLOW
+                delta = f" {color}({change:+.1f}% vs {baseline['revision']}){RESET_COLOR}"
+        tokens = f"{int(result['prompt_tokens'])}/{int(result['completion_tokens'])}"
+        print(f"{architecture:<12} {result['wall_seconds']:>7.2f}s {result['critical_path_seconds']:>8.2f}s {int(result['calls']):>6} "
+              f"{int(result['http_requests']):>6} {int(result['retries']):>7} {tokens:>15} {result['peak_python_mb']:>8.1f}{delta}")
+        print(f"{PINK}  critical path: {' → '.join(result['critical_path']) or '-'}{RESET_COLOR}")
+        for error in result["errors"]:
+            print(f"{YELLOW}  failed run: {error}{RESET_COLOR}")
+    print(f"{CYAN}peak RSS: {results['peak_rss_mb']:.1f} MB{RESET_COLOR}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the architectures against a local fake provider server.")
+    parser.add_argument("architectures", nargs="*", metavar="architecture", help=f"any of {', '.join(ARCHITECTURES)} (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per architecture (the median is reported)")
+    parser.add_argument("--time-scale", type=float, default=0.25, help="multiply every simulated latency by this factor")
+    parser.add_argument("--profile", help="JSON latency profile for the fake server")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stream", action="store_true", help="use the streaming code paths")
+    parser.add_argument("--out", help="results file (default: benchmarks/results/<revision>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare wall times against")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.architectures if name not in ARCHITECTURES]
+    if unknown:
+        parser.error(f"unknown architecture: {', '.join(unknown)}")
+    architectures = args.architectures or list(ARCHITECTURES)
+
+    server, base_url = start_fake_server(args.profile, args.time_scale, args.seed)
+    try:
+        configure_environment(base_url)
+        results = {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "settings": {"repeat": args.repeat, "time_scale": args.time_scale, "seed": args.seed,
+                         "profile": args.profile or "default", "stream": args.stream},
+            "architectures": {},
+        }
+        for architecture in architectures:
+            print(f"{YELLOW}⏱️  Benchmarking {architecture}...{RESET_COLOR}")
+            runs = [run_once(architecture, args.stream, base_url) for _ in range(args.repeat)]
+            results["architectures"][architecture] = dict(combine(runs), runs=runs)
+        results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    finally:
+        server.terminate()
+        server.wait()
+
+    out_path = args.out or os.path.join(RESULTS_DIR, f"{results['revision']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, 'w', encoding='utf-8') as outfile:
+        json.dump(results, outfile, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as infile:
+            baseline = json.load(infile)
+    print_results(results, baseline)
+    print(f"{CYAN}💾 Results saved to {out_path}{RESET_COLOR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import json
+import math
+import os
+import re
+import threading
+import zlib
+
+# Local consensus check across the King's advisors.
+#
+# When most advisors already give essentially the same answer, the King's synthesis call
+# (the largest prompt of the run) adds little. Each advice is compared locally:
+#   - its final answer is extracted ("the answer is 42", "**Final answer:** ...", \boxed{})
+#   - its code blocks are normalized (comments, blank lines and spacing stripped)
+#   - its text becomes a hashed word/bigram vector, compared by cosine similarity (NumPy)
+# Two advisors whose advice both contains code agree when the normalized code matches;
+# otherwise when both state the same final answer, or when their vectors are similar enough. If the largest group of agreeing advisors reaches
+# MOI_CONSENSUS_THRESHOLD of all answers, the King call is skipped (the most central
+# advice of the group is the answer) or downgraded to a cheaper model, depending on
+# MOI_CONSENSUS=skip|downgrade. The default, off, always consults the King.
+#
+# Every check is counted in <MOI_CACHE_DIR>/consensus_stats.json, so how often the stage
+# fires can be tracked across runs.
+
+CONSENSUS_MODE = os.getenv("MOI_CONSENSUS", "off").lower()
+CONSENSUS_THRESHOLD = float(os.getenv("MOI_CONSENSUS_THRESHOLD", "0.75"))
+SIMILARITY_THRESHOLD = float(os.getenv("MOI_CONSENSUS_SIMILARITY", "0.8"))
+CONSENSUS_MODEL = os.getenv("MOI_CONSENSUS_MODEL", "openai:gpt-4o-mini")
+# Fewer answers than this never count as a consensus
+MIN_ANSWERS = 3
+
+VECTOR_SIZE = 4096
+
+STATS_PATH = os.path.join(os.getenv("MOI_CACHE_DIR", ".moi_cache"), "consensus_stats.json")
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_WORD = re.compile(r"[a-z0-9_]+")
+_CODE_BLOCK = re.compile(r"```[\w+-]*\n(.*?)```", re.DOTALL)
+# The answer must follow on the same line: "**Final Answer:**" followed by a code block
+# states no answer of its own
+_ANSWER_PATTERNS = [
+    re.compile(r"\\boxed\{([^{}]+)\}"),
+    re.compile(r"final answer[ \t:*]*(?:is[ \t:*]*)?(.+)", re.IGNORECASE),
+    re.compile(r"the answer is[ \t:*]*(.+)", re.IGNORECASE),
+]
+_FENCE = re.compile(r"^\W*(```|~~~)")
+_stats_lock = threading.Lock()
+
+
+# The stated final answer, normalized, or None when the advice does not state one. A code
+# fence (and its language) is not an answer, nor is a line of punctuation.
+def extract_answer(text):
+    for pattern in _ANSWER_PATTERNS:
+        for match in reversed(pattern.findall(text)):
+            if _FENCE.match(match):
+                continue
+            answer = re.sub(r"[*_`$]", "", match).strip().rstrip(".").strip().lower()
+            if re.search(r"\w", answer) and len(answer) <= 200:
+                return answer
+    return None
+
+
+# The advice's code blocks as written, or None without code
+def code_blocks(text):
+    return "\n".join(_CODE_BLOCK.findall(text)) or None
+
+
+# The advice's code with comments, blank lines and spacing removed, or None without code
+def normalized_code(text):
+    blocks = _CODE_BLOCK.findall(text)
+    if not blocks:
+        return None
+    lines = []
+    for block in blocks:
+        for line in block.splitlines():
+            line = re.sub(r"(#|//).*$", "", line)
+            line = re.sub(r"\s+", "", line)
+            if line:
+                lines.append(line)
+    return "\n".join(lines) or None
+
+
+def _features(text):
+    words = _WORD.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+# Hashed, log-scaled, L2-normalized term vectors, one row per text
+def text_vectors(texts, size=VECTOR_SIZE):
+    rows = []
+    for text in texts:
+        counts = {}
+        for feature in _features(text):
+            index = zlib.crc32(feature.encode("utf-8")) % size
+            counts[index] = counts.get(index, 0) + 1
+        rows.append({index: 1.0 + math.log(count) for index, count in counts.items()})
+    if numpy is None:
+        vectors = []
+        for row in rows:
+            norm = math.sqrt(sum(value * value for value in row.values())) or 1.0
+            vectors.append({index: value / norm for index, value in row.items()})
+        return vectors
+    matrix = numpy.zeros((len(rows), size), dtype=numpy.float32)
+    for i, row in enumerate(rows):
+        if row:
+            matrix[i, list(row)] = list(row.values())
+    norms = numpy.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / numpy.where(norms == 0, 1.0, norms)
+
+
+# Pairwise cosine similarities as a list of lists
+def similarity_matrix(texts):
+    vectors = text_vectors(texts)
+    if numpy is not None:
+        return (vectors @ vectors.T).tolist()
+    return [[sum(value * other.get(index, 0.0) for index, value in vector.items()) for other in vectors] for vector in vectors]
+
+
+# Compare the answers ({name: text}). Returns a dict with reached (bool), agreement (share of
+# answers in the largest agreeing group), group (names), representative (name) and reason.
+def check(answers, threshold=CONSENSUS_THRESHOLD, similarity_threshold=SIMILARITY_THRESHOLD):
+    names = list(answers)
+    result = {"reached": False, "agreement": 0.0, "group": [], "representative": None, "reason": ""}
+    if len(names) < MIN_ANSWERS:
+        result["reason"] = f"only {len(names)} complete answers"
+        return result
+    texts = [answers[name] for name in names]
+    similarities = similarity_matrix(texts)
+    extracted = [extract_answer(text) for text in texts]
+    code = [normalized_code(text) for text in texts]
+
+    # Two answers with code are compared by their code, whatever final answers they state
+    def basis(i, j):
+        if code[i] is not None and code[j] is not None:
+            return "code"
+        if extracted[i] is not None and extracted[j] is not None:
+            return "final answer"
+        return "text similarity"
+
+    def agree(i, j):
+        matched_on = basis(i, j)
+        if matched_on == "code":
+            return code[i] == code[j]
+        if matched_on == "final answer":
+            return extracted[i] == extracted[j]
+        return similarities[i][j] >= similarity_threshold
+
+    # The largest group: each answer with everything that agrees with it
+    best_group, best_center = [], None
+    for i in range(len(names)):
+        group = [j for j in range(len(names)) if j == i or agree(i, j)]
+        if len(group) > len(best_group):
+            best_group, best_center = group, i
+    # Within the group, the answer most similar to the others speaks for it
+    representative = max(best_group, key=lambda i: (sum(similarities[i][j] for j in best_group), -i))
+    result.update({
+        "agreement": round(len(best_group) / len(names), 3),
+        "group": [names[i] for i in best_group],
+        "representative": names[representative],
+        "reached": len(best_group) / len(names) >= threshold,
+    })
+    matched_on = basis(best_center, next((j for j in best_group if j != best_center), best_center))
+    result["reason"] = f"{len(best_group)}/{len(names)} advisors agree ({matched_on})"
+    return result
+
+
+def _read_stats():
+    try:
+        with open(STATS_PATH, 'r', encoding='utf-8') as infile:
+            return json.load(infile)
+    except (OSError, json.JSONDecodeError):
+        return {"checks": 0, "fired": 0}
+
+
+# Count one check (and whether it fired); returns the updated totals
+def record(fired, mode):
+    with _stats_lock:
+        stats = _read_stats()
+        stats["checks"] = stats.get("checks", 0) + 1
+        if fired:
+            stats["fired"] = stats.get("fired", 0) + 1
+            stats[mode] = stats.get(mode, 0) + 1
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(STATS_PATH)), exist_ok=True)
+            with open(STATS_PATH, 'w', encoding='utf-8') as outfile:
+                json.dump(stats, outfile)
+        except OSError:
+            pass    # the counter is informational only
+        return stats
+
+
+def firing_rate():
+    stats = _read_stats()
+    return stats["fired"] / stats["checks"] if stats.get("checks") else 0.0
@@ -0,0 +1,125 @@
+import contextvars
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import tracing
+
+# Architectures declared as graphs of nodes.
+#
+# A node is a named step (a whole architecture, an advisor call, a vote, a synthesis) that
+# runs once the nodes it comes after have finished, and is handed their outputs:
+#
+#     graph = dag.Graph([
+#         dag.Node("democracy", lambda problem, inputs: the_democracy(problem)),
+#         dag.Node("duopoly", lambda problem, inputs: duopoly(problem)),
+#         dag.Node("king", lambda problem, inputs: the_king(problem, extra_advice=inputs),
+#                  after=("democracy", "duopoly"), optional=("democracy", "duopoly")),
+#     ])
+#     outputs, failed = graph.run(problem, journal=journal)
+#
+# Nodes whose dependencies are done run concurrently (up to MOI_DAG_WORKERS at a time), so
+# independent branches overlap instead of running one after the other. The provider calls
+# a node makes still go through providers.call_model, so the per-provider pacing and
+# in-flight caps of rate_limit.py hold across all nodes at once. Node outputs are memoized
+# in the run journal: a resumed run only runs the nodes that had not finished.
+#
+# A node that fails takes down the nodes that need it, unless they list it as optional;
+# those run without its output. The rest of the graph still runs.
+
+MAX_WORKERS = int(os.getenv("MOI_DAG_WORKERS", "4"))
+
+YELLOW = '\033[93m'
+NEON_GREEN = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+
+class Node:
+    def __init__(self, name, run, after=(), optional=()):
+        self.name = name
+        self.run = run                  # run(problem, inputs) -> output; inputs is {dependency name: output}
+        self.after = tuple(after)
+        self.optional = set(optional)   # dependencies the node can do without
+
+
+class Graph:
+    def __init__(self, nodes):
+        self.nodes = {}
+        for node in nodes:
+            if node.name in self.nodes:
+                raise ValueError(f"Duplicate node {node.name!r}")
+            self.nodes[node.name] = node
+        for node in nodes:
+            unknown = [name for name in node.after if name not in self.nodes]
+            if unknown:
+                raise ValueError(f"Node {node.name!r} comes after unknown node {unknown[0]!r}")
+            if not node.optional <= set(node.after):
+                raise ValueError(f"Optional dependencies of {node.name!r} must also be listed in after")
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"The graph has a cycle through node {name!r}")
+            visiting.add(name)
+            for dependency in self.nodes[name].after:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    # Nodes no other node comes after: the results of the graph
+    def sinks(self):
+        needed = {dependency for node in self.nodes.values() for dependency in node.after}
+        return [name for name in self.order if name not in needed]
+
+    def _run_node(self, node, problem, inputs):
+        with tracing.start_span(node.name, "node", after=list(node.after), inputs=list(inputs)):
+            return node.run(problem, inputs)
+
+    # Run every node; returns (outputs, failed): {name: output} and {name: reason}.
+    # on_result(name, output) is called as each node finishes.
+    def run(self, problem, journal=None, max_workers=MAX_WORKERS, on_result=None):
+        outputs = {name: output for name, output in journal.entries("node").items() if name in self.nodes} if journal else {}
+        if outputs:
+            print(f"{NEON_GREEN}♻️  Nodes restored from the run journal:{RESET_COLOR} {', '.join(outputs)}")
+        failed = {}
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dag") as executor:
+            while True:
+                # In topological order, so a failure reaches every node downstream in one pass
+                started = set(running.values())
+                for name in self.order:
+                    node = self.nodes[name]
+                    if name in outputs or name in failed or name in started:
+                        continue
+                    missing = [dependency for dependency in node.after if dependency in failed and dependency not in node.optional]
+                    if missing:
+                        failed[name] = f"needs {missing[0]}, which failed"
+                    elif all(dependency in outputs or dependency in failed for dependency in node.after):
+                        inputs = {dependency: outputs[dependency] for dependency in node.after if dependency in outputs}
+                        # In the caller's context, so settings such as model_registry.roster() carry over
+                        running[executor.submit(contextvars.copy_context().run, self._run_node, node, problem, inputs)] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        outputs[name] = future.result()
+                    except Exception as e:
+                        failed[name] = f"{type(e).__name__}: {e}"
+                        print(f"{YELLOW}⚠️  Node {name} failed: {failed[name]}{RESET_COLOR}")
+                        continue
+                    if journal:
+                        journal.record("node", name, outputs[name])
+                    if on_result:
+                        on_result(name, outputs[name])
+        return outputs, failed
@@ -1,153 +1,46 @@
-import openai
-import os
-from dotenv import load_dotenv
-import re
-import requests
-import markdown
-import webbrowser
-import tempfile
 from tqdm import tqdm
-import time
-from mistralai import Mistral
-import google.generativeai as genai
+import model_registry
+import tracing
+import run_journal
+import hedging
+import prompt_assembly
+import semantic_cache
+import vote_tally
+from providers import ProviderError, call_model
+from fanout import fan_out
+from reporting import generate_html_response
+from streaming import STREAM_OUTPUT, StreamBoard
 
 
-load_dotenv()
-
-# API keys
-openai_api_key = os.getenv("OPENAI_API_KEY")
-mistral_api_key = os.getenv("MISTRAL_API_KEY")
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-
-# Clients
-openai_client = openai.OpenAI(api_key=openai_api_key)
-mistral_client = Mistral(api_key=mistral_api_key)
-genai.configure(api_key=gemini_api_key)
-
 PINK = '\033[95m'
 CYAN = '\033[96m'
 YELLOW = '\033[93m'
 NEON_GREEN = '\033[92m'
 RESET_COLOR = '\033[0m'
 
+# Seconds a single model call may take, and seconds a whole phase (solutions or votes) may take
+MODEL_TIMEOUT = 120
+PHASE_DEADLINE = 180
+# Stop collecting ballots once the leading option can no longer be overtaken
+EARLY_VOTE_STOP = True
+# How ballots are counted: "plurality", "borda" (ranked) or "confidence" (see vote_tally.py)
+VOTE_SCHEME = "plurality"
+
 def open_file(filepath):
     with open(filepath, 'r', encoding='utf-8') as infile:
         return infile.read()
 
-def call_mistral(model_name, user_message, system_message=None):
-    messages = []
-    if system_message:
-        messages.append({"role": "system", "content": system_message})
-    messages.append({"role": "user", "content": user_message})
-    try:
-        response = mistral_client.chat.complete(
-            model=model_name,
-            messages=messages
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error calling Mistral model {model_name}: {str(e)}")
-        return f"Error: Could not get response from {model_name}"
-
-def call_gemini(model_name, user_message, system_message=None):
-    full_prompt = user_message
-    if system_message:
-        full_prompt = f"{system_message}\n\nUser query: {user_message}"
-    try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(full_prompt)
-        return response.text.strip()
-    except Exception as e:
-        print(f"Error calling Gemini model {model_name}: {str(e)}")
-        return f"Error: Could not get response from {model_name}"
-
-def call_openai(model_name, user_message, system_message="You are a coder and problem solver expert"):
-    response = openai_client.chat.completions.create(
-        model=model_name,
-        messages=[
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": user_message}
-        ],
-        temperature=0.3
-    )
-    return response.choices[0].message.content.strip()
-
-def generate_html_response(full_response, architecture_name):
-    html_content = f'''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>✨ AI Response Report ✨</title>
-        <style>
-            body {{
-                font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif, "Apple Color Emoji", "Segoe UI Emoji", "Segoe UI Symbol";
-                background-color: #f0f2f5; /* Light grey background */
-                margin: 0;
-                padding: 20px;
-                color: #1c1e21; /* Darker grey text */
-                display: flex;
-                justify-content: center;
-                align-items: flex-start; /* Align to top if content is short */
-                min-height: 100vh;
-            }}
-            .container {{
-                background-color: #ffffff; /* White container background */
-                border-radius: 12px; /* More rounded corners */
-                padding: 30px;
-                box-shadow: 0 8px 24px rgba(0,0,0,0.1); /* Softer, more prominent shadow */
-                width: 100%;
-                max-width: 800px; /* Max width for better readability */
-                border: 1px solid #e0e0e0; /* Light border */
-            }}
-            pre {{
-                background-color: #282c34; /* Dark background for code block */
-                color: #abb2bf; /* Light text for code block */
-                border-radius: 8px; /* Rounded corners for code block */
-                padding: 20px;
-                font-family: 'Cascadia Code', 'Consolas', 'SFMono-Regular', 'Menlo', 'Courier New', monospace;
-                overflow: auto;
-                white-space: pre-wrap;
-                word-wrap: break-word;
-                font-size: 0.95em;
-                border: none; /* Remove explicit border if shadow is sufficient */
-            }}
-            h1 {{
-                color: #007bff; /* Blue accent for heading */
-                text-align: center;
-                margin-bottom: 25px;
-                font-size: 2em;
-            }}
-            p.intro {{
-                line-height: 1.6;
-                color: #4b5563; /* Slightly lighter text for intro */
-                font-size: 1.1em;
-                text-align: center;
-                margin-bottom: 20px;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>✨ AI Response Report ✨</h1>
-            <p class="intro">📄 This report presents the findings from the Mixture of Models (MOM) system, utilizing the <strong>{architecture_name}</strong> architecture.</p>
-            <pre>{full_response}</pre>
-        </div>
-    </body>
-    </html>
-    '''
-
-    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.html', encoding='utf-8') as temp_file:
-        temp_file.write(html_content)
-        webbrowser.open('file://' + temp_file.name)
-
-def the_democracy(user_message):
+def the_democracy(user_message, call_model_fn=None, model_timeout=MODEL_TIMEOUT, phase_deadline=PHASE_DEADLINE, early_vote_stop=EARLY_VOTE_STOP, vote_scheme=VOTE_SCHEME, stream=STREAM_OUTPUT, report=None, journal=None, extra_solutions=None):
     print(f"{NEON_GREEN}🏛️ --- Starting The Democracy Architecture --- 🏛️{RESET_COLOR}")
     print(f"{YELLOW}🤔 Problem to solve:{RESET_COLOR} {user_message[:200] + '...' if len(user_message) > 200 else user_message}\n")
 
-    vote_counting_system_message = "You are an impartial vote counter. You will be given a list of solutions and then a list of votes. Each vote will state which solution it is for. Count the votes accurately for each solution and clearly state which solution received the most votes and how many votes it received. If there is a tie, state the tied solutions and their vote counts. Present the winning solution text clearly."
-    general_expert_system_message = "You are a coder and problem solver expert."
+    vote_counting_system_message = "You are an impartial vote counter. You read ballots and report, for each one, which option it voted for. Answer with JSON only."
+    # Solutions and ballots are asked for with the same system message and the problem first,
+    # and every voter gets the same solution options in the same order: each model's ballot
+    # prompt starts with its own solution prompt, and the shared prefix can be served from the
+    # provider's prompt cache (see prompt_assembly.py)
+    general_expert_system_message = prompt_assembly.SHARED_SYSTEM_MESSAGE
+    problem_section = ("PROBLEM", user_message)
     
     democratic_models = [
         ("openai", "gpt-4o-mini", "GPT-4o mini (OpenAI)"),
@@ -158,86 +51,200 @@ def the_democracy(user_message):
         ("gemini", "models/gemini-1.5-pro-latest", "Gemini 1.5 Pro (Google)"),
     ]
 
-    initial_solutions = {}
-    solution_gen_tasks = [f"Generating solution from {display_name}" for _, _, display_name in democratic_models]
+    # A resumed run (see run_journal) that already has its result is done
+    if journal and journal.completed("answer") is not None:
+        final_answer = journal.completed("answer")
+        print(f"{NEON_GREEN}♻️  The Democracy had already decided in this run:{RESET_COLOR}\n{final_answer}")
+        return final_answer
+    # A near-duplicate of a problem solved before is answered from the semantic cache, or
+    # its answer is put to the vote as one more option
+    cached_answer, seed = semantic_cache.consult("democracy", user_message)
+    if cached_answer is not None:
+        return cached_answer
+    extra_solutions = {**(extra_solutions or {}), **seed}
+    # Solutions and ballots recorded by an earlier attempt of this run are reused, and their
+    # authors stay on the roster
+    display_names = {(api_type, model_name): display_name for api_type, model_name, display_name in democratic_models}
+    restored_solutions = {name: solution for name, solution in journal.entries("solution").items() if name in display_names.values()} if journal else {}
+    restored_votes = journal.entries("vote") if journal else {}
+    solutions_done = journal.completed("solutions") if journal else None
+
+    # Voters that are cooling down, failing or too slow lately sit this one out (see model_registry);
+    # at least two take part, so there is something to vote on
+    selected, dropped = model_registry.select([pair for pair, display_name in display_names.items() if display_name not in restored_solutions],
+                                              minimum=max(0, 2 - len(restored_solutions)))
+    if dropped:
+        print(f"{YELLOW}🧊 Not taking part this time:{RESET_COLOR} " + ", ".join(f"{display_names[pair]} ({reason})" for pair, reason in dropped.items()))
+    democratic_models = [(api_type, model_name, display_name) for (api_type, model_name), display_name in display_names.items()
+                         if (api_type, model_name) in selected or display_name in restored_solutions]
+    if restored_solutions:
+        print(f"{NEON_GREEN}♻️  Restored from the run journal:{RESET_COLOR} {len(restored_solutions)} solutions, {len(restored_votes)} ballots")
+
+    call_model_fn = call_model_fn or call_model
+    models_by_name = {display_name: (api_type, model_name) for api_type, model_name, display_name in democratic_models}
+
+    # Run one phase (solutions or ballots). With streaming on, every answer streams into a
+    # board of live counters. Either way, calls abandoned by a timeout or an early stop are
+    # cancelled rather than left running (and billing) in the background.
+    def run_phase(jobs, **fan_out_args):
+        if not stream:
+            return fan_out(jobs, call_model_fn, cancellable=True, **fan_out_args)
+        board = StreamBoard({display_name: display_name for display_name in jobs})
+
+        def ask(display_name, api_type, model_name, prompt, system_message, cancel_event=None):
+            return call_model_fn(api_type, model_name, prompt, system_message,
+                                 on_token=board.feeder(display_name), cancel_event=cancel_event)
+
+        try:
+            return fan_out({display_name: (display_name,) + args for display_name, args in jobs.items()}, ask,
+                           cancellable=True, **fan_out_args)
+        finally:
+            board.close()
+
     print(f"{YELLOW}💡 --- Generating Initial Solutions from Democratic Models --- 💡{RESET_COLOR}")
-    progress_bar = tqdm(solution_gen_tasks, desc="Generating Initial Solutions", unit="task", leave=False)
+    progress_bar = tqdm(total=len(democratic_models), desc="Generating Initial Solutions", unit="task", leave=False)
+    for _, _, display_name in democratic_models:
+        print(f"{CYAN}✍️  Generating solution from {display_name}...{RESET_COLOR}")
 
-    for api_type, model_name, display_name in democratic_models:
+    # All solutions are requested at once; each one is printed as soon as it arrives
+    def on_solution(display_name, solution):
         progress_bar.set_description(f"Solution from {display_name}")
         print() # Gap
-        print(f"{CYAN}✍️  Generating solution from {display_name}...{RESET_COLOR}")
-        solution = ""
-        if api_type == "openai":
-            solution = call_openai(model_name, user_message, general_expert_system_message)
-        elif api_type == "mistral":
-            solution = call_mistral(model_name, user_message, general_expert_system_message)
-        elif api_type == "gemini":
-            solution = call_gemini(model_name, user_message, general_expert_system_message)
-        initial_solutions[display_name] = solution
         print(f"{NEON_GREEN}📄 Solution from {display_name}:{RESET_COLOR}\n{solution[:300] + '...' if len(solution) > 300 else solution}")
         print() # Gap
         print(f"{PINK}------------------------------------------------------------------------------------------------{RESET_COLOR}")
         progress_bar.update()
+        if journal:
+            journal.record("solution", display_name, solution)
+
+    solution_prompt = prompt_assembly.assemble([problem_section], "Solve the PROBLEM.")
+    solution_jobs = {display_name: (api_type, model_name, solution_prompt, general_expert_system_message)
+                     for display_name, (api_type, model_name) in models_by_name.items()
+                     if display_name not in restored_solutions and solutions_done is None}
+    with tracing.start_span("solutions", models=len(solution_jobs)) as solutions_phase:
+        initial_solutions, skipped_solutions = run_phase(solution_jobs, per_call_timeout=model_timeout,
+                                                         deadline=phase_deadline, on_result=on_solution)
+        initial_solutions = {name: restored_solutions.get(name) or initial_solutions.get(name) for name in models_by_name
+                             if name in restored_solutions or name in initial_solutions}
+        solutions_phase.args["answered"] = len(initial_solutions)
     progress_bar.close()
-    print(f"\n{NEON_GREEN}✅ --- All Initial Solutions Generated --- ✅{RESET_COLOR}\n")
-
-    solution_options_str = "\n\n".join(f"Solution Option from {name}:\n{solution_text}" for name, solution_text in initial_solutions.items())
+    # Without any solution the phase is not over: resuming the run asks for them again
+    if journal and solutions_done is None and initial_solutions:
+        journal.complete("solutions", list(initial_solutions))
+    if skipped_solutions:
+        print(f"\n{YELLOW}⏭️  No solution from:{RESET_COLOR} " + ", ".join(f"{name} ({reason})" for name, reason in skipped_solutions.items()))
+    print(f"\n{NEON_GREEN}✅ --- All Initial Solutions Generated ({len(initial_solutions)}/{len(democratic_models)}) --- ✅{RESET_COLOR}\n")
+    if not initial_solutions and not extra_solutions:
+        # Nothing to vote on, so no voter is asked
+        final_answer = vote_tally.format_result(vote_tally.tally({}, {}), {}, {})
+        print(f"{YELLOW}⚠️  {final_answer}{RESET_COLOR}")
+        if report:
+            report.update(final_answer, force=True)
+        return final_answer
+
+    # Solutions from outside the roster are options too, but do not vote
+    initial_solutions.update(extra_solutions)
+    # Options get letter ids in roster order, so the same solutions always get the same ids
+    options = vote_tally.option_ids([name for name in models_by_name if name in initial_solutions] + list(extra_solutions))
+    solution_options_str = "\n\n".join(f"Option {option_id} (from {name}):\n{initial_solutions[name]}" for option_id, name in options.items())
     print(f"{YELLOW}🗳️ --- Preparing for Voting Phase --- 🗳️{RESET_COLOR}")
     print(f"{CYAN}📜 Solution options presented to voters:{RESET_COLOR}\n{solution_options_str[:500] + '...' if len(solution_options_str) > 500 else solution_options_str}\n")
     
-    voting_prompt = (f"Review the following SOLUTION OPTIONS provided by different AI advisors to address the PROBLEM. Your task is to VOTE for the single best solution option.\n\nPROBLEM:\n{user_message}\n\nSOLUTION OPTIONS:\n{solution_options_str}\n\nBased on your expert analysis, which of the above solution options (e.g., 'Solution Option from GPT-4o mini (OpenAI)') is the best? State your chosen option clearly.")
+    voting_prompt = prompt_assembly.assemble(
+        [problem_section, ("SOLUTION OPTIONS", solution_options_str)],
+        f"You are now an AI expert evaluating solutions. Review the SOLUTION OPTIONS provided by different AI advisors to address the PROBLEM. "
+        f"Your task is to VOTE for the best solution option.\n\n{vote_tally.ballot_instructions(options)}")
 
-    votes = {}
-    voting_tasks = [f"Collecting vote from {display_name}" for _, _, display_name in democratic_models]
     print(f"{YELLOW}📮 --- Collecting Votes from Democratic Models --- 📮{RESET_COLOR}")
-    progress_bar = tqdm(voting_tasks, desc="Collecting Votes", unit="task", leave=False)
-    
-    for api_type, model_name, display_name in democratic_models:
+    progress_bar = tqdm(total=len(democratic_models), desc="Collecting Votes", unit="task", leave=False)
+    for _, _, display_name in democratic_models:
+        print(f"{CYAN}🙋  Collecting vote from {display_name}...{RESET_COLOR}")
+
+    # Ballots are only recorded once the solutions are final, so restored ones are still valid
+    ballots = {name: vote_tally.parse_ballot(vote, options) for name, vote in restored_votes.items() if name in models_by_name}
+
+    def on_vote(display_name, vote):
+        ballots[display_name] = vote_tally.parse_ballot(vote, options)
         progress_bar.set_description(f"Vote from {display_name}")
         print() # Gap
-        print(f"{CYAN}🙋  Collecting vote from {display_name}...{RESET_COLOR}")
-        vote = ""
-        voter_system_prompt = "You are an AI expert evaluating solutions. Pick the best one from the options provided."
-        if api_type == "openai":
-            vote = call_openai(model_name, voting_prompt, voter_system_prompt)
-        elif api_type == "mistral":
-            vote = call_mistral(model_name, voting_prompt, voter_system_prompt)
-        elif api_type == "gemini":
-            vote = call_gemini(model_name, voting_prompt, voter_system_prompt) 
-        votes[display_name] = vote
         print(f"{NEON_GREEN}👍 Vote from {display_name}:{RESET_COLOR}\n{vote[:300] + '...' if len(vote) > 300 else vote}")
         print() # Gap
         print(f"{PINK}------------------------------------------------------------------------------------------------{RESET_COLOR}")
         progress_bar.update()
+        if journal:
+            journal.record("vote", display_name, vote)
+
+    def vote_decided(votes_so_far, pending_voters):
+        return early_vote_stop and vote_tally.is_decided(list(ballots.values()), len(pending_voters), options, vote_scheme)
+
+    vote_jobs = {display_name: (api_type, model_name, voting_prompt, general_expert_system_message)
+                 for display_name, (api_type, model_name) in models_by_name.items() if display_name not in ballots}
+    if vote_decided(ballots, vote_jobs) or (journal and journal.completed("votes")):
+        vote_jobs = {}
+    with tracing.start_span("votes", voters=len(vote_jobs)) as votes_phase:
+        votes, skipped_votes = run_phase(vote_jobs, per_call_timeout=model_timeout,
+                                         deadline=phase_deadline, on_result=on_vote, stop_when=vote_decided)
+        votes = {**{name: vote for name, vote in restored_votes.items() if name in models_by_name}, **votes}
+        votes_phase.args["counted"] = len(votes)
     progress_bar.close()
-    print(f"\n{NEON_GREEN}✅ --- All Votes Collected --- ✅{RESET_COLOR}\n")
+    if journal and not journal.completed("votes"):
+        journal.complete("votes")
+    if skipped_votes:
+        print(f"\n{YELLOW}⏭️  Ballots not counted:{RESET_COLOR} " + ", ".join(f"{name} ({reason})" for name, reason in skipped_votes.items()))
+    print(f"\n{NEON_GREEN}✅ --- All Votes Collected ({len(votes)}/{len(democratic_models)}) --- ✅{RESET_COLOR}\n")
+
+    print(f"{YELLOW}📊 --- Counting Votes ({vote_scheme}) --- 📊{RESET_COLOR}")
+    count_phase = tracing.start_span("count", scheme=vote_scheme)
+    ballots = {voter: ballots.get(voter) for voter in votes}
+    unparsed_votes = {voter: votes[voter] for voter, ballot in ballots.items() if ballot is None}
 
-    all_votes_str = "\n\n".join(f"Vote from {voter_name}:\n{vote_text}" for voter_name, vote_text in votes.items())
-    print(f"{YELLOW}📊 --- Counting Votes --- 📊{RESET_COLOR}")
-    print(f"{CYAN}📜 All votes cast:{RESET_COLOR}\n{all_votes_str[:500] + '...' if len(all_votes_str) > 500 else all_votes_str}\n")
-    
     vote_counter_model_type = "openai"
     vote_counter_model_name = "gpt-4o" 
 
-    progress_bar = tqdm(total=1, desc=f"🗣️ Counting Votes with {vote_counter_model_name}", unit="task", leave=True) # leave=True for final bar
-    
-    final_count_prompt = (f"The following solutions were proposed for the problem: '{user_message}'.\\n\\nPROPOSED SOLUTIONS:\\n{solution_options_str}\\n\\nSubsequently, AI advisors cast their votes for the best solution. Here are their votes:\\n\\nVOTES CAST:\\n{all_votes_str}\\n\\nBased on these votes, please determine which solution received the most votes. Clearly state the winning solution's text and the number of votes it received. If there is a tie, list all tied solutions and their vote counts.")
-    
-    final_answer = ""
-    if vote_counter_model_type == "openai":
-        final_answer = call_openai(vote_counter_model_name, final_count_prompt, vote_counting_system_message)
-    elif vote_counter_model_type == "mistral":
-        final_answer = call_mistral(vote_counter_model_name, final_count_prompt, vote_counting_system_message)
-    elif vote_counter_model_type == "gemini":
-        final_answer = call_gemini(vote_counter_model_name, final_count_prompt, vote_counting_system_message)
-
-    progress_bar.update()
-    progress_bar.close()
+    # Ballots that are not valid JSON and do not name a single option are read by the vote
+    # counter model; it is only sent the option names and those ballots, not the solutions
+    if unparsed_votes:
+        print(f"{CYAN}🔎 Asking {vote_counter_model_name} to read {len(unparsed_votes)} unparseable ballot(s): {', '.join(unparsed_votes)}{RESET_COLOR}")
+        try:
+            repair_answer = hedging.call(call_model_fn, vote_counter_model_type, vote_counter_model_name,
+                                         vote_tally.repair_prompt(unparsed_votes, options), vote_counting_system_message)
+            ballots.update(vote_tally.apply_repair(repair_answer, unparsed_votes, options))
+        except ProviderError as e:
+            print(f"{YELLOW}⚠️  Could not read the unparseable ballots, they are not counted: {e}{RESET_COLOR}")
+
+    result = vote_tally.tally(ballots, options, vote_scheme)
+    final_answer = vote_tally.format_result(result, options, initial_solutions)
+    count_phase.end(winner=result["winner"], counted=result["counted"], invalid=len(result["invalid"]), llm_fallback=bool(unparsed_votes),
+                    no_valid_ballots=result["fallback"])
+
     print(f"\n{NEON_GREEN}🏆 --- Final Result from The Democracy --- 🏆{RESET_COLOR}")
     print(f"{YELLOW}🌟 Winning Solution/Outcome:{RESET_COLOR}\n{final_answer}")
+    if report:
+        report.update(final_answer, force=True)
+    if journal:
+        journal.complete("answer", final_answer)
+    # Only an elected solution is worth remembering
+    if result["winner"] is not None and not result["fallback"]:
+        semantic_cache.store("democracy", user_message, final_answer)
     return final_answer
 
-question = open_file("problem.txt")
-html_response1 = the_democracy(question)
-generate_html_response(html_response1, "Democracy")
+# Solve the problem in problem_path, streaming to the console and a live HTML report.
+# Intermediate results go to a run journal; pass the run_id of a failed run to resume it.
+def main(problem_path="problem.txt", stream=STREAM_OUTPUT, run_id=None):
+    question = open_file(problem_path)
+    journal = run_journal.open_run("democracy", question, run_id)
+    report_id = journal.run_id if journal else None
+    live_report = generate_html_response("⏳ The models are proposing and voting on solutions...", "Democracy", live=True, run_id=report_id) if stream else None
+    with tracing.start_span("Democracy", "run"):
+        html_response1 = the_democracy(question, stream=stream, report=live_report, journal=journal)
+    if live_report:
+        live_report.finish(html_response1)
+    else:
+        generate_html_response(html_response1, "Democracy", run_id=report_id)
+    tracing.finish_run("democracy")
+    return html_response1
+
+# Importing the module only defines the architecture; run it with `python moi.py democracy`
+# or as a script
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import re
+
+import consensus
+from prompt_budget import truncate_by_relevance
+
+# Multi-turn context for the Duopoly's oracles.
+#
+# Each oracle sees the discussion as a proper conversation: the opening (problem and
+# advisors' insights) as the first user message, its own replies as assistant messages,
+# and the other oracle's replies and any late notes as user messages. Only the last
+# MOI_DISCUSSION_WINDOW turns are kept verbatim; when more accumulate, the oldest are
+# folded into a rolling summary carried in the first message (by MOI_COMPACTION_MODEL when
+# set, otherwise by keeping their most relevant paragraphs), so every turn's prompt stays
+# bounded however long the discussion runs.
+#
+# Folding happens in blocks of half the window, and between folds every turn only appends
+# to the previous prompt. The unchanged prefix is what providers with prompt caching
+# (OpenAI caches prompt prefixes automatically) bill and process as cached tokens.
+#
+#     discussion = Discussion(["Oracle A", "Oracle B"], opening, problem)
+#     answer = call_model(api_type, model, discussion.messages_for("Oracle A"), system_message)
+#     discussion.add("Oracle A", answer)
+#     discussion.convergence()       # why the last two replies agree, or None
+#
+# The discussion has converged when the latest reply ends with an explicit AGREE line
+# (AGREE_INSTRUCTION asks for it), or when it and the reply before it state the same final
+# answer (and, when they contain code, at least MOI_DISCUSSION_CONVERGENCE similar code),
+# contain the same code, or are at least MOI_DISCUSSION_CONVERGENCE similar.
+
+DISCUSSION_WINDOW = int(os.getenv("MOI_DISCUSSION_WINDOW", "6"))
+SUMMARY_TOKENS = int(os.getenv("MOI_DISCUSSION_SUMMARY_TOKENS", "800"))
+CONVERGENCE_SIMILARITY = float(os.getenv("MOI_DISCUSSION_CONVERGENCE", "0.85"))
+
+YELLOW = '\033[93m'
+RESET_COLOR = '\033[0m'
+
+AGREE_INSTRUCTION = ("When you fully agree with the other expert's latest proposal and have nothing left to add, "
+                     "say so briefly and end your reply with a line containing only: AGREE")
+_AGREE = re.compile(r"^\W*AGREE\W*$")
+
+
+def signals_agreement(text):
+    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+    return bool(lines) and _AGREE.match(lines[-1]) is not None
+
+
+class Discussion:
+    def __init__(self, speakers, opening, query, summarize=None, window=DISCUSSION_WINDOW, summary_tokens=SUMMARY_TOKENS):
+        self.speakers = list(speakers)
+        self.opening = opening
+        self.query = query                  # what the summary keeps relevant paragraphs for
+        self.summarize = summarize          # summarize(text, max_tokens), see prompt_budget.model_summarizer
+        self.window = max(2, window)
+        self.summary_tokens = summary_tokens
+        self.summary = ""
+        self.events = []                    # (speaker, text) turns and (None, text) notes not yet summarized
+        self.folded_turns = 0
+        self.last_turns = []                # the two latest (speaker, text) turns, summarized or not
+
+    # Information for every speaker, delivered with their next prompt
+    def note(self, text):
+        self.events.append((None, text))
+
+    def add(self, speaker, text):
+        self.events.append((speaker, text))
+        self.last_turns = (self.last_turns + [(speaker, text)])[-2:]
+        turns = sum(1 for who, _ in self.events if who is not None)
+        if turns > self.window:
+            self._fold(turns - self.window // 2)
+
+    # Fold the oldest `turns` turns (and the notes among them) into the summary
+    def _fold(self, turns):
+        folded = [self.summary] if self.summary else []
+        while turns:
+            who, text = self.events.pop(0)
+            folded.append(text if who is None else f"{who} said: {text}")
+            turns -= who is not None
+            self.folded_turns += who is not None
+        text = "\n\n".join(folded)
+        if self.summarize is not None:
+            from providers import ProviderError
+            try:
+                self.summary = self.summarize(text, self.summary_tokens)
+                return
+            except ProviderError as e:
+                print(f"{YELLOW}⚠️  Could not summarize the earlier discussion ({e}), keeping its most relevant paragraphs instead{RESET_COLOR}")
+        self.summary = truncate_by_relevance(text, self.query, self.summary_tokens)
+
+    # Why the two latest replies show the speakers have converged, or None
+    def convergence(self, similarity=CONVERGENCE_SIMILARITY):
+        if len(self.last_turns) < 2 or self.last_turns[0][0] == self.last_turns[1][0]:
+            return None
+        (_, earlier), (speaker, latest) = self.last_turns
+        if signals_agreement(latest):
+            return f"{speaker} agreed"
+        earlier_code = consensus.normalized_code(earlier)
+        if earlier_code is not None and earlier_code == consensus.normalized_code(latest):
+            return "both propose the same code"
+        score = consensus.similarity_matrix([earlier, latest])[0][1]
+        earlier_answer, latest_answer = consensus.extract_answer(earlier), consensus.extract_answer(latest)
+        if earlier_answer is not None and earlier_answer == latest_answer:
+            # Replies with code only agree when the code does too, not just the stated answer
+            earlier_blocks, latest_blocks = consensus.code_blocks(earlier), consensus.code_blocks(latest)
+            if earlier_blocks is None and latest_blocks is None:
+                return f"both state the final answer {latest_answer!r}"
+            code_score = consensus.similarity_matrix([earlier_blocks, latest_blocks])[0][1] if earlier_blocks and latest_blocks else score
+            if code_score >= similarity:
+                return f"both state the final answer {latest_answer!r} with {code_score:.0%} similar code"
+        if score >= similarity:
+            return f"the last two replies are {score:.0%} similar"
+        return None
+
+    # The conversation as seen by speaker: a list of {"role", "content"} messages ending
+    # with a user message, ready for providers.call_model
+    def messages_for(self, speaker):
+        opening = self.opening
+        if self.summary:
+            opening += f"\n\nSUMMARY OF THE EARLIER DISCUSSION ({self.folded_turns} turns):\n{self.summary}"
+        messages = [{"role": "user", "content": opening}]
+        for who, text in self.events:
+            role = "assistant" if who == speaker else "user"
+            content = text if who is None or who == speaker else f"{who} said: {text}"
+            if messages[-1]["role"] == role:
+                messages[-1]["content"] += "\n\n" + content
+            else:
+                messages.append({"role": role, "content": content})
+        return messages
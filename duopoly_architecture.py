@@ -1,28 +1,20 @@
-import openai
+import functools
 import os
-from dotenv import load_dotenv
-import re
-import requests
-import markdown
-import webbrowser
-import tempfile
-from tqdm import tqdm
 import time
-from mistralai import Mistral
-import google.generativeai as genai
-
-
-load_dotenv()
-
-# API keys
-openai_api_key = os.getenv("OPENAI_API_KEY")
-mistral_api_key = os.getenv("MISTRAL_API_KEY")
-gemini_api_key = os.getenv("GEMINI_API_KEY")
+from tqdm import tqdm
+import model_registry
+import tracing
+import run_journal
+import hedging
+import prompt_assembly
+import semantic_cache
+from providers import ProviderError, call_model
+from fanout import BackgroundFanOut
+from reporting import generate_html_response
+from streaming import STREAM_OUTPUT, ConsoleStream
+from prompt_budget import DEFAULT_FINAL_BUDGET, fit_sections, summarizer_from_env
+from discussion import AGREE_INSTRUCTION, Discussion
 
-# Clients
-openai_client = openai.OpenAI(api_key=openai_api_key)
-mistral_client = Mistral(api_key=mistral_api_key)
-genai.configure(api_key=gemini_api_key)
 
 # Colors (unused in HTML output, kept for possible console outputs or further expansions)
 PINK = '\033[95m'
@@ -31,52 +23,39 @@ YELLOW = '\033[93m'
 NEON_GREEN = '\033[92m'
 RESET_COLOR = '\033[0m'
 
+# The oracle discussion starts as soon as this many advisors have answered; later answers
+# are folded into later turns. Advisors still silent after ADVISOR_TIMEOUT seconds are dropped.
+ADVISOR_QUORUM = 2
+ADVISOR_TIMEOUT = 120
+
+# The discussion stops as soon as the oracles converge (an explicit AGREE, the same final
+# answer or code, or near-identical replies; see Discussion.convergence), after at most
+# MOI_DUOPOLY_MAX_EXCHANGES exchanges of two turns, or when MOI_DUOPOLY_BUDGET seconds have
+# passed since it started. MOI_DUOPOLY_EARLY_STOP=0 always runs every exchange.
+MAX_EXCHANGES = int(os.getenv("MOI_DUOPOLY_MAX_EXCHANGES", "3"))
+DISCUSSION_BUDGET = float(os.getenv("MOI_DUOPOLY_BUDGET", "600"))
+EARLY_STOP = os.getenv("MOI_DUOPOLY_EARLY_STOP", "1").lower() not in ("0", "false", "no", "off")
+
 # Function to open a file and return its contents as a string
 def open_file(filepath):
     with open(filepath, 'r', encoding='utf-8') as infile:
         return infile.read()
 
-def call_mistral(model_name, user_message, system_message=None):
-    messages = []
-    if system_message:
-        messages.append({"role": "system", "content": system_message})
-    messages.append({"role": "user", "content": user_message})
-    try:
-        response = mistral_client.chat.complete(
-            model=model_name,
-            messages=messages
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error calling Mistral model {model_name}: {str(e)}")
-        return f"Error: Could not get response from {model_name}"
+def duopoly(user_message, call_model_fn=None, stream=STREAM_OUTPUT, report=None, advisor_quorum=ADVISOR_QUORUM, advisor_timeout=ADVISOR_TIMEOUT, prompt_budget=DEFAULT_FINAL_BUDGET, journal=None,
+            max_exchanges=MAX_EXCHANGES, discussion_budget=DISCUSSION_BUDGET, early_stop=EARLY_STOP, extra_advice=None):
+    call_model_fn = call_model_fn or call_model
 
-def call_gemini(model_name, user_message, system_message=None):
-    # Gemini API typically takes system instruction differently or as part of the first user message
-    # For simplicity, we prepend system message to user message if provided.
-    full_prompt = user_message
-    if system_message:
-        full_prompt = f"{system_message}\n\n{user_message}"
-    try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(full_prompt)
-        return response.text.strip()
-    except Exception as e:
-        print(f"Error calling Gemini model {model_name}: {str(e)}")
-        return f"Error: Could not get response from {model_name}"
+    # Ask a model, streaming its answer to the console in the given color when streaming is on.
+    # hedge=True marks a call on the critical path, hedged when MOI_HEDGE is on.
+    def ask(model_type, model_name, prompt, system_message=None, color="", also=None, hedge=False):
+        call = functools.partial(hedging.call, call_model_fn) if hedge else call_model_fn
+        if not stream:
+            return call(model_type, model_name, prompt, system_message)
+        console = ConsoleStream(color=color, also=also)
+        answer = call(model_type, model_name, prompt, system_message, on_token=console)
+        console.end()
+        return answer
 
-def call_openai(model_name, user_message, system_message="You are a coder and problem solver expert"):
-    response = openai_client.chat.completions.create(
-        model=model_name,
-        messages=[
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": user_message}
-        ],
-        temperature=0.3
-    )
-    return response.choices[0].message.content.strip()
-
-def duopoly(user_message):
     print(f"{NEON_GREEN}👑 --- Starting The Duopoly Architecture --- 👑{RESET_COLOR}")
     print(f"{YELLOW}🤔 Problem to solve:{RESET_COLOR} {user_message[:200] + '...' if len(user_message) > 200 else user_message}\n")
 
@@ -98,8 +77,12 @@ def duopoly(user_message):
     summarizer_model_name = "gpt-4-turbo"
     summarizer_display_name = "Summarizer GPT-4 Turbo"
 
-    system_message_oracle1 = (f"You are {oracle1_display_name}, a wise and knowledgeable coder and problem solver expert. Discuss and push back at {oracle2_display_name}, challenge their suggestions, and evaluate the best solutions based on context from other advisors and the problem: {user_message}")
-    system_message_oracle2 = (f"You are {oracle2_display_name}, a wise and knowledgeable coder and problem solver expert. Discuss and push back at {oracle1_display_name}, challenge their suggestions, and evaluate the best solutions based on context from other advisors and the problem: {user_message}")
+    # The problem is stated once, at the start of the discussion (see discussion_start_prompt)
+    system_message_oracle1 = (f"You are {oracle1_display_name}, a wise and knowledgeable coder and problem solver expert. Discuss and push back at {oracle2_display_name}, challenge their suggestions, and evaluate the best solutions based on context from other advisors and the PROBLEM.")
+    system_message_oracle2 = (f"You are {oracle2_display_name}, a wise and knowledgeable coder and problem solver expert. Discuss and push back at {oracle1_display_name}, challenge their suggestions, and evaluate the best solutions based on context from other advisors and the PROBLEM.")
+    if early_stop:
+        system_message_oracle1 += f" {AGREE_INSTRUCTION}"
+        system_message_oracle2 += f" {AGREE_INSTRUCTION}"
     system_message_summarizer = ("You are an expert at looking at a conversation between two smart oracles and extracting the best answer to a problem from the conversation.")
     
     print(f"{CYAN}🛠️  Setting up Oracles and Summarizer...{RESET_COLOR}")
@@ -116,187 +99,237 @@ def duopoly(user_message):
         "models/gemini-1.5-flash-latest": ("gemini", "Gemini 1.5 Flash (Google)"),
         # Add a few more diverse advisors if desired
     }
+    # A resumed run (see run_journal) that already has its answer is done
+    if journal and journal.completed("answer") is not None:
+        final_response = journal.completed("answer")
+        print(f"{NEON_GREEN}♻️  The Duopoly had already answered in this run:{RESET_COLOR}\n{final_response}")
+        return final_response
+    # A near-duplicate of a problem solved before is answered, or advised, from the semantic cache
+    cached_answer, seed = semantic_cache.consult("duopoly", user_message)
+    if cached_answer is not None:
+        return cached_answer
+    extra_advice = {**(extra_advice or {}), **seed}
+    # Advice and turns recorded by an earlier attempt of this run are replayed, not asked for again
+    restored_advice = {}
+    if journal:
+        display_names = {display_name for api_type, display_name in advisor_models.values()}
+        restored_advice = {name: advice for name, advice in journal.entries("advice").items() if name in display_names}
+    recorded_turns = journal.entries("turn") if journal else {}
+
+    # Advisors that are cooling down, failing or too slow lately sit this one out (see model_registry)
+    selected, dropped = model_registry.select([(api_type, model_key) for model_key, (api_type, display_name) in advisor_models.items() if display_name not in restored_advice])
+    if dropped:
+        print(f"{YELLOW}🧊 Not consulted this time:{RESET_COLOR} " + ", ".join(f"{advisor_models[model_key][1]} ({reason})" for (_, model_key), reason in dropped.items()))
+    advisor_models = {model_key: advisor_models[model_key] for _, model_key in selected}
     initial_answers = {}
-    tasks = [f"Consulting {name_tuple[1]}" for model_key, name_tuple in advisor_models.items()]
     print(f"{YELLOW}🤝 --- Gathering Initial Insights from Advisors --- 🤝{RESET_COLOR}")
-    progress_bar = tqdm(tasks, desc="Gathering initial insights", unit="task", leave=False)
-
+    if restored_advice:
+        print(f"{NEON_GREEN}♻️  Restored advice from the run journal:{RESET_COLOR} {', '.join(restored_advice)}")
     for model_key, (api_type, display_name) in advisor_models.items():
-        progress_bar.set_description(f"Consulting {display_name}")
-        print() # Gap before advisor name
         print(f"{CYAN}🗣️  Consulting Advisor: {display_name}...{RESET_COLOR}")
-        advice = ""
-        if api_type == "openai":
-            advice = call_openai(model_key, user_message)
-        elif api_type == "mistral":
-            advice = call_mistral(model_key, user_message)
-        elif api_type == "gemini":
-            advice = call_gemini(model_key, user_message)
-        initial_answers[display_name] = advice
-        print(f"{NEON_GREEN}💡 Advice from {display_name}:{RESET_COLOR}\n{advice[:300] + '...' if len(advice) > 300 else advice}")
-        print() # Gap after advice
-        print(f"{PINK}------------------------------------------------------------------------------------------------{RESET_COLOR}")
-        progress_bar.update()  
+
+    # Advisors run in the background; the discussion starts once a quorum of them has answered
+    advisors = BackgroundFanOut({model_key: (api_type, model_key, user_message) for model_key, (api_type, display_name) in advisor_models.items()},
+                                call_model_fn, per_call_timeout=advisor_timeout, cancellable=True)
+    # Restored and extra advice not yet folded into the discussion
+    prior_advice = {**restored_advice, **extra_advice}
+    unheard = dict(prior_advice)
+    if extra_advice:
+        print(f"{NEON_GREEN}📨 Advice from earlier stages:{RESET_COLOR} {', '.join(extra_advice)}")
+
+    # Collect (and print) the advisor answers that arrived since the last check
+    def collect_insights():
+        new_insights = dict(unheard)
+        unheard.clear()
+        for model_key, advice in advisors.take_new().items():
+            display_name = advisor_models[model_key][1]
+            new_insights[display_name] = advice
+            if journal:
+                journal.record("advice", display_name, advice)
+            print() # Gap before advice
+            print(f"{NEON_GREEN}💡 Advice from {display_name}:{RESET_COLOR}\n{advice[:300] + '...' if len(advice) > 300 else advice}")
+            print() # Gap after advice
+            print(f"{PINK}------------------------------------------------------------------------------------------------{RESET_COLOR}")
+        initial_answers.update(new_insights)
+        return new_insights
+
+    quorum_phase = tracing.start_span("advisor quorum", advisors=len(advisor_models))
+    quorum = min(advisor_quorum, len(advisor_models))
+    progress_bar = tqdm(total=quorum, desc="Waiting for an advisor quorum", unit="task", leave=False)
+    quorum_names = journal.completed("quorum") if journal else None
+    if quorum_names is not None:
+        # The discussion had already started: it starts from the same insights again
+        initial_answers.update({name: unheard.pop(name) for name in quorum_names if name in unheard})
+    else:
+        progress_bar.update(len(collect_insights()))
+        while len(initial_answers) < quorum and advisors.pending():
+            advisors.wait_for(len(initial_answers) - len(prior_advice) + 1)
+            progress_bar.update(len(collect_insights()))
+        if journal:
+            journal.complete("quorum", list(initial_answers))
     progress_bar.close()
-    print(f"\n{NEON_GREEN}✅ --- Initial Advisor Insights Gathered --- ✅{RESET_COLOR}\n")
+    quorum_phase.end(answered=len(initial_answers))
+    print(f"\n{NEON_GREEN}✅ --- {len(initial_answers)}/{len(advisor_models)} Advisor Insights Gathered, Starting the Discussion --- ✅{RESET_COLOR}\n")
         
     advisor_insights_str = "\n\n".join(f"{name}'s advice: {advice}" for name, advice in initial_answers.items())
     
     print(f"{YELLOW}💬 --- Starting Oracle Discussion --- 💬{RESET_COLOR}")
-    # Initial prompt for the discussion
-    discussion_start_prompt = (f"ADVISORS' INSIGHTS:\n{advisor_insights_str}\n\nHello {oracle1_display_name} and {oracle2_display_name}. Let's discuss and find a solution to the PROBLEM while challenging each other and taking the ADVISORS' INSIGHTS into consideration. Solve the PROBLEM: {user_message}")
+    # Initial prompt for the discussion: the problem first, then the insights, so every turn of
+    # an oracle starts with the same prefix (see prompt_assembly.py)
+    discussion_start_prompt = prompt_assembly.assemble(
+        [("PROBLEM", user_message), ("ADVISORS' INSIGHTS", advisor_insights_str)],
+        f"Hello {oracle1_display_name} and {oracle2_display_name}. Let's discuss and find a solution to the PROBLEM while challenging each other and taking the ADVISORS' INSIGHTS into consideration.")
     
-    # Let Oracle 1 (e.g. OpenAI) start the conversation based on the initial prompt for Oracle 2
-    # Oracle 2 will then respond to Oracle 1
-    current_message_for_oracle2 = discussion_start_prompt
+    # Let Oracle 1 (e.g. OpenAI) start the conversation based on the initial prompt; Oracle 2 then responds to Oracle 1
     conversation_history.append(f"System: The problem to solve is: {user_message}. Initial insights have been gathered. The discussion begins.")
     conversation_history.append(f"System to {oracle2_display_name}: {discussion_start_prompt}")
     print(f"{CYAN}📜 Initial prompt for {oracle2_display_name} (and for {oracle1_display_name} to start):{RESET_COLOR}\n{discussion_start_prompt[:300]+'...'}\n")
 
-    # Number of turns for the discussion (e.g., 3 exchanges = 6 messages total)
-    num_exchanges = 3 
+    # Each oracle keeps its own multi-turn view of the discussion, with older turns folded into
+    # a rolling summary (see discussion.py): a turn only appends the other oracle's reply to
+    # the previous prompt, so prompt size stays flat and cached prefixes are reused
+    discussion = Discussion([oracle1_display_name, oracle2_display_name], discussion_start_prompt, user_message,
+                            summarize=summarizer_from_env(call_model_fn))
+    oracles = [
+        (oracle1_model_type, oracle1_model_name, oracle1_display_name, system_message_oracle1, YELLOW),
+        (oracle2_model_type, oracle2_model_name, oracle2_display_name, system_message_oracle2, CYAN),
+    ]
 
-    discussion_progress_bar = tqdm(range(num_exchanges * 2), desc="Oracle Discussion", unit="turn", leave=False)
+    # At most max_exchanges exchanges (3 exchanges = 6 messages total)
+    discussion_phase = tracing.start_span("discussion", max_turns=max_exchanges * 2)
+    discussion_progress_bar = tqdm(range(max_exchanges * 2), desc="Oracle Discussion", unit="turn", leave=False)
+    discussion_started = time.monotonic()
+    # Set when an oracle fails even after retries; the discussion then ends early and the
+    # summarizer works from the transcript so far
+    end_reason = None
+    # Set when the oracles agree or the time budget runs out
+    stop_reason = None
 
-    for i in range(num_exchanges * 2):
-        turn_context = "\n".join(conversation_history)
-        
-        if i % 2 == 0:  # Oracle 1's turn (e.g., OpenAI)
-            print() # Gap
-            discussion_progress_bar.set_description(f"🗣️ {oracle1_display_name} is thinking...")
-            # Oracle 1 uses the message intended for Oracle 2 as its input, plus its own system prompt
-            response_oracle1 = ""
-            if oracle1_model_type == "openai":
-                response_oracle1 = call_openai(oracle1_model_name, current_message_for_oracle2, system_message_oracle1)
-            elif oracle1_model_type == "mistral":
-                response_oracle1 = call_mistral(oracle1_model_name, current_message_for_oracle2, system_message_oracle1)
-            elif oracle1_model_type == "gemini":
-                response_oracle1 = call_gemini(oracle1_model_name, current_message_for_oracle2, system_message_oracle1)
-            
-            message_from_oracle1 = f"{oracle1_display_name} said: {response_oracle1}"
-            print(f"{YELLOW}💬 {message_from_oracle1}{RESET_COLOR}")
-            print() # Gap after message
-            print(f"{PINK}------------------------------------------------------------------------------------------------{RESET_COLOR}")
-            conversation_history.append(message_from_oracle1)
-            current_message_for_oracle1 = response_oracle1 # Next input for Oracle 2 will be this response
-        else:  # Oracle 2's turn (e.g., Mistral/Gemini)
-            print() # Gap
-            discussion_progress_bar.set_description(f"🗣️ {oracle2_display_name} is thinking...")
-            # Oracle 2 responds to what Oracle 1 just said
-            response_oracle2 = ""
-            prompt_for_oracle2 = f"{oracle1_display_name} previously said: {current_message_for_oracle1}\n\nNow, {oracle2_display_name}, please respond considering the ongoing discussion, the initial advisors' insights, and the problem."
-            if oracle2_model_type == "openai":
-                response_oracle2 = call_openai(oracle2_model_name, prompt_for_oracle2, system_message_oracle2)
-            elif oracle2_model_type == "mistral":
-                response_oracle2 = call_mistral(oracle2_model_name, prompt_for_oracle2, system_message_oracle2)
-            elif oracle2_model_type == "gemini":
-                response_oracle2 = call_gemini(oracle2_model_name, prompt_for_oracle2, system_message_oracle2)
+    for i in range(max_exchanges * 2):
+        model_type, model_name, display_name, system_message, color = oracles[i % 2]
+        recorded_turn = recorded_turns.get(str(i))
+
+        # Advisors that answered after the discussion started are folded into this turn
+        if recorded_turn is not None:
+            late_insights = {name: unheard.pop(name) for name in recorded_turn["insights"] if name in unheard}
+            initial_answers.update(late_insights)
+        else:
+            late_insights = collect_insights()
+        if late_insights:
+            late_insights_str = "\n\n".join(f"{name}'s advice: {advice}" for name, advice in late_insights.items())
+            late_insights_note = f"LATE ADVISORS' INSIGHTS (just arrived):\n{late_insights_str}"
+            conversation_history.append(f"System: {late_insights_note}")
+            discussion.note(late_insights_note)
 
-            message_from_oracle2 = f"{oracle2_display_name} said: {response_oracle2}"
-            print(f"{CYAN}💬 {message_from_oracle2}{RESET_COLOR}")
+        if recorded_turn is not None:
+            # Replayed from the run journal: the same transcript, without calling the oracle
+            response = recorded_turn["response"]
+            print(f"{NEON_GREEN}♻️  Turn {i + 1} restored from the run journal{RESET_COLOR}")
+        # The first exchange always happens, so the summarizer has both oracles' views
+        elif i >= 2 and discussion_budget and time.monotonic() - discussion_started >= discussion_budget:
+            stop_reason = f"the {discussion_budget:g}s discussion budget ran out"
+            break
+        else:
+            print() # Gap
+            discussion_progress_bar.set_description(f"🗣️ {display_name} is thinking...")
+            if stream:
+                print(f"{color}💬 {display_name} said: {RESET_COLOR}", end="")
+            try:
+                response = ask(model_type, model_name, discussion.messages_for(display_name), system_message, color=color)
+            except ProviderError as e:
+                end_reason = str(e)
+                break
+            if not stream:
+                print(f"{color}💬 {display_name} said: {response}{RESET_COLOR}")
             print() # Gap after message
             print(f"{PINK}------------------------------------------------------------------------------------------------{RESET_COLOR}")
-            conversation_history.append(message_from_oracle2)
-            current_message_for_oracle2 = response_oracle2 # Next input for Oracle 1 will be this response
+            if journal:
+                journal.record("turn", str(i), {"insights": list(late_insights), "response": response})
 
+        conversation_history.append(f"{display_name} said: {response}")
+        discussion.add(display_name, response)
         discussion_progress_bar.update()
-        time.sleep(0.5) # Small delay
+        # Converged: further turns would only repeat the agreement, go straight to the summarizer
+        agreement = discussion.convergence() if early_stop else None
+        if agreement and i + 1 < max_exchanges * 2:
+            stop_reason = f"the oracles converged, {agreement}"
+            break
     discussion_progress_bar.close()
+    discussion_phase.end(turns=discussion_progress_bar.n, ended_early=end_reason is not None, stop_reason=stop_reason,
+                         summarized_turns=discussion.folded_turns)
+    if end_reason:
+        print(f"\n{YELLOW}⚠️  Discussion ended early, an oracle is unavailable: {end_reason}{RESET_COLOR}")
+        conversation_history.append(f"System: The discussion ended early because an oracle was unavailable ({end_reason}).")
+    elif stop_reason:
+        print(f"\n{NEON_GREEN}🤝 Discussion stopped after {discussion_progress_bar.n} of {max_exchanges * 2} turns: {stop_reason}{RESET_COLOR}")
+        conversation_history.append(f"System: The discussion stopped after {discussion_progress_bar.n} turns because {stop_reason}.")
+
+    # Advisors that answered during the last turn still reach the summarizer; the rest are dropped
+    last_insights = collect_insights()
+    if last_insights:
+        conversation_history.append("System: LATE ADVISORS' INSIGHTS:\n" + "\n\n".join(f"{name}'s advice: {advice}" for name, advice in last_insights.items()))
+    skipped_advisors = advisors.close(reason="still running when the discussion ended")
+    if skipped_advisors:
+        print(f"\n{YELLOW}⏭️  Skipped advisors:{RESET_COLOR} " + ", ".join(f"{advisor_models[model_key][1]} ({reason})" for model_key, reason in skipped_advisors.items()))
     print(f"\n{NEON_GREEN}✅ --- Oracle Discussion Complete --- ✅{RESET_COLOR}\n")
 
-    full_conversation = "\n".join(conversation_history)
+    # Keep the transcript within the summarizer's token budget, compacting it if needed
+    compaction_phase = tracing.start_span("compaction")
+    transcript_sections, budget_stats = fit_sections(enumerate(conversation_history), prompt_budget, user_message,
+                                                     summarizer_model_type, summarizer_model_name,
+                                                     summarize=summarizer_from_env(call_model_fn))
+    compaction_phase.end(**budget_stats)
+    if budget_stats["tokens_after"] < budget_stats["tokens_before"]:
+        print(f"{CYAN}✂️  Transcript compacted from {budget_stats['tokens_before']} to {budget_stats['tokens_after']} tokens "
+              f"({budget_stats['duplicates_dropped']} repeated paragraphs dropped, {budget_stats['summarized']} summarized, "
+              f"{budget_stats['truncated']} trimmed to the most relevant parts){RESET_COLOR}")
+    full_conversation = "\n".join(entry for _, entry in transcript_sections)
     
     print(f"{YELLOW}📝 --- Summarizing Discussion --- 📝{RESET_COLOR}")
+    summary_phase = tracing.start_span("summary")
     # Summarize the conversation
-    summarizer_progress_bar = tqdm(total=1, desc=f"🗣️ {summarizer_display_name} is summarizing", unit="task", leave=True) # leave=True for final bar
-    final_response = ""
     final_prompt = f"Based on the following discussion between {oracle1_display_name} and {oracle2_display_name}, and the initial advisors' insights, provide a comprehensive final answer to the original problem: {user_message}\n\nFull Discussion:\n{full_conversation}"
-    if summarizer_model_type == "openai":
-        final_response = call_openai(summarizer_model_name, final_prompt, system_message_summarizer)
-    elif summarizer_model_type == "mistral":
-        final_response = call_mistral(summarizer_model_name, final_prompt, system_message_summarizer)
-    elif summarizer_model_type == "gemini":
-        final_response = call_gemini(summarizer_model_name, final_prompt, system_message_summarizer)
+    if stream:
+        print(f"\n{NEON_GREEN}🏆 --- Final Answer from Duopoly Summarizer ({summarizer_display_name}) --- 🏆{RESET_COLOR}")
+        print(f"{YELLOW}🌟 Summarized Answer:{RESET_COLOR}")
+        final_response = ask(summarizer_model_type, summarizer_model_name, final_prompt, system_message_summarizer,
+                             also=report.update if report else None, hedge=True)
+        summary_phase.end()
+        if journal:
+            journal.complete("answer", final_response)
+        semantic_cache.store("duopoly", user_message, final_response)
+        return final_response
+
+    summarizer_progress_bar = tqdm(total=1, desc=f"🗣️ {summarizer_display_name} is summarizing", unit="task", leave=True) # leave=True for final bar
+    final_response = hedging.call(call_model_fn, summarizer_model_type, summarizer_model_name, final_prompt, system_message_summarizer)
     
     summarizer_progress_bar.update()
     summarizer_progress_bar.close()
+    summary_phase.end()
     print(f"\n{NEON_GREEN}🏆 --- Final Answer from Duopoly Summarizer --- 🏆{RESET_COLOR}")
     print(f"{YELLOW}🌟 Summarized Answer:{RESET_COLOR}\n{final_response}")
+    if journal:
+        journal.complete("answer", final_response)
+    semantic_cache.store("duopoly", user_message, final_response)
     return final_response
 
+# Solve the problem in problem_path, streaming to the console and a live HTML report.
+# Intermediate results go to a run journal; pass the run_id of a failed run to resume it.
+def main(problem_path="problem.txt", stream=STREAM_OUTPUT, run_id=None):
+    question = open_file(problem_path)
+    journal = run_journal.open_run("duopoly", question, run_id)
+    report_id = journal.run_id if journal else None
+    live_report = generate_html_response("⏳ The oracles are discussing the problem...", "Duopoly", live=True, run_id=report_id) if stream else None
+    with tracing.start_span("Duopoly", "run"):
+        final_response = duopoly(question, stream=stream, report=live_report, journal=journal)
+    if live_report:
+        live_report.finish(final_response)
+    else:
+        generate_html_response(final_response, "Duopoly", run_id=report_id)
+    tracing.finish_run("duopoly")
+    return final_response
 
-# The HTML generator function remains the same
-def generate_html_response(full_response, architecture_name):
-    html_content = f'''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>✨ AI Response Report ✨</title>
-        <style>
-            body {{
-                font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif, "Apple Color Emoji", "Segoe UI Emoji", "Segoe UI Symbol";
-                background-color: #f0f2f5; /* Light grey background */
-                margin: 0;
-                padding: 20px;
-                color: #1c1e21; /* Darker grey text */
-                display: flex;
-                justify-content: center;
-                align-items: flex-start; /* Align to top if content is short */
-                min-height: 100vh;
-            }}
-            .container {{
-                background-color: #ffffff; /* White container background */
-                border-radius: 12px; /* More rounded corners */
-                padding: 30px;
-                box-shadow: 0 8px 24px rgba(0,0,0,0.1); /* Softer, more prominent shadow */
-                width: 100%;
-                max-width: 800px; /* Max width for better readability */
-                border: 1px solid #e0e0e0; /* Light border */
-            }}
-            pre {{
-                background-color: #282c34; /* Dark background for code block */
-                color: #abb2bf; /* Light text for code block */
-                border-radius: 8px; /* Rounded corners for code block */
-                padding: 20px;
-                font-family: 'Cascadia Code', 'Consolas', 'SFMono-Regular', 'Menlo', 'Courier New', monospace;
-                overflow: auto;
-                white-space: pre-wrap;
-                word-wrap: break-word;
-                font-size: 0.95em;
-                border: none; /* Remove explicit border if shadow is sufficient */
-            }}
-            h1 {{
-                color: #007bff; /* Blue accent for heading */
-                text-align: center;
-                margin-bottom: 25px;
-                font-size: 2em;
-            }}
-            p.intro {{
-                line-height: 1.6;
-                color: #4b5563; /* Slightly lighter text for intro */
-                font-size: 1.1em;
-                text-align: center;
-                margin-bottom: 20px;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>✨ AI Response Report ✨</h1>
-            <p class="intro">📄 This report presents the findings from the Mixture of Models (MOM) system, utilizing the <strong>{architecture_name}</strong> architecture.</p>
-            <pre>{full_response}</pre>
-        </div>
-    </body>
-    </html>
-    '''
-
-    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.html', encoding='utf-8') as temp_file:
-        temp_file.write(html_content)
-        webbrowser.open('file://' + temp_file.name)
-
-# Example usage
-question = open_file("problem.txt")
-final_response = duopoly(question)
-generate_html_response(final_response, "Duopoly")
+# Importing the module only defines the architecture; run it with `python moi.py duopoly`
+# or as a script
+if __name__ == "__main__":
+    main()
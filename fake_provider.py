@@ -0,0 +1,49 @@
+import threading
+import time
+
+# In-process stand-in for the OpenAI / Mistral / Gemini helpers.
+# It answers instantly (or after a configurable delay per model) without any network
+# access, so the architectures and the fan-out can be exercised and timed offline:
+#
+#     fake = FakeProvider(delays={"gpt-4o": 2.0, "models/gemma-3-27b-it": 30.0})
+#     answers, skipped = fan_out(jobs, fake.call, per_call_timeout=10)
+
+
+class FakeProvider:
+    def __init__(self, delays=None, default_delay=0.0, responses=None, failures=None, token_delay=0.0):
+        self.delays = dict(delays or {})            # model name -> seconds before the first token
+        self.default_delay = default_delay
+        self.responses = dict(responses or {})      # model name -> canned answer
+        self.failures = set(failures or ())         # model names that raise
+        self.token_delay = token_delay              # seconds between streamed words
+        self.calls = []                             # (api_type, model_name, user_message, system_message)
+        self._lock = threading.Lock()
+
+    # Same signature as providers.call_model, including streaming and cancellation
+    def call(self, api_type, model_name, user_message, system_message=None, on_token=None, cancel_event=None):
+        with self._lock:
+            self.calls.append((api_type, model_name, user_message, system_message))
+        # Like a real request, a cancelled one stops waiting for the provider
+        if cancel_event is not None:
+            cancel_event.wait(self.delays.get(model_name, self.default_delay))
+        else:
+            time.sleep(self.delays.get(model_name, self.default_delay))
+        if model_name in self.failures:
+            raise RuntimeError(f"Fake failure from {model_name}")
+        answer = self.responses.get(model_name, f"Fake answer from {model_name} ({api_type})")
+        if on_token is None and cancel_event is None:
+            return answer
+
+        streamed = []
+        for word in answer.split(" "):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            token = word if not streamed else " " + word
+            streamed.append(token)
+            if on_token:
+                on_token(token)
+            if cancel_event is not None:
+                cancel_event.wait(self.token_delay)
+            else:
+                time.sleep(self.token_delay)
+        return "".join(streamed)
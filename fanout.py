@@ -0,0 +1,199 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Concurrent fan-out of independent model calls (advisors, voters, ...).
+# Every job is submitted at once, so a phase takes as long as its slowest
+# call instead of the sum of all of them.
+
+
+# Turn a timeout setting (a number, or a dict of per-job numbers) into the timeout for one job
+def _timeout_for(key, per_call_timeout):
+    if isinstance(per_call_timeout, dict):
+        return per_call_timeout.get(key, per_call_timeout.get("default"))
+    return per_call_timeout
+
+
+# Run worker(*args) for every (key, args) in jobs concurrently.
+#
+# per_call_timeout: seconds (or {key: seconds, "default": seconds}) a single job may take.
+# deadline:         seconds the whole fan-out may take; whatever has arrived by then is used.
+# on_result:        called as on_result(key, value) in the caller's thread as each job finishes.
+# stop_when:        called as stop_when(results, pending_keys) after each result; returning
+#                   True abandons the remaining jobs (e.g. a vote that can no longer change).
+# cancellable:      pass each job its own threading.Event as worker(*args, cancel_event=event);
+#                   the event is set as soon as the job is abandoned, so its call can close
+#                   its connection instead of running (and billing) to completion. Abandoned
+#                   jobs are not waited for, but a worker thread that ignores the event still
+#                   keeps the process alive until it returns, so callers pass it on.
+#
+# Returns (results, skipped): results maps key -> value in the order of jobs for every job
+# that finished, skipped maps key -> reason ("timed out", "deadline", "stopped early",
+# or the error message) for every job that did not.
+def fan_out(jobs, worker, per_call_timeout=None, deadline=None, on_result=None, stop_when=None, max_workers=None, cancellable=False):
+    jobs = dict(jobs)
+    if not jobs:
+        return {}, {}
+
+    results = {}
+    skipped = {}
+    started = time.monotonic()
+    overall_deadline = started + deadline if deadline is not None else None
+
+    cancel_events = {key: threading.Event() for key in jobs}
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(jobs))
+    if cancellable:
+        future_to_key = {executor.submit(worker, *args, cancel_event=cancel_events[key]): key for key, args in jobs.items()}
+    else:
+        future_to_key = {executor.submit(worker, *args): key for key, args in jobs.items()}
+    job_deadlines = {}
+    for future, key in future_to_key.items():
+        timeout = _timeout_for(key, per_call_timeout)
+        job_deadlines[future] = started + timeout if timeout is not None else None
+
+    pending = set(future_to_key)
+    try:
+        while pending:
+            now = time.monotonic()
+
+            # Drop jobs that ran past their own timeout
+            for future in [f for f in pending if job_deadlines[f] is not None and job_deadlines[f] <= now]:
+                pending.discard(future)
+                future.cancel()
+                cancel_events[future_to_key[future]].set()
+                skipped[future_to_key[future]] = "timed out"
+            if not pending:
+                break
+
+            if overall_deadline is not None and overall_deadline <= now:
+                for future in pending:
+                    future.cancel()
+                    cancel_events[future_to_key[future]].set()
+                    skipped[future_to_key[future]] = "deadline"
+                pending = set()
+                break
+
+            # Sleep until something finishes or the next timeout/deadline passes
+            wake_times = [d for d in (job_deadlines[f] for f in pending) if d is not None]
+            if overall_deadline is not None:
+                wake_times.append(overall_deadline)
+            wait_for = max(0.0, min(wake_times) - now) if wake_times else None
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                key = future_to_key[future]
+                try:
+                    value = future.result()
+                except Exception as e:
+                    skipped[key] = f"error: {e}"
+                    continue
+                results[key] = value
+                if on_result:
+                    on_result(key, value)
+
+            if pending and stop_when and stop_when(results, [future_to_key[f] for f in pending]):
+                for future in pending:
+                    future.cancel()
+                    cancel_events[future_to_key[future]].set()
+                    skipped[future_to_key[future]] = "stopped early"
+                pending = set()
+    finally:
+        # Don't block on abandoned calls; they are told to stop and finish in the background
+        for key in jobs:
+            if key not in results:
+                cancel_events[key].set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    ordered_results = {key: results[key] for key in jobs if key in results}
+    ordered_skipped = {key: skipped[key] for key in jobs if key in skipped}
+    return ordered_results, ordered_skipped
+
+
+# A fan-out that runs in the background while the caller gets on with other work.
+# The duopoly starts its oracle discussion once a quorum of advisors has answered and
+# folds later answers into later turns:
+#
+#     advisors = BackgroundFanOut(jobs, call_model)
+#     advisors.wait_for(2, timeout=60)
+#     first = advisors.take_new()       # answers that arrived since the last take_new()
+#     ...
+#     late = advisors.take_new()
+#     skipped = advisors.close()        # abandon whatever is still running
+class BackgroundFanOut:
+    def __init__(self, jobs, worker, per_call_timeout=None, cancellable=False, max_workers=None):
+        self.jobs = dict(jobs)
+        self.per_call_timeout = per_call_timeout
+        self.results = {}
+        self.skipped = {}
+        self._new = []
+        self._cond = threading.Condition()
+        self._started = time.monotonic()
+        self._cancel_events = {key: threading.Event() for key in self.jobs}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or max(1, len(self.jobs)))
+        self._futures = {}
+        for key, args in self.jobs.items():
+            if cancellable:
+                future = self._executor.submit(worker, *args, cancel_event=self._cancel_events[key])
+            else:
+                future = self._executor.submit(worker, *args)
+            self._futures[key] = future
+            future.add_done_callback(lambda f, key=key: self._finished(key, f))
+
+    def _finished(self, key, future):
+        with self._cond:
+            if key in self.skipped or future.cancelled():
+                return
+            try:
+                self.results[key] = future.result()
+                self._new.append(key)
+            except Exception as e:
+                self.skipped[key] = f"error: {e}"
+            self._cond.notify_all()
+
+    def _expire_timeouts(self):
+        now = time.monotonic()
+        for key in self.pending():
+            timeout = _timeout_for(key, self.per_call_timeout)
+            if timeout is not None and now - self._started >= timeout:
+                self.skipped[key] = "timed out"
+                self._cancel_events[key].set()
+                self._futures[key].cancel()
+
+    def pending(self):
+        return [key for key in self.jobs if key not in self.results and key not in self.skipped]
+
+    # Block until at least `count` jobs have answered, every job is settled, or `timeout` seconds pass
+    def wait_for(self, count, timeout=None):
+        wait_until = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while True:
+                self._expire_timeouts()
+                if len(self.results) >= count or not self.pending():
+                    return len(self.results)
+                wake_times = [wait_until] if wait_until is not None else []
+                for key in self.pending():
+                    timeout_for_key = _timeout_for(key, self.per_call_timeout)
+                    if timeout_for_key is not None:
+                        wake_times.append(self._started + timeout_for_key)
+                now = time.monotonic()
+                if wait_until is not None and now >= wait_until:
+                    return len(self.results)
+                self._cond.wait(max(0.0, min(wake_times) - now) if wake_times else None)
+
+    # Results that arrived since the previous call, in arrival order
+    def take_new(self):
+        with self._cond:
+            self._expire_timeouts()
+            new = {key: self.results[key] for key in self._new}
+            self._new = []
+            return new
+
+    # Abandon the jobs still running; returns every skipped job with its reason
+    def close(self, reason="not needed"):
+        with self._cond:
+            for key in self.pending():
+                self.skipped[key] = reason
+            for key in self.skipped:
+                self._cancel_events[key].set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        return {key: self.skipped[key] for key in self.jobs if key in self.skipped}
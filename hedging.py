@@ -0,0 +1,150 @@
+import os
+import threading
+
+import model_registry
+import tracing
+
+# Hedged requests for the calls that sit alone on the critical path (the King, the Duopoly
+# summarizer, the Democracy vote counter).
+#
+# With MOI_HEDGE=1, such a call that has not produced its first token (or its answer) after
+# the MOI_HEDGE_PERCENTILE of that model's recent times to first token is sent a second
+# time - to the same model, or to the equivalent named in MOI_HEDGE_MODELS. Whichever
+# request starts answering first wins; the other is cancelled. Before a model has enough
+# history, MOI_HEDGE_DELAY seconds is used. Hedging never retries a failed request (that
+# is rate_limit's job): a request that fails before the hedge delay fails the call.
+#
+#     MOI_HEDGE_MODELS=gpt-4o=openai:gpt-4o-2024-08-06,gpt-4-turbo=openai:gpt-4-turbo-2024-04-09
+
+HEDGE_ENABLED = os.getenv("MOI_HEDGE", "0").lower() in ("1", "true", "yes", "on")
+HEDGE_PERCENTILE = float(os.getenv("MOI_HEDGE_PERCENTILE", "0.95"))
+HEDGE_DELAY = float(os.getenv("MOI_HEDGE_DELAY", "20"))
+MIN_HEDGE_DELAY = 1.0
+
+PINK = '\033[95m'
+CYAN = '\033[96m'
+YELLOW = '\033[93m'
+NEON_GREEN = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+
+# "model=api_type:model,..." -> {model: (api_type, model)}
+def _parse_models(value):
+    models = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        model_name, _, target = entry.partition("=")
+        api_type, _, target_model = target.partition(":")
+        if not target_model:
+            raise ValueError(f"MOI_HEDGE_MODELS entries look like gpt-4o=openai:gpt-4o-2024-08-06, got {entry!r}")
+        models[model_name.strip()] = (api_type.strip(), target_model.strip())
+    return models
+
+
+HEDGE_MODELS = _parse_models(os.getenv("MOI_HEDGE_MODELS", ""))
+
+
+def hedge_target(api_type, model_name):
+    return HEDGE_MODELS.get(model_name, (api_type, model_name))
+
+
+# Seconds to wait for the first token before hedging
+def hedge_delay(api_type, model_name):
+    delay = model_registry.latency_percentile(api_type, model_name, HEDGE_PERCENTILE, first_token=True)
+    if delay is None:
+        delay = model_registry.latency_percentile(api_type, model_name, HEDGE_PERCENTILE)
+    return HEDGE_DELAY if delay is None else max(MIN_HEDGE_DELAY, delay)
+
+
+class _Attempt:
+    def __init__(self, api_type, model_name):
+        self.api_type = api_type
+        self.model_name = model_name
+        self.cancel_event = threading.Event()
+        self.response = None
+        self.error = None
+        self.done = False
+
+
+# Requests for the same prompt racing each other; the first to answer wins
+class _Race:
+    def __init__(self, call_model_fn, user_message, system_message, on_token):
+        self.call_model_fn = call_model_fn
+        self.user_message = user_message
+        self.system_message = system_message
+        self.on_token = on_token
+        self.attempts = []
+        self.winner = None
+        self._condition = threading.Condition()
+
+    def start(self, api_type, model_name):
+        attempt = _Attempt(api_type, model_name)
+        with self._condition:
+            self.attempts.append(attempt)
+        threading.Thread(target=self._run, args=(attempt,), name=f"hedge-{model_name}", daemon=True).start()
+
+    def _win(self, attempt):
+        self.winner = attempt
+        for other in self.attempts:
+            if other is not attempt:
+                other.cancel_event.set()
+        self._condition.notify_all()
+
+    def _token(self, attempt, token):
+        with self._condition:
+            if self.winner is None:
+                self._win(attempt)
+            forward = self.winner is attempt
+        if forward and self.on_token:
+            self.on_token(token)
+
+    def _run(self, attempt):
+        try:
+            attempt.response = self.call_model_fn(attempt.api_type, attempt.model_name, self.user_message, self.system_message,
+                                                  on_token=lambda token: self._token(attempt, token), cancel_event=attempt.cancel_event)
+        except Exception as e:
+            attempt.error = e
+        with self._condition:
+            attempt.done = True
+            if self.winner is None and attempt.error is None:
+                self._win(attempt)
+            self._condition.notify_all()
+
+    def _settled(self):
+        return self.winner is not None or all(attempt.done for attempt in self.attempts)
+
+    # True once a request has started answering or every request has failed
+    def wait_settled(self, timeout):
+        with self._condition:
+            return self._condition.wait_for(self._settled, timeout)
+
+    def result(self):
+        with self._condition:
+            self._condition.wait_for(lambda: (self.winner is not None and self.winner.done) or all(attempt.done for attempt in self.attempts))
+            attempt = self.winner or self.attempts[0]
+        if attempt.error is not None:
+            raise attempt.error
+        return attempt.response
+
+
+# call_model_fn(api_type, model_name, user_message, system_message), hedged when MOI_HEDGE is on
+def call(call_model_fn, api_type, model_name, user_message, system_message=None, on_token=None, enabled=None):
+    enabled = HEDGE_ENABLED if enabled is None else enabled
+    if not enabled:
+        if on_token is None:
+            return call_model_fn(api_type, model_name, user_message, system_message)
+        return call_model_fn(api_type, model_name, user_message, system_message, on_token=on_token)
+
+    delay = hedge_delay(api_type, model_name)
+    span = tracing.start_span(f"hedged {model_name}", "hedge", delay_seconds=round(delay, 3))
+    race = _Race(call_model_fn, user_message, system_message, on_token)
+    race.start(api_type, model_name)
+    if not race.wait_settled(delay):
+        hedge_api_type, hedge_model_name = hedge_target(api_type, model_name)
+        print(f"{YELLOW}🪁 {model_name} has not started answering after {delay:.1f}s, also asking {hedge_model_name}{RESET_COLOR}")
+        race.start(hedge_api_type, hedge_model_name)
+    try:
+        return race.result()
+    finally:
+        winner = race.winner
+        span.end(hedged=len(race.attempts) > 1,
+                 winner=None if winner is None else f"{winner.model_name} (request {race.attempts.index(winner) + 1})")
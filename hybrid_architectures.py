@@ -0,0 +1,122 @@
+import dag
+import run_journal
+import tracing
+from king_architecture import the_king
+from duopoly_architecture import duopoly
+from democracy_architecture import the_democracy
+from reporting import generate_html_response
+from streaming import STREAM_OUTPUT
+
+
+PINK = '\033[95m'
+CYAN = '\033[96m'
+YELLOW = '\033[93m'
+NEON_GREEN = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+# Hybrid architectures, declared as graphs of the three basic ones (see dag.py):
+#
+#   democracy-king   the Democracy votes, and its winning solution joins the King's advisors
+#   council          the Democracy and the Duopoly work side by side, and the King weighs both
+#
+# Only the last node streams to the console and the live report; the others run quietly,
+# concurrently where the graph allows. Each architecture node keeps its own run journal
+# (<run id>.<node>), so resuming a hybrid run also resumes inside the node that failed.
+
+# How the output of each basic architecture is named when it is handed to the King
+STAGE_NAMES = {"democracy": "The Democracy's winning solution", "duopoly": "The Duopoly's conclusion"}
+
+
+def open_file(filepath):
+    with open(filepath, 'r', encoding='utf-8') as infile:
+        return infile.read()
+
+
+# A graph node running one basic architecture. The King node gets the outputs of the
+# nodes it comes after as extra advice.
+def _architecture_node(name, call_model_fn, journal, stream=False, report=None, after=()):
+    def run(problem, inputs):
+        node_journal = run_journal.open_run(name, problem, f"{journal.run_id}.{name}") if journal else None
+        if name == "king":
+            extra_advice = {STAGE_NAMES[stage]: output for stage, output in inputs.items()}
+            return the_king(problem, call_model_fn=call_model_fn, stream=stream, report=report, journal=node_journal,
+                            extra_advice=extra_advice)
+        if name == "duopoly":
+            return duopoly(problem, call_model_fn=call_model_fn, stream=stream, report=report, journal=node_journal)
+        return the_democracy(problem, call_model_fn=call_model_fn, stream=stream, report=report, journal=node_journal)
+
+    # An upstream architecture that fails leaves the King with one source of advice fewer
+    return dag.Node(name, run, after=after, optional=after)
+
+
+def democracy_king_graph(call_model_fn=None, stream=STREAM_OUTPUT, report=None, journal=None):
+    return dag.Graph([
+        _architecture_node("democracy", call_model_fn, journal),
+        _architecture_node("king", call_model_fn, journal, stream, report, after=("democracy",)),
+    ])
+
+
+def council_graph(call_model_fn=None, stream=STREAM_OUTPUT, report=None, journal=None):
+    return dag.Graph([
+        _architecture_node("democracy", call_model_fn, journal),
+        _architecture_node("duopoly", call_model_fn, journal),
+        _architecture_node("king", call_model_fn, journal, stream, report, after=("democracy", "duopoly")),
+    ])
+
+
+GRAPHS = {"democracy-king": democracy_king_graph, "council": council_graph}
+
+
+# Run a hybrid graph and return the output of its final node
+def solve_graph(architecture, user_message, call_model_fn=None, stream=STREAM_OUTPUT, report=None, journal=None):
+    print(f"{NEON_GREEN}🕸️ --- Starting the {architecture} hybrid architecture --- 🕸️{RESET_COLOR}")
+    if journal and journal.completed("answer") is not None:
+        final_answer = journal.completed("answer")
+        print(f"{NEON_GREEN}♻️  The {architecture} architecture had already answered in this run:{RESET_COLOR}\n{final_answer}")
+        return final_answer
+    graph = GRAPHS[architecture](call_model_fn=call_model_fn, stream=stream, report=report, journal=journal)
+    print(f"{CYAN}🧩 Nodes: {' → '.join(graph.order)}{RESET_COLOR}")
+
+    def on_node(name, output):
+        print(f"\n{NEON_GREEN}✅ --- Node {name} finished --- ✅{RESET_COLOR}")
+
+    outputs, failed = graph.run(user_message, journal=journal, on_result=on_node)
+    if failed:
+        print(f"\n{YELLOW}⏭️  Failed nodes:{RESET_COLOR} " + ", ".join(f"{name} ({reason})" for name, reason in failed.items()))
+    final_node = graph.sinks()[0]
+    if final_node not in outputs:
+        raise RuntimeError(f"The {architecture} architecture produced no answer: {final_node} failed ({failed[final_node]})")
+    if journal:
+        journal.complete("answer", outputs[final_node])
+    return outputs[final_node]
+
+
+def democracy_king(user_message, call_model_fn=None, stream=STREAM_OUTPUT, report=None, journal=None):
+    return solve_graph("democracy-king", user_message, call_model_fn, stream, report, journal)
+
+
+def council(user_message, call_model_fn=None, stream=STREAM_OUTPUT, report=None, journal=None):
+    return solve_graph("council", user_message, call_model_fn, stream, report, journal)
+
+
+# Solve the problem in problem_path with one of the hybrid graphs, like the basic
+# architectures' main(); pass the run_id of a failed run to resume it
+def main(problem_path="problem.txt", stream=STREAM_OUTPUT, run_id=None, architecture="council"):
+    question = open_file(problem_path)
+    journal = run_journal.open_run(architecture, question, run_id)
+    report_id = journal.run_id if journal else None
+    live_report = generate_html_response(f"⏳ The {architecture} architecture is working on the problem...", architecture.title(), live=True, run_id=report_id) if stream else None
+    with tracing.start_span(architecture, "run"):
+        final_answer = solve_graph(architecture, question, stream=stream, report=live_report, journal=journal)
+    if live_report:
+        live_report.finish(final_answer)
+    else:
+        generate_html_response(final_answer, architecture.title(), run_id=report_id)
+    tracing.finish_run(architecture)
+    return final_answer
+
+
+# Importing the module only defines the graphs; run them with `python moi.py council`
+# or `python moi.py democracy-king`
+if __name__ == "__main__":
+    main()
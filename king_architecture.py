@@ -1,29 +1,17 @@
-import openai
-import os
-from dotenv import load_dotenv
-import re
-import requests
-import markdown
-import webbrowser
-import tempfile
 from tqdm import tqdm
-import time
-from mistralai import Mistral
-import google.generativeai as genai
+import model_registry
+import tracing
+import run_journal
+import consensus
+import hedging
+import semantic_cache
+from providers import call_model
+from fanout import fan_out
+from reporting import generate_html_response
+from streaming import STREAM_OUTPUT, ConsoleStream, StreamBoard
+from prompt_budget import DEFAULT_FINAL_BUDGET, fit_sections, summarizer_from_env
 
 
-load_dotenv()
-
-# API keys
-openai_api_key = os.getenv("OPENAI_API_KEY")
-mistral_api_key = os.getenv("MISTRAL_API_KEY")
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-
-# Clients
-openai_client = openai.OpenAI(api_key=openai_api_key)
-mistral_client = Mistral(api_key=mistral_api_key)
-genai.configure(api_key=gemini_api_key)
-
 # Colors (unused in HTML output, kept for possible console outputs or further expansions)
 PINK = '\033[95m'
 CYAN = '\033[96m'
@@ -31,117 +19,17 @@ YELLOW = '\033[93m'
 NEON_GREEN = '\033[92m'
 RESET_COLOR = '\033[0m'
 
+# Seconds a single advisor may take, and seconds the whole consultation may take.
+# Advisors still running when either runs out are skipped and the King goes ahead without them.
+ADVISOR_TIMEOUT = 120
+ADVISOR_DEADLINE = 180
+
 # Function to open a file and return its contents as a string
 def open_file(filepath):
     with open(filepath, 'r', encoding='utf-8') as infile:
         return infile.read()
 
-def call_mistral(model_name, user_message, system_message=None):
-    messages = []
-    if system_message:
-        messages.append({"role": "system", "content": system_message})
-    messages.append({"role": "user", "content": user_message})
-    try:
-        response = mistral_client.chat.complete(
-            model=model_name,
-            messages=messages
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error calling Mistral model {model_name}: {str(e)}")
-        return f"Error: Could not get response from {model_name}"
-
-def call_gemini(model_name, user_message):
-    try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(user_message)
-        return response.text.strip()
-    except Exception as e:
-        print(f"Error calling Gemini model {model_name}: {str(e)}")
-        return f"Error: Could not get response from {model_name}"
-
-def call_openai(model_name, user_message, system_message="You are a coder and problem solver expert"):
-    response = openai_client.chat.completions.create(
-        model=model_name,
-        messages=[
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": user_message}
-        ],
-        temperature=0.3,
-    )
-    return response.choices[0].message.content.strip()
-
-def generate_html_response(full_response, architecture_name):
-    html_content = f'''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>✨ AI Response Report ✨</title>
-        <style>
-            body {{
-                font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif, "Apple Color Emoji", "Segoe UI Emoji", "Segoe UI Symbol";
-                background-color: #f0f2f5; /* Light grey background */
-                margin: 0;
-                padding: 20px;
-                color: #1c1e21; /* Darker grey text */
-                display: flex;
-                justify-content: center;
-                align-items: flex-start; /* Align to top if content is short */
-                min-height: 100vh;
-            }}
-            .container {{
-                background-color: #ffffff; /* White container background */
-                border-radius: 12px; /* More rounded corners */
-                padding: 30px;
-                box-shadow: 0 8px 24px rgba(0,0,0,0.1); /* Softer, more prominent shadow */
-                width: 100%;
-                max-width: 800px; /* Max width for better readability */
-                border: 1px solid #e0e0e0; /* Light border */
-            }}
-            pre {{
-                background-color: #282c34; /* Dark background for code block */
-                color: #abb2bf; /* Light text for code block */
-                border-radius: 8px; /* Rounded corners for code block */
-                padding: 20px;
-                font-family: 'Cascadia Code', 'Consolas', 'SFMono-Regular', 'Menlo', 'Courier New', monospace;
-                overflow: auto;
-                white-space: pre-wrap;
-                word-wrap: break-word;
-                font-size: 0.95em;
-                border: none; /* Remove explicit border if shadow is sufficient */
-            }}
-            h1 {{
-                color: #007bff; /* Blue accent for heading */
-                text-align: center;
-                margin-bottom: 25px;
-                font-size: 2em;
-            }}
-            p.intro {{
-                line-height: 1.6;
-                color: #4b5563; /* Slightly lighter text for intro */
-                font-size: 1.1em;
-                text-align: center;
-                margin-bottom: 20px;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>✨ AI Response Report ✨</h1>
-            <p class="intro">📄 This report presents the findings from the Mixture of Models (MOM) system, utilizing the <strong>{architecture_name}</strong> architecture.</p>
-            <pre>{full_response}</pre>
-        </div>
-    </body>
-    </html>
-    '''
-
-    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.html', encoding='utf-8') as temp_file:
-        temp_file.write(html_content)
-        webbrowser.open('file://' + temp_file.name)
-
-def the_king(user_message):
+def the_king(user_message, call_model_fn=None, advisor_timeout=ADVISOR_TIMEOUT, deadline=ADVISOR_DEADLINE, stream=STREAM_OUTPUT, report=None, prompt_budget=DEFAULT_FINAL_BUDGET, consensus_mode=consensus.CONSENSUS_MODE, journal=None, extra_advice=None):
     king_system_message = """You are a wise and knowledgeable coder and problem solver king who provides thoughtful answers to questions.
     
     You have several advisors, who offer their insights to assist you.
@@ -165,52 +53,182 @@ def the_king(user_message):
         # Add more models as desired, up to your 10 advisor target if you wish
     }
     
+    call_model_fn = call_model_fn or call_model
     answers = {}
     print(f"{NEON_GREEN}👑 --- Starting The King Architecture --- 👑{RESET_COLOR}")
     print(f"{YELLOW}🤔 Problem to solve:{RESET_COLOR} {user_message[:200] + '...' if len(user_message) > 200 else user_message}\n")
-    
-    tasks = [f"Consulting {name_tuple[1]}" for model_key, name_tuple in advisor_models.items()]
-    progress_bar = tqdm(tasks, desc="Gathering insights", unit="task", leave=False)
 
+    # A resumed run (see run_journal) that already has its answer is done
+    if journal and journal.completed("answer") is not None:
+        king_answer = journal.completed("answer")
+        print(f"{NEON_GREEN}♻️  The King had already spoken in this run:{RESET_COLOR}\n{king_answer}")
+        return king_answer
+    # A near-duplicate of a problem solved before is answered, or advised, from the semantic cache
+    cached_answer, seed = semantic_cache.consult("king", user_message)
+    if cached_answer is not None:
+        return cached_answer
+    extra_advice = {**(extra_advice or {}), **seed}
+    # Advice recorded by an earlier attempt of this run is reused instead of asked for again
+    restored = {model_key: advice for model_key, advice in journal.entries("advice").items() if model_key in advisor_models} if journal else {}
+    consulted = journal is None or not journal.completed("advisors")
+
+    # Advisors that are cooling down, failing or too slow lately sit this one out (see model_registry)
+    chosen = set(restored)
+    if consulted:
+        selected, dropped = model_registry.select([(api_type, model_key) for model_key, (api_type, display_name) in advisor_models.items() if model_key not in restored])
+        if dropped:
+            print(f"{YELLOW}🧊 Not consulted this time:{RESET_COLOR} " + ", ".join(f"{advisor_models[model_key][1]} ({reason})" for (_, model_key), reason in dropped.items()) + "\n")
+        chosen.update(model_key for _, model_key in selected)
+    advisor_models = {model_key: advisor for model_key, advisor in advisor_models.items() if model_key in chosen}
+    if restored:
+        print(f"{NEON_GREEN}♻️  Restored advice from the run journal:{RESET_COLOR} {', '.join(advisor_models[model_key][1] for model_key in restored)}\n")
+    to_consult = {model_key: advisor for model_key, advisor in advisor_models.items() if model_key not in restored}
+
+    advisors_phase = tracing.start_span("advisors", advisors=len(advisor_models))
+    progress_bar = tqdm(total=len(to_consult), desc="Gathering insights", unit="task", leave=False)
     for model_key, (api_type, display_name) in advisor_models.items():
-        progress_bar.set_description(f"Consulting {display_name}")
+        if model_key in to_consult:
+            print(f"{CYAN}🗣️  Consulting Advisor: {display_name}...{RESET_COLOR}")
+
+    # Advisors are consulted all at once; each answer is printed as soon as it arrives
+    def on_advice(model_key, advice):
+        display_name = advisor_models[model_key][1]
+        progress_bar.set_description(f"Heard from {display_name}")
         print()
-        print(f"{CYAN}🗣️  Consulting Advisor: {display_name}...{RESET_COLOR}")
-        advice = ""
-        if api_type == "openai":
-            advice = call_openai(model_key, user_message)
-        elif api_type == "mistral":
-            advice = call_mistral(model_key, user_message)
-        elif api_type == "gemini":
-            advice = call_gemini(model_key, user_message)
-        
-        answers[display_name] = advice
         print(f"{NEON_GREEN}💡 Advice from {display_name}:{RESET_COLOR}\n{advice[:300] + '...' if len(advice) > 300 else advice}")
         print(f"{PINK}---------------------------------------------------------------------------------------------------------------------------------{RESET_COLOR}")
         progress_bar.update()
+        if journal:
+            journal.record("advice", model_key, advice)
+        if report:
+            report.update(f"⏳ Heard from {progress_bar.n}/{len(to_consult)} advisors, latest: {display_name}", force=True)
+
+    jobs = {model_key: (api_type, model_key, user_message) for model_key, (api_type, display_name) in to_consult.items()}
+    if stream:
+        # Advisors stream into the board, so an advisor cut off by the deadline still contributes what it wrote
+        board = StreamBoard({model_key: display_name for model_key, (api_type, display_name) in to_consult.items()})
+
+        def consult(api_type, model_key, user_message, cancel_event=None):
+            return call_model_fn(api_type, model_key, user_message, on_token=board.feeder(model_key), cancel_event=cancel_event)
+
+        advice_by_model, skipped = fan_out(jobs, consult, per_call_timeout=advisor_timeout, deadline=deadline,
+                                           on_result=on_advice, cancellable=True)
+        board.close()
+    else:
+        # Advisors cut off by their timeout or the deadline are cancelled, not left running
+        advice_by_model, skipped = fan_out(jobs, call_model_fn, per_call_timeout=advisor_timeout, deadline=deadline,
+                                           on_result=on_advice, cancellable=True)
     progress_bar.close()
-    print(f"\n{NEON_GREEN}✅ --- All Advisor Consultations Complete --- ✅{RESET_COLOR}")
-
-    advisor_answers_str = "\n\n".join(f"{name}'s advice:\n{advice}" for name, advice in answers.items())
+    advice_by_model = {model_key: restored.get(model_key) or advice_by_model.get(model_key) for model_key in advisor_models
+                       if model_key in restored or model_key in advice_by_model}
+
+    for model_key, advice in advice_by_model.items():
+        answers[advisor_models[model_key][1]] = advice
+    if stream:
+        for model_key in skipped:
+            partial_advice = board.partial(model_key)
+            if partial_advice:
+                answers[advisor_models[model_key][1]] = partial_advice + "\n(partial advice, cut off before the advisor finished)"
+    skipped_advisors = {advisor_models[model_key][1]: reason for model_key, reason in skipped.items()
+                        if advisor_models[model_key][1] not in answers}
+    if skipped_advisors:
+        print(f"\n{YELLOW}⏭️  Skipped advisors:{RESET_COLOR} " + ", ".join(f"{name} ({reason})" for name, reason in skipped_advisors.items()))
+    # Answers of earlier stages of a hybrid architecture (see hybrid_architectures.py) count as advice too
+    if extra_advice:
+        print(f"\n{NEON_GREEN}📨 Advice from earlier stages:{RESET_COLOR} {', '.join(extra_advice)}")
+        answers.update(extra_advice)
+    advisors_phase.end(answered=len(answers), skipped=len(skipped_advisors), restored=len(restored))
+    if journal and consulted:
+        journal.complete("advisors")
+    print(f"\n{NEON_GREEN}✅ --- All Advisor Consultations Complete ({len(answers)}/{len(advisor_models)} answered) --- ✅{RESET_COLOR}")
+
+    king_api_type, king_model_name = "openai", "gpt-4o"
+
+    # When the advisors already agree, the King is skipped (MOI_CONSENSUS=skip) or a cheaper
+    # model writes the final answer (MOI_CONSENSUS=downgrade). Partial advice does not count.
+    if consensus_mode in ("skip", "downgrade"):
+        consensus_phase = tracing.start_span("consensus", mode=consensus_mode)
+        verdict = consensus.check({**{advisor_models[model_key][1]: advice for model_key, advice in advice_by_model.items()}, **(extra_advice or {})})
+        consensus_phase.end(agreement=verdict["agreement"], fired=verdict["reached"], reason=verdict["reason"])
+        stats = consensus.record(verdict["reached"], consensus_mode)
+        rate = f"fired in {stats['fired']} of {stats['checks']} runs"
+        if not verdict["reached"]:
+            print(f"\n{CYAN}🤝 No consensus among the advisors ({verdict['reason']}), consulting The King ({rate}){RESET_COLOR}")
+        elif consensus_mode == "skip":
+            print(f"\n{NEON_GREEN}🤝 --- Consensus: {verdict['reason']}, The King is not consulted ({rate}) --- 🤝{RESET_COLOR}")
+            king_answer = (f"{answers[verdict['representative']]}\n\n(Consensus answer from {verdict['representative']}, "
+                           f"agreed on by {', '.join(verdict['group'])})")
+            print(f"{YELLOW}🌟 Final Answer (advisors' consensus):{RESET_COLOR}\n{king_answer}")
+            if report:
+                report.update(king_answer, force=True)
+            if journal:
+                journal.complete("answer", king_answer)
+            semantic_cache.store("king", user_message, king_answer)
+            return king_answer
+        else:
+            king_api_type, king_model_name = consensus.CONSENSUS_MODEL.split(":", 1)
+            print(f"\n{NEON_GREEN}🤝 Consensus: {verdict['reason']}, {king_model_name} writes the final answer ({rate}){RESET_COLOR}")
 
     print(f"\n{YELLOW}📝 --- Preparing Prompt for The King --- 📝{RESET_COLOR}")
-    king_model_name = "gpt-4o" 
-    king_prompt = f"Advisors' Advice:\n{advisor_answers_str}\n\nProblem: {user_message}\n\nBased on all the ADVISORS' ADVICE and the original PROBLEM, provide your comprehensive, step-by-step solution. Acknowledge helpful contributions from specific advisors if appropriate by referencing their names (e.g., 'As {display_name} pointed out,...')."
+
+    # Keep the advisors' advice within the King's token budget, compacting it if needed
+    compaction_phase = tracing.start_span("compaction")
+    advice_sections, budget_stats = fit_sections(answers.items(), prompt_budget, user_message, king_api_type, king_model_name,
+                                                 summarize=summarizer_from_env(call_model_fn))
+    compaction_phase.end(**budget_stats)
+    if budget_stats["tokens_after"] < budget_stats["tokens_before"]:
+        print(f"{CYAN}✂️  Advice compacted from {budget_stats['tokens_before']} to {budget_stats['tokens_after']} tokens "
+              f"({budget_stats['duplicates_dropped']} repeated paragraphs dropped, {budget_stats['summarized']} summarized, "
+              f"{budget_stats['truncated']} trimmed to the most relevant parts){RESET_COLOR}")
+    advisor_answers_str = "\n\n".join(f"{name}'s advice:\n{advice}" for name, advice in advice_sections)
+    if skipped_advisors:
+        advisor_answers_str += "\n\n(No advice was received in time from: " + ", ".join(skipped_advisors) + ")"
+    king_prompt = f"Advisors' Advice:\n{advisor_answers_str}\n\nProblem: {user_message}\n\nBased on all the ADVISORS' ADVICE and the original PROBLEM, provide your comprehensive, step-by-step solution. Acknowledge helpful contributions from specific advisors if appropriate by referencing their names (e.g., 'As <advisor name> pointed out,...')."
     
     print(f"{CYAN}📜 Full prompt for The King ({king_model_name}):{RESET_COLOR}\n{king_prompt}\n")
 
-    progress_bar_king = tqdm(total=1, desc=f"The King ({king_model_name}) is solving the problem", unit="task")
-    
-    king_answer = call_openai(king_model_name, king_prompt, king_system_message)
-    progress_bar_king.update()
-    progress_bar_king.close()
-    
-    print(f"\n{NEON_GREEN}📣 --- The King Has Spoken --- 📣{RESET_COLOR}")
-    print(f"{YELLOW}🌟 Final Answer from The King:{RESET_COLOR}\n{king_answer}")
+    king_phase = tracing.start_span("king")
+    if stream:
+        # The King's answer is printed (and written to the live report) token by token
+        print(f"\n{NEON_GREEN}📣 --- The King Speaks ({king_model_name}) --- 📣{RESET_COLOR}")
+        print(f"{YELLOW}🌟 Final Answer from The King:{RESET_COLOR}")
+        console = ConsoleStream(also=report.update if report else None)
+        king_answer = hedging.call(call_model_fn, king_api_type, king_model_name, king_prompt, king_system_message, on_token=console)
+        console.end()
+    else:
+        progress_bar_king = tqdm(total=1, desc=f"The King ({king_model_name}) is solving the problem", unit="task")
+
+        king_answer = hedging.call(call_model_fn, king_api_type, king_model_name, king_prompt, king_system_message)
+        progress_bar_king.update()
+        progress_bar_king.close()
+
+        print(f"\n{NEON_GREEN}📣 --- The King Has Spoken --- 📣{RESET_COLOR}")
+        print(f"{YELLOW}🌟 Final Answer from The King:{RESET_COLOR}\n{king_answer}")
+    king_phase.end()
+    if journal:
+        journal.complete("answer", king_answer)
+    semantic_cache.store("king", user_message, king_answer)
 
     return king_answer
 
-question = open_file("problem.txt")
-html_response1 = the_king(question)  #First Run
-#html_response2 = the_king(html_response1)  # Run it twice
-generate_html_response(html_response1, "King")
+# Solve the problem in problem_path, streaming to the console and a live HTML report.
+# Intermediate results go to a run journal; pass the run_id of a failed run to resume it.
+def main(problem_path="problem.txt", stream=STREAM_OUTPUT, run_id=None):
+    question = open_file(problem_path)
+    journal = run_journal.open_run("king", question, run_id)
+    report_id = journal.run_id if journal else None
+    live_report = generate_html_response("⏳ The King is consulting the advisors...", "King", live=True, run_id=report_id) if stream else None
+    with tracing.start_span("King", "run"):
+        html_response1 = the_king(question, stream=stream, report=live_report, journal=journal)  #First Run
+        #html_response2 = the_king(html_response1)  # Run it twice
+    if live_report:
+        live_report.finish(html_response1)
+    else:
+        generate_html_response(html_response1, "King", run_id=report_id)
+    tracing.finish_run("king")
+    return html_response1
+
+# Importing the module only defines the architecture; run it with `python moi.py king`
+# or as a script
+if __name__ == "__main__":
+    main()
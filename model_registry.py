@@ -0,0 +1,286 @@
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import rate_limit
+import tracing
+
+# Rolling per-model statistics, kept on disk across runs, and the roster selection policy
+# built on them.
+#
+# Every provider call that reaches the provider (cache hits do not) leaves a sample: wall
+# time, success, prompt and completion tokens, and time to the first streamed token. The last MOI_ROSTER_WINDOW samples per model
+# are kept in <MOI_CACHE_DIR>/model_stats.json, from which latency percentiles, error
+# rate, tokens per second and cost per call are derived. Each process adds its new samples
+# to the file under a lock, so concurrent runs and sweep workers keep each other's samples.
+#
+# The architectures pick their advisors/voters with select():
+#   - models whose circuit is open are dropped
+#   - models failing more than MOI_ROSTER_MAX_ERROR_RATE of their recent calls are dropped
+#   - with MOI_ROSTER_P95_BUDGET set, models whose p95 latency exceeds it are dropped
+#   - with MOI_ROSTER_SIZE set, only the best that many are kept (lowest p95, then cost)
+# Models with fewer than MIN_SAMPLES samples are always tried, so new models get measured,
+# and when fewer than the architecture's minimum remain the best dropped ones are kept.
+# Inside `with roster(...)` these settings can be overridden, and models excluded, for the
+# runs started there (e.g. one job of an evaluation sweep, see sweep.py).
+#
+#     python model_registry.py       # print the learned statistics
+
+STATS_PATH = os.path.join(os.getenv("MOI_CACHE_DIR", ".moi_cache"), "model_stats.json")
+WINDOW = int(os.getenv("MOI_ROSTER_WINDOW", "100"))
+MAX_ERROR_RATE = float(os.getenv("MOI_ROSTER_MAX_ERROR_RATE", "0.5"))
+P95_BUDGET = float(os.getenv("MOI_ROSTER_P95_BUDGET")) if os.getenv("MOI_ROSTER_P95_BUDGET") else None
+ROSTER_SIZE = int(os.getenv("MOI_ROSTER_SIZE")) if os.getenv("MOI_ROSTER_SIZE") else None
+MIN_SAMPLES = 3
+# Seconds between saves while calls keep coming in (and once more at exit)
+SAVE_INTERVAL = 10
+
+PINK = '\033[95m'
+CYAN = '\033[96m'
+YELLOW = '\033[93m'
+NEON_GREEN = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+_lock = threading.Lock()
+_samples = None     # "provider/model" -> [[seconds, ok, prompt_tokens, completion_tokens, ttft], ...]
+_pending = {}       # samples recorded by this process since its last save, by key
+_last_save = time.monotonic()
+_roster = contextvars.ContextVar("roster", default=None)
+
+
+def _key(provider, model_name):
+    return f"{provider}/{model_name}"
+
+
+def _read():
+    try:
+        with open(STATS_PATH, 'r', encoding='utf-8') as infile:
+            return json.load(infile)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _load():
+    global _samples
+    if _samples is None:
+        _samples = _read()
+    return _samples
+
+
+# Held while a process merges its samples into the file (no locking where fcntl is missing)
+@contextlib.contextmanager
+def _file_lock():
+    if fcntl is None:
+        yield
+        return
+    with open(STATS_PATH + ".lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _append(samples_by_key, key, samples):
+    merged = samples_by_key.setdefault(key, [])
+    merged.extend(samples)
+    del merged[:-WINDOW]
+
+
+# Add this process's new samples to the file, on top of what other processes (sweep
+# workers, other runs) saved meanwhile, and pick up theirs
+def save():
+    global _samples, _pending, _last_save
+    with _lock:
+        if not _pending:
+            return
+        pending, _pending = _pending, {}
+        _last_save = time.monotonic()
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(STATS_PATH)), exist_ok=True)
+        with _file_lock():
+            samples = _read()
+            for key, new_samples in pending.items():
+                _append(samples, key, new_samples)
+            # Written whole and renamed into place, so readers never see half a file
+            temporary_path = f"{STATS_PATH}.{os.getpid()}.tmp"
+            with open(temporary_path, 'w', encoding='utf-8') as outfile:
+                outfile.write(json.dumps(samples))
+            os.replace(temporary_path, STATS_PATH)
+    except OSError as e:
+        with _lock:
+            for key, new_samples in pending.items():
+                _pending[key] = new_samples + _pending.get(key, [])
+        print(f"{YELLOW}⚠️  Could not save model statistics to {STATS_PATH}: {e}{RESET_COLOR}")
+        return
+    with _lock:
+        # Samples recorded while the file was being written go on top, and out with the next save
+        for key, new_samples in _pending.items():
+            _append(samples, key, new_samples)
+        _samples = samples
+
+
+def record(provider, model_name, seconds, ok, prompt_tokens=0, completion_tokens=0, ttft=None):
+    key = _key(provider, model_name)
+    sample = [round(seconds, 3), 1 if ok else 0, prompt_tokens, completion_tokens, ttft]
+    with _lock:
+        _append(_load(), key, [sample])
+        _pending.setdefault(key, []).append(sample)
+        due = time.monotonic() - _last_save >= SAVE_INTERVAL
+    if due:
+        save()
+
+
+# Forget the samples held in memory and read the file again on next use (e.g. between
+# benchmark runs, which must not learn from each other)
+def reset():
+    global _samples, _pending
+    with _lock:
+        _samples = None
+        _pending = {}
+
+
+# Listener for tracing: every finished provider call becomes a sample, except cache hits and
+# calls the caller abandoned, whose time says nothing about how long the model takes
+def _record_call(call):
+    if not call["cache_hit"] and not call.get("cancelled"):
+        record(call["provider"], call["model"], call["seconds"], not call["error"], call["prompt_tokens"], call["completion_tokens"], call["ttft"])
+
+
+tracing.add_call_listener(_record_call)
+atexit.register(save)
+
+
+# Derived statistics of one model, or None when it has never been called
+def stats(provider, model_name):
+    with _lock:
+        samples = list(_load().get(_key(provider, model_name), []))
+    if not samples:
+        return None
+    succeeded = [sample for sample in samples if sample[1]]
+    seconds = [sample[0] for sample in succeeded]
+    completion_tokens = sum(sample[3] for sample in succeeded)
+    costs = [tracing.cost_usd(model_name, sample[2], sample[3]) for sample in succeeded]
+    return {
+        "provider": provider,
+        "model": model_name,
+        "samples": len(samples),
+        "error_rate": 1 - len(succeeded) / len(samples),
+        "p50_seconds": tracing.percentile(seconds, 0.5),
+        "p95_seconds": tracing.percentile(seconds, 0.95),
+        "tokens_per_second": completion_tokens / sum(seconds) if sum(seconds) else None,
+        "cost_per_call_usd": sum(costs) / len(costs) if costs and None not in costs else None,
+    }
+
+
+# A percentile of the model's successful call times (or times to first token), or None
+# before MIN_SAMPLES such calls are on record
+def latency_percentile(provider, model_name, fraction, first_token=False):
+    with _lock:
+        samples = list(_load().get(_key(provider, model_name), []))
+    if first_token:
+        values = [sample[4] for sample in samples if sample[1] and len(sample) > 4 and sample[4] is not None]
+    else:
+        values = [sample[0] for sample in samples if sample[1]]
+    return tracing.percentile(values, fraction) if len(values) >= MIN_SAMPLES else None
+
+
+def _rank(model_stats):
+    if model_stats is None or model_stats["samples"] < MIN_SAMPLES or model_stats["p95_seconds"] is None:
+        return (0, 0, 0)    # not measured yet: tried first
+    return (1, model_stats["p95_seconds"] * (1 + model_stats["error_rate"]), model_stats["cost_per_call_usd"] or 0)
+
+
+# Roster settings for the architectures run in this context: size, p95_budget and
+# max_error_rate override the MOI_ROSTER_* settings, and exclude lists providers, models
+# or "provider/model" pairs left out altogether.
+#
+#     with model_registry.roster(size=3, exclude=["gemini"]):
+#         the_king(problem)
+@contextlib.contextmanager
+def roster(**settings):
+    token = _roster.set(settings)
+    try:
+        yield
+    finally:
+        _roster.reset(token)
+
+
+# The roster() settings in effect here ({} outside any roster block)
+def roster_settings():
+    return dict(_roster.get() or {})
+
+
+# Choose a roster from candidates, a list of (provider, model_name) pairs. Returns
+# (selected, dropped): the selected pairs in their original order, and a dict of
+# dropped pair -> reason. Settings not given come from roster(), then MOI_ROSTER_*.
+def select(candidates, size=None, p95_budget=None, max_error_rate=None, minimum=1):
+    settings = _roster.get() or {}
+    size = size if size is not None else settings.get("size", ROSTER_SIZE)
+    p95_budget = p95_budget if p95_budget is not None else settings.get("p95_budget", P95_BUDGET)
+    max_error_rate = max_error_rate if max_error_rate is not None else settings.get("max_error_rate", MAX_ERROR_RATE)
+    excluded = set(settings.get("exclude", ()))
+    dropped = {}
+    kept = []
+    for provider, model_name in candidates:
+        model_stats = stats(provider, model_name)
+        measured = model_stats is not None and model_stats["samples"] >= MIN_SAMPLES
+        if excluded & {provider, model_name, _key(provider, model_name)}:
+            dropped[(provider, model_name)] = "excluded from this roster"
+        elif not rate_limit.is_available(provider, model_name):
+            dropped[(provider, model_name)] = "cooling down after repeated failures"
+        elif measured and model_stats["error_rate"] > max_error_rate:
+            dropped[(provider, model_name)] = f"{model_stats['error_rate']:.0%} of recent calls failed"
+        elif measured and p95_budget is not None and model_stats["p95_seconds"] is not None and model_stats["p95_seconds"] > p95_budget:
+            dropped[(provider, model_name)] = f"p95 {model_stats['p95_seconds']:.1f}s over the {p95_budget:g}s budget"
+        else:
+            kept.append((provider, model_name))
+
+    ranked = sorted(kept, key=lambda pair: _rank(stats(*pair)))
+    if size is not None and len(ranked) > size:
+        for pair in ranked[size:]:
+            dropped[pair] = f"not among the {size} fastest"
+        ranked = ranked[:size]
+
+    # Too few left: bring back the best of the dropped ones (never those cooling down or excluded)
+    if len(ranked) < minimum:
+        spare = sorted((pair for pair, reason in dropped.items()
+                        if rate_limit.is_available(*pair) and not excluded & {pair[0], pair[1], _key(*pair)}),
+                       key=lambda pair: _rank(stats(*pair)))
+        for pair in spare[:minimum - len(ranked)]:
+            del dropped[pair]
+            ranked.append(pair)
+
+    chosen = set(ranked)
+    return [pair for pair in candidates if pair in chosen], dropped
+
+
+def print_stats():
+    with _lock:
+        keys = sorted(_load())
+    if not keys:
+        print(f"{YELLOW}No model statistics yet ({STATS_PATH}){RESET_COLOR}")
+        return
+    print(f"{NEON_GREEN}📊 --- Model Statistics (last {WINDOW} calls per model) --- 📊{RESET_COLOR}")
+    print(f"{CYAN}{'model':<56} {'calls':>5} {'errors':>7} {'p50':>8} {'p95':>8} {'tok/s':>7} {'$/call':>9}{RESET_COLOR}")
+    for key in keys:
+        provider, model_name = key.split("/", 1)
+        row = stats(provider, model_name)
+        p50 = "-" if row["p50_seconds"] is None else f"{row['p50_seconds']:.2f}s"
+        p95 = "-" if row["p95_seconds"] is None else f"{row['p95_seconds']:.2f}s"
+        speed = "-" if row["tokens_per_second"] is None else f"{row['tokens_per_second']:.0f}"
+        cost = "-" if row["cost_per_call_usd"] is None else f"${row['cost_per_call_usd']:.4f}"
+        print(f"{key:<56} {row['samples']:>5} {row['error_rate']:>7.0%} {p50:>8} {p95:>8} {speed:>7} {cost:>9}")
+
+
+if __name__ == "__main__":
+    print_stats()
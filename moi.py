@@ -0,0 +1,53 @@
+import argparse
+import sys
+
+from batch_runner import ARCHITECTURES, main as batch_main
+
+# Command-line entry point for every architecture.
+#
+#     python moi.py king                     # solve problem.txt with the King
+#     python moi.py duopoly my_problem.txt --no-stream
+#     python moi.py duopoly my_problem.txt --run-id <id>   # resume a failed run from its journal
+#     python moi.py council                  # Democracy and Duopoly side by side, then the King
+#     python moi.py batch democracy example_problems.txt --concurrency 8
+#     python moi.py sweep all example_problems.txt --rosters rosters.json --workers 8
+#     python moi.py serve --port 8000
+#     python moi.py models                   # learned per-model latency, errors and cost
+#
+# Architectures (and through them the provider SDKs) are imported only once one is
+# selected, so `python moi.py --help` starts instantly.
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "batch":
+        return batch_main(argv[1:])
+    if argv and argv[0] == "sweep":
+        from sweep import main as sweep_main
+        return sweep_main(argv[1:])
+    if argv and argv[0] == "serve":
+        from service import main as serve_main
+        return serve_main(argv[1:])
+    if argv and argv[0] == "models":
+        from model_registry import print_stats
+        return print_stats()
+
+    parser = argparse.ArgumentParser(prog="moi.py", description="Mixture of Idiots: solve a problem with one of the architectures.",
+                                     epilog="Use `moi.py batch --help` to solve a whole problem set, `moi.py sweep --help` for evaluation sweeps, `moi.py serve --help` to run the HTTP service, `moi.py models` for the per-model statistics.")
+    parser.add_argument("architecture", choices=sorted(ARCHITECTURES))
+    parser.add_argument("problem", nargs="?", default="problem.txt", help="file with the problem to solve (default: problem.txt)")
+    parser.add_argument("--no-stream", action="store_true", help="wait for complete answers instead of streaming them")
+    parser.add_argument("--run-id", help="resume this run from its journal instead of starting a new one")
+    args = parser.parse_args(argv)
+
+    module = __import__(ARCHITECTURES[args.architecture][0])
+    stream = module.STREAM_OUTPUT and not args.no_stream
+    if hasattr(module, "GRAPHS"):
+        # The hybrid architectures share one module
+        module.main(args.problem, stream=stream, run_id=args.run_id, architecture=args.architecture)
+    else:
+        module.main(args.problem, stream=stream, run_id=args.run_id)
+
+
+if __name__ == "__main__":
+    main()
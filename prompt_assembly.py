@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+# Prompt layout for calls that share most of their content (the Democracy's solution and
+# voting calls, the Duopoly's oracle turns).
+#
+# Providers with prompt caching reuse the work done on a prompt's prefix when a later
+# request to the same model starts with exactly the same tokens: OpenAI does it by itself
+# for prefixes of 1024 tokens or more, Gemini through explicitly created cached content.
+# So the stable content goes first, byte for byte the same and always in the same order,
+#   system message, PROBLEM, SOLUTION OPTIONS (in roster order), ...
+# and only the call's own task comes last:
+#
+#     prompt = prompt_assembly.assemble([("PROBLEM", problem), ("SOLUTION OPTIONS", options)], task)
+#     call_model(api_type, model_name, prompt, prompt_assembly.SHARED_SYSTEM_MESSAGE)
+#
+# providers.py reads the prefix of an assembled prompt to key OpenAI's cache (so requests
+# with the same prefix are routed to the same cache) and, with MOI_GEMINI_CONTEXT_CACHE=1,
+# to create Gemini cached content for prefixes of at least GEMINI_MIN_CACHED_TOKENS. The
+# share of prompt tokens the providers report as cached is printed at the end of each run.
+
+# One system message for every call of a phase: a different one would break the shared prefix
+SHARED_SYSTEM_MESSAGE = "You are a coder and problem solver expert."
+
+# Gemini cached content is billed for storage, and only allowed from a minimum size on
+GEMINI_CONTEXT_CACHE = os.getenv("MOI_GEMINI_CONTEXT_CACHE", "0").lower() in ("1", "true", "yes", "on")
+GEMINI_CACHE_TTL = int(os.getenv("MOI_GEMINI_CACHE_TTL", "600"))
+GEMINI_MIN_CACHED_TOKENS = 32768
+
+
+# A prompt made of a prefix shared with other calls and the task of this call. It is a
+# plain string everywhere else (response cache, token counts, the run journal).
+class SharedPrompt(str):
+    def __new__(cls, prefix, task=""):
+        prompt = super().__new__(cls, f"{prefix}\n\n{task}" if task else prefix)
+        prompt.prefix = prefix
+        prompt.task = task
+        return prompt
+
+
+def format_sections(sections):
+    return "\n\n".join(f"{title}:\n{text}" for title, text in sections)
+
+
+# sections: (title, text) pairs, most stable first; task: what differs between the calls
+def assemble(sections, task=""):
+    return SharedPrompt(format_sections(sections), task)
+
+
+# The part of a call that other calls share: the system message and the prefix of an
+# assembled prompt, or the first message of a conversation. None for other prompts.
+def shared_prefix(user_message, system_message):
+    if isinstance(user_message, SharedPrompt):
+        prefix = user_message.prefix
+    elif isinstance(user_message, list) and len(user_message) > 1:
+        prefix = user_message[0]["content"]
+    else:
+        return None
+    return f"{system_message or ''}\n\n{prefix}"
+
+
+# A short stable id for the shared prefix (OpenAI's prompt_cache_key), or None
+def prefix_key(user_message, system_message):
+    prefix = shared_prefix(user_message, system_message)
+    if prefix is None:
+        return None
+    return hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:32]
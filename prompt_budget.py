@@ -0,0 +1,178 @@
+import os
+import re
+from functools import lru_cache
+
+# Token-aware assembly of the large final prompts (the King's advisor digest, the Duopoly
+# transcript handed to the summarizer).
+#
+# Tokens are counted locally: with tiktoken when it is installed, otherwise with a
+# per-provider characters-per-token estimate. When the sections of a prompt exceed the
+# budget they are compacted in three steps, each only if still needed:
+#   1. paragraphs repeated across sections (advisors agreeing, oracles quoting each other) are dropped
+#   2. sections are summarized by a cheap model, when a summarize callback is given
+#   3. every section is cut down to its paragraphs most relevant to the problem
+# so the prefill time and cost of the final call stay bounded however many advisors run.
+
+# Token budget for the sections of a final prompt; override with MOI_FINAL_PROMPT_BUDGET
+DEFAULT_FINAL_BUDGET = int(os.getenv("MOI_FINAL_PROMPT_BUDGET", "24000"))
+
+# Rough characters per token when no tokenizer is available
+CHARS_PER_TOKEN = {"openai": 4.0, "mistral": 3.5, "gemini": 4.0}
+
+_WORD = re.compile(r"[a-z0-9_]+")
+
+YELLOW = '\033[93m'
+RESET_COLOR = '\033[0m'
+
+
+# The model's tiktoken encoding, or None to fall back to the character estimate. tiktoken
+# downloads its encodings on first use, so offline (or with a broken cache) loading fails;
+# the failure is cached with the result, so it is paid once per model, not on every count.
+@lru_cache(maxsize=None)
+def _tiktoken_encoding(model_name):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"{YELLOW}⚠️  Could not load the tiktoken encoding for {model_name} ({e}), estimating tokens from characters{RESET_COLOR}")
+        return None
+
+
+def count_tokens(text, provider="openai", model_name="gpt-4o"):
+    if provider == "openai":
+        encoding = _tiktoken_encoding(model_name)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+    return int(len(text) / CHARS_PER_TOKEN.get(provider, 4.0)) + 1
+
+
+def _paragraphs(text):
+    return [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+
+def _words(text):
+    return _WORD.findall(text.lower())
+
+
+def _shingles(words, size=3):
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+# Drop paragraphs that (nearly) repeat a paragraph from an earlier section
+def deduplicate(sections, similarity=0.8):
+    seen = []
+    deduplicated = []
+    dropped = 0
+    for label, text in sections:
+        kept = []
+        for paragraph in _paragraphs(text):
+            shingles = _shingles(_words(paragraph))
+            if len(shingles) > 3 and any(len(shingles & other) / len(shingles | other) >= similarity for other in seen):
+                dropped += 1
+                continue
+            seen.append(shingles)
+            kept.append(paragraph)
+        deduplicated.append((label, "\n\n".join(kept)))
+    return deduplicated, dropped
+
+
+# Keep the paragraphs of text that share the most words with the query, in their original order, within max_tokens
+def truncate_by_relevance(text, query, max_tokens, provider="openai", model_name="gpt-4o"):
+    if count_tokens(text, provider, model_name) <= max_tokens:
+        return text
+    query_words = set(_words(query))
+    paragraphs = _paragraphs(text)
+    # The opening paragraph usually states the answer, so it gets a head start
+    scores = [(len(query_words & set(_words(p))) / (1 + len(_words(p)) ** 0.5) + (1.0 if i == 0 else 0.0), i)
+              for i, p in enumerate(paragraphs)]
+    chosen = set()
+    used = 0
+    for score, i in sorted(scores, key=lambda item: (-item[0], item[1])):
+        cost = count_tokens(paragraphs[i], provider, model_name)
+        if used + cost <= max_tokens:
+            chosen.add(i)
+            used += cost
+    if not chosen:
+        # Even the best paragraph is too long on its own: cut it
+        best = paragraphs[min(scores, key=lambda item: (-item[0], item[1]))[1]]
+        return best[:int(max_tokens * CHARS_PER_TOKEN.get(provider, 4.0))] + " [...]"
+    return "\n\n".join(paragraphs[i] if i in chosen else "[...]" for i in range(len(paragraphs)) if i in chosen or i - 1 in chosen)
+
+
+def _total_tokens(sections, provider, model_name):
+    return sum(count_tokens(text, provider, model_name) for _, text in sections)
+
+
+# Fit (label, text) sections into budget tokens. summarize(text, max_tokens) is an optional
+# cheap-model callback. Returns (sections, stats).
+def fit_sections(sections, budget, query, provider="openai", model_name="gpt-4o", summarize=None):
+    sections = list(sections)
+    stats = {"tokens_before": _total_tokens(sections, provider, model_name), "duplicates_dropped": 0,
+             "summarized": 0, "truncated": 0}
+    if stats["tokens_before"] > budget:
+        sections, stats["duplicates_dropped"] = deduplicate(sections)
+
+    # Share the budget fairly: small sections keep everything, large ones split what is left
+    def shares(current):
+        sizes = {i: count_tokens(text, provider, model_name) for i, (_, text) in enumerate(current)}
+        remaining_budget, remaining = budget, dict(sizes)
+        allowance = {}
+        while remaining:
+            fair = remaining_budget / len(remaining)
+            small = {i: size for i, size in remaining.items() if size <= fair}
+            if not small:
+                allowance.update({i: int(fair) for i in remaining})
+                break
+            for i, size in small.items():
+                allowance[i] = size
+                remaining_budget -= size
+                del remaining[i]
+        return sizes, allowance
+
+    if summarize is not None and _total_tokens(sections, provider, model_name) > budget:
+        from providers import ProviderError
+        sizes, allowance = shares(sections)
+        for i, (label, text) in enumerate(sections):
+            if sizes[i] > allowance[i]:
+                try:
+                    sections[i] = (label, summarize(text, allowance[i]))
+                except ProviderError as e:
+                    # The sections left too long are cut down by relevance below
+                    print(f"{YELLOW}⚠️  Could not summarize the prompt sections ({e}), keeping their most relevant paragraphs instead{RESET_COLOR}")
+                    break
+                stats["summarized"] += 1
+
+    if _total_tokens(sections, provider, model_name) > budget:
+        sizes, allowance = shares(sections)
+        for i, (label, text) in enumerate(sections):
+            if sizes[i] > allowance[i]:
+                sections[i] = (label, truncate_by_relevance(text, query, allowance[i], provider, model_name))
+                stats["truncated"] += 1
+
+    stats["tokens_after"] = _total_tokens(sections, provider, model_name)
+    return sections, stats
+
+
+# A summarize callback for fit_sections that asks a cheap model to condense a section
+def model_summarizer(call_model_fn, api_type, model_name):
+    def summarize(text, max_tokens):
+        prompt = (f"Condense the following text to at most {max_tokens} tokens. Keep every concrete step, number, "
+                  f"code snippet and final answer; drop repetition and filler.\n\nTEXT:\n{text}")
+        return call_model_fn(api_type, model_name, prompt, "You are a precise technical summarizer.")
+    return summarize
+
+
+# The summarize callback configured with MOI_COMPACTION_MODEL=<api_type>:<model>
+# (e.g. openai:gpt-4o-mini), or None to compact by relevance only
+def summarizer_from_env(call_model_fn):
+    setting = os.getenv("MOI_COMPACTION_MODEL")
+    if not setting:
+        return None
+    api_type, model_name = setting.split(":", 1)
+    return model_summarizer(call_model_fn, api_type, model_name)
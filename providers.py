@@ -0,0 +1,667 @@
+import asyncio
+import contextvars
+import datetime
+import importlib.util
+import os
+import threading
+import time
+import weakref
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+import prompt_assembly
+import rate_limit
+import tracing
+from prompt_budget import count_tokens
+from response_cache import cache_from_env, cache_key
+
+# Shared provider layer used by every architecture.
+#
+# Each provider gets one long-lived, pooled HTTP client (keep-alive, HTTP/2 when the
+# `h2` package is installed) that is built on first use and then reused by every call,
+# from every thread. Gemini model handles are cached per model name. Every helper has a
+# sync entry point (call_*), a streaming one (stream_*) and an async one (acall_*).
+# call_model/acall_model answer repeated prompts from the response cache (see
+# response_cache.py) without a remote call, and pace remote calls per provider (rate_limit.py).
+# The provider SDKs (and httpx) are only imported when a provider is first used, so
+# importing this module is cheap and a run pays only for the SDKs it actually calls.
+# Prompts built by prompt_assembly share a prefix with other calls, which is passed on to
+# the providers' prompt caches; the prompt and cached token counts the providers report
+# end up in the call's trace.
+
+load_dotenv()
+
+# API keys
+openai_api_key = os.getenv("OPENAI_API_KEY")
+mistral_api_key = os.getenv("MISTRAL_API_KEY")
+gemini_api_key = os.getenv("GEMINI_API_KEY")
+
+# Point a provider at another endpoint, e.g. the local stand-in server in benchmarks/
+openai_base_url = os.getenv("MOI_OPENAI_BASE_URL")
+mistral_base_url = os.getenv("MOI_MISTRAL_BASE_URL")
+gemini_base_url = os.getenv("MOI_GEMINI_BASE_URL")
+
+CYAN = '\033[96m'
+YELLOW = '\033[93m'
+RESET_COLOR = '\033[0m'
+
+DEFAULT_SYSTEM_MESSAGE = "You are a coder and problem solver expert"
+OPENAI_TEMPERATURE = 0.3
+
+# Connection pool settings, shared by the OpenAI and Mistral clients
+HTTP2 = importlib.util.find_spec("h2") is not None
+MAX_CONNECTIONS = int(os.getenv("MOI_MAX_CONNECTIONS", "32"))
+MAX_KEEPALIVE = int(os.getenv("MOI_MAX_KEEPALIVE", "16"))
+KEEPALIVE_SECONDS = float(os.getenv("MOI_KEEPALIVE_SECONDS", "60"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("MOI_REQUEST_TIMEOUT", "600"))
+
+
+# A provider SDK module, imported on first use
+@lru_cache(maxsize=None)
+def _sdk(module_name):
+    return importlib.import_module(module_name)
+
+
+# httpx pool limits and timeout, built once the first HTTP client is needed
+@lru_cache(maxsize=None)
+def _http_settings():
+    httpx = _sdk("httpx")
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE,
+                          keepalive_expiry=KEEPALIVE_SECONDS)
+    return limits, httpx.Timeout(REQUEST_TIMEOUT_SECONDS, connect=10.0)
+
+_client_lock = threading.Lock()
+_sync_clients = {}
+# Async HTTP connections belong to the event loop that opened them, so async clients are kept per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _build_sync_client(provider):
+    limits, timeout = _http_settings()
+    if provider == "openai":
+        openai = _sdk("openai")
+        http_client = openai.DefaultHttpxClient(http2=HTTP2, limits=limits, timeout=timeout)
+        return openai.OpenAI(api_key=openai_api_key, base_url=openai_base_url, http_client=http_client)
+    if provider == "mistral":
+        http_client = _sdk("httpx").Client(http2=HTTP2, limits=limits, timeout=timeout, follow_redirects=True)
+        return _sdk("mistralai").Mistral(api_key=mistral_api_key, server_url=mistral_base_url, client=http_client)
+    raise ValueError(f"No HTTP client for provider: {provider}")
+
+
+def _build_async_client(provider):
+    limits, timeout = _http_settings()
+    if provider == "openai":
+        openai = _sdk("openai")
+        http_client = openai.DefaultAsyncHttpxClient(http2=HTTP2, limits=limits, timeout=timeout)
+        return openai.AsyncOpenAI(api_key=openai_api_key, base_url=openai_base_url, http_client=http_client)
+    if provider == "mistral":
+        http_client = _sdk("httpx").AsyncClient(http2=HTTP2, limits=limits, timeout=timeout, follow_redirects=True)
+        return _sdk("mistralai").Mistral(api_key=mistral_api_key, server_url=mistral_base_url, async_client=http_client)
+    raise ValueError(f"No HTTP client for provider: {provider}")
+
+
+# The pooled client for a provider, built once per process
+def get_client(provider):
+    client = _sync_clients.get(provider)
+    if client is None:
+        with _client_lock:
+            client = _sync_clients.get(provider)
+            if client is None:
+                client = _sync_clients[provider] = _build_sync_client(provider)
+    return client
+
+
+# The pooled async client for a provider, built once per running event loop
+def get_async_client(provider):
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    if provider not in clients:
+        clients[provider] = _build_async_client(provider)
+    return clients[provider]
+
+
+# Raised by call_model/acall_model once a call has failed for good (after any retries),
+# so a failed advisor is left out instead of its error text being passed on as advice
+class ProviderError(Exception):
+    def __init__(self, api_type, model_name, message):
+        super().__init__(f"{model_name} ({api_type}): {message}")
+        self.api_type = api_type
+        self.model_name = model_name
+
+
+_gemini_configured = False
+
+# genai.configure sets process-wide state, so it runs once, on first use
+def _configure_gemini():
+    global _gemini_configured
+    with _client_lock:
+        if not _gemini_configured:
+            genai = _sdk("google.generativeai")
+            if gemini_base_url:
+                # Custom endpoints are only reachable over REST, not the default gRPC transport
+                genai.configure(api_key=gemini_api_key, transport="rest", client_options={"api_endpoint": gemini_base_url})
+            else:
+                genai.configure(api_key=gemini_api_key)
+            _gemini_configured = True
+
+
+# Cached Gemini model handle
+@lru_cache(maxsize=None)
+def get_gemini_model(model_name):
+    _configure_gemini()
+    return _sdk("google.generativeai").GenerativeModel(model_name)
+
+
+_gemini_cache_lock = threading.Lock()
+_gemini_cached_models = {}   # prefix key -> (model handle or None when caching failed, expiry)
+
+
+# A Gemini model handle bound to cached content holding the system message and the shared
+# prefix, created once per prefix and reused until shortly before it expires. None when the
+# prefix is too small to cache or caching is unavailable for the model.
+def _gemini_cached_model(model_name, user_message, system_message):
+    if count_tokens(user_message.prefix, "gemini", model_name) < prompt_assembly.GEMINI_MIN_CACHED_TOKENS:
+        return None
+    key = (model_name, prompt_assembly.prefix_key(user_message, system_message))
+    with _gemini_cache_lock:
+        model, expires = _gemini_cached_models.get(key, (None, 0))
+        if time.monotonic() < expires:
+            return model
+        _configure_gemini()
+        try:
+            cached_content = _sdk("google.generativeai.caching").CachedContent.create(
+                model=model_name, system_instruction=system_message, contents=[user_message.prefix],
+                ttl=datetime.timedelta(seconds=prompt_assembly.GEMINI_CACHE_TTL))
+            model = _sdk("google.generativeai").GenerativeModel.from_cached_content(cached_content=cached_content)
+        except Exception as e:
+            print(f"{YELLOW}⚠️  No Gemini cached content for {model_name}, sending the whole prompt: {type(e).__name__}: {e}{RESET_COLOR}")
+            model = None
+        # A failure is not retried before the TTL either, so every call does not pay for it
+        _gemini_cached_models[key] = (model, time.monotonic() + prompt_assembly.GEMINI_CACHE_TTL - 30)
+        return model
+
+
+# The Gemini model handle and the prompt to send it
+def _gemini_request(model_name, user_message, system_message):
+    if prompt_assembly.GEMINI_CONTEXT_CACHE and isinstance(user_message, prompt_assembly.SharedPrompt) and user_message.task:
+        model = _gemini_cached_model(model_name, user_message, system_message)
+        if model is not None:
+            return model, user_message.task
+    return get_gemini_model(model_name), _gemini_prompt(user_message, system_message)
+
+
+# Warm up the clients ahead of time, so the first advisor call doesn't pay for construction
+def warm_up(providers=("openai", "mistral", "gemini")):
+    for provider in providers:
+        if provider == "gemini":
+            _configure_gemini()
+        else:
+            get_client(provider)
+
+
+# user_message is either a single prompt or a whole conversation: a list of
+# {"role": "user" | "assistant", "content": ...} messages ending with a user message
+def _conversation(user_message):
+    if isinstance(user_message, str):
+        return [{"role": "user", "content": user_message}]
+    return [{"role": message["role"], "content": message["content"]} for message in user_message]
+
+
+# Prompt and cached token counts reported by the provider for the current call (filled in
+# by the call_*/stream_* helpers when the response carries them, read by call_model)
+_usage = contextvars.ContextVar("provider_usage", default=None)
+
+
+def _report_usage(prompt_tokens, cached_tokens=0):
+    usage = _usage.get()
+    if usage is not None and prompt_tokens:
+        usage.update(prompt_tokens=prompt_tokens, cached_tokens=cached_tokens or 0)
+
+
+def _report_openai_usage(usage):
+    if usage is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        _report_usage(getattr(usage, "prompt_tokens", 0), getattr(details, "cached_tokens", 0))
+
+
+def _report_gemini_usage(response):
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is not None:
+        _report_usage(getattr(metadata, "prompt_token_count", 0), getattr(metadata, "cached_content_token_count", 0))
+
+
+# Extra request fields for OpenAI: calls sharing a prefix carry the same prompt_cache_key,
+# so they are routed to the same prompt cache
+def _openai_extra(user_message, system_message):
+    key = prompt_assembly.prefix_key(user_message, system_message or DEFAULT_SYSTEM_MESSAGE)
+    return {"extra_body": {"prompt_cache_key": key}} if key else {}
+
+
+# The prompt as plain text, for token estimates
+def _prompt_text(user_message):
+    if isinstance(user_message, str):
+        return user_message
+    return "\n".join(message["content"] for message in user_message)
+
+
+def _openai_messages(user_message, system_message):
+    return [{"role": "system", "content": system_message or DEFAULT_SYSTEM_MESSAGE}] + _conversation(user_message)
+
+
+def _mistral_messages(user_message, system_message):
+    messages = []
+    if system_message:
+        messages.append({"role": "system", "content": system_message})
+    return messages + _conversation(user_message)
+
+
+# Gemini takes the system instruction as part of the (first) prompt, and calls the assistant "model"
+def _gemini_prompt(user_message, system_message):
+    if isinstance(user_message, str):
+        if system_message:
+            return f"{system_message}\n\n{user_message}"
+        return user_message
+    contents = [{"role": "model" if message["role"] == "assistant" else "user", "parts": [message["content"]]}
+                for message in user_message]
+    if system_message:
+        contents[0]["parts"] = [f"{system_message}\n\n{contents[0]['parts'][0]}"]
+    return contents
+
+
+def call_openai(model_name, user_message, system_message=DEFAULT_SYSTEM_MESSAGE):
+    response = get_client("openai").chat.completions.create(
+        model=model_name,
+        messages=_openai_messages(user_message, system_message),
+        temperature=OPENAI_TEMPERATURE,
+        **_openai_extra(user_message, system_message),
+    )
+    _report_openai_usage(response.usage)
+    return response.choices[0].message.content.strip()
+
+
+def call_mistral(model_name, user_message, system_message=None):
+    response = get_client("mistral").chat.complete(
+        model=model_name,
+        messages=_mistral_messages(user_message, system_message)
+    )
+    _report_usage(getattr(response.usage, "prompt_tokens", 0))
+    return response.choices[0].message.content.strip()
+
+
+def call_gemini(model_name, user_message, system_message=None):
+    model, prompt = _gemini_request(model_name, user_message, system_message)
+    response = model.generate_content(prompt)
+    _report_gemini_usage(response)
+    return response.text.strip()
+
+
+async def acall_openai(model_name, user_message, system_message=DEFAULT_SYSTEM_MESSAGE):
+    response = await get_async_client("openai").chat.completions.create(
+        model=model_name,
+        messages=_openai_messages(user_message, system_message),
+        temperature=OPENAI_TEMPERATURE,
+        **_openai_extra(user_message, system_message),
+    )
+    _report_openai_usage(response.usage)
+    return response.choices[0].message.content.strip()
+
+
+async def acall_mistral(model_name, user_message, system_message=None):
+    response = await get_async_client("mistral").chat.complete_async(
+        model=model_name,
+        messages=_mistral_messages(user_message, system_message)
+    )
+    _report_usage(getattr(response.usage, "prompt_tokens", 0))
+    return response.choices[0].message.content.strip()
+
+
+# The Gemini SDK's async transport is tied to a single event loop, so the async entry
+# point runs the (cached, thread-safe) sync handle in a worker thread instead
+async def acall_gemini(model_name, user_message, system_message=None):
+    return await asyncio.to_thread(call_gemini, model_name, user_message, system_message)
+
+
+# Seconds between checks of a request's cancel_event while it waits on the network
+CANCEL_POLL_SECONDS = 0.2
+
+# The _CancelWatch of the request running in this context, if it can be cancelled
+_cancel_watch = contextvars.ContextVar("cancel_watch", default=None)
+
+
+# Runs hooks once a request's cancel_event is set, from a watcher thread: a request that
+# lost a race is usually stalled on the network and would not notice the event before its
+# next chunk (or the timeout), so its provider slot is released and its stream closed from here
+class _CancelWatch:
+    def __init__(self, cancel_event):
+        self.cancel_event = cancel_event
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._hooks = []
+        self._fired = False
+        threading.Thread(target=self._watch, name="cancel-watch", daemon=True).start()
+
+    def _watch(self):
+        while not self._done.is_set():
+            if self.cancel_event.wait(CANCEL_POLL_SECONDS):
+                with self._lock:
+                    self._fired = True
+                    hooks, self._hooks = self._hooks, []
+                for hook in hooks:
+                    _run_hook(hook)
+                return
+
+    def add(self, hook):
+        with self._lock:
+            if not self._fired:
+                self._hooks.append(hook)
+                return
+        _run_hook(hook)
+
+    # The request is over; the watcher stops
+    def close(self):
+        self._done.set()
+
+
+def _run_hook(hook):
+    try:
+        hook()
+    except Exception:
+        pass    # closing an already broken stream
+
+
+# The method that closes a provider's stream: the SDK stream itself, or its HTTP response or gRPC call
+def _stream_closer(stream):
+    for owner in (stream, getattr(stream, "response", None), getattr(stream, "_iterator", None)):
+        for name in ("close", "cancel"):
+            method = getattr(owner, name, None)
+            if callable(method):
+                return method
+    return None
+
+
+# Feed chunks to on_token as they arrive; stop reading (and close the stream) once cancel_event is set
+def _consume_stream(chunks, extract_text, on_token, cancel_event):
+    watch = _cancel_watch.get()
+    closer = _stream_closer(chunks)
+    if watch is not None and closer is not None:
+        watch.add(closer)
+    parts = []
+    try:
+        for chunk in chunks:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            text = extract_text(chunk)
+            if text:
+                parts.append(text)
+                if on_token:
+                    on_token(text)
+    except Exception:
+        # The stream was closed under us because the request was cancelled
+        if cancel_event is None or not cancel_event.is_set():
+            raise
+    return "".join(parts).strip()
+
+
+# The last chunk of an OpenAI stream carries the usage (requested with include_usage)
+def _openai_delta(chunk):
+    if getattr(chunk, "usage", None) is not None:
+        _report_openai_usage(chunk.usage)
+    return chunk.choices[0].delta.content if chunk.choices else None
+
+
+def _mistral_delta(event):
+    return event.data.choices[0].delta.content if event.data.choices else None
+
+
+def _gemini_delta(chunk):
+    _report_gemini_usage(chunk)
+    try:
+        return chunk.text
+    except ValueError:
+        # Chunks without text parts (e.g. safety metadata only)
+        return None
+
+
+# Streaming variants of the call_* helpers. on_token(text) receives every chunk as it arrives.
+# Setting cancel_event closes the stream early; whatever arrived so far is returned.
+def stream_openai(model_name, user_message, system_message=DEFAULT_SYSTEM_MESSAGE, on_token=None, cancel_event=None):
+    with get_client("openai").chat.completions.create(
+        model=model_name,
+        messages=_openai_messages(user_message, system_message),
+        temperature=OPENAI_TEMPERATURE,
+        stream=True,
+        stream_options={"include_usage": True},
+        **_openai_extra(user_message, system_message),
+    ) as stream:
+        return _consume_stream(stream, _openai_delta, on_token, cancel_event)
+
+
+def stream_mistral(model_name, user_message, system_message=None, on_token=None, cancel_event=None):
+    with get_client("mistral").chat.stream(
+        model=model_name,
+        messages=_mistral_messages(user_message, system_message)
+    ) as stream:
+        return _consume_stream(stream, _mistral_delta, on_token, cancel_event)
+
+
+def stream_gemini(model_name, user_message, system_message=None, on_token=None, cancel_event=None):
+    model, prompt = _gemini_request(model_name, user_message, system_message)
+    response = model.generate_content(prompt, stream=True)
+    return _consume_stream(response, _gemini_delta, on_token, cancel_event)
+
+
+_cache_lock = threading.Lock()
+_response_cache = None
+_cache_loaded = False
+
+# The process-wide response cache (None when disabled with MOI_CACHE=0)
+def get_response_cache():
+    global _response_cache, _cache_loaded
+    if not _cache_loaded:
+        with _cache_lock:
+            if not _cache_loaded:
+                _response_cache = cache_from_env()
+                _cache_loaded = True
+    return _response_cache
+
+
+def _cache_key_for(api_type, model_name, user_message, system_message):
+    if not isinstance(user_message, str):
+        user_message = _conversation(user_message)
+    if api_type == "openai":
+        return cache_key(api_type, model_name, system_message or DEFAULT_SYSTEM_MESSAGE, user_message, OPENAI_TEMPERATURE)
+    return cache_key(api_type, model_name, system_message, user_message, None)
+
+
+def _cached_response(api_type, model_name, key):
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    response = cache.get(key)
+    if response is not None:
+        print(f"{CYAN}♻️  Cache hit for {model_name} ({api_type}) - skipping the remote call{RESET_COLOR}")
+    return response
+
+
+def _store_response(key, response):
+    cache = get_response_cache()
+    if cache is not None:
+        cache.put(key, response)
+
+
+# Returns True when this call is the trial of a half-open circuit (see rate_limit.CircuitBreaker)
+def _check_circuit(api_type, model_name):
+    allowed = rate_limit.get_breaker(api_type, model_name).allow()
+    if not allowed:
+        raise ProviderError(api_type, model_name, "skipped, cooling down after repeated failures")
+    return allowed == "trial"
+
+
+def _estimated_tokens(api_type, model_name, user_message, system_message):
+    return count_tokens((system_message or "") + _prompt_text(user_message), api_type, model_name)
+
+
+# Decide what to do after a failed attempt: the seconds to wait before retrying, or raise
+# ProviderError. A stream that already showed tokens is not retried, to avoid repeating output.
+def _after_failure(api_type, model_name, error, attempt, tokens_emitted):
+    delay = None if tokens_emitted else rate_limit.retry_delay(api_type, model_name, error, attempt)
+    if delay is None:
+        rate_limit.record_failure(api_type, model_name)
+        raise ProviderError(api_type, model_name, f"{type(error).__name__}: {error}") from error
+    print(f"{YELLOW}⏳ {model_name} ({api_type}) failed with {type(error).__name__}, retry {attempt + 1}/{rate_limit.MAX_RETRIES} in {delay:.1f}s{RESET_COLOR}")
+    return delay
+
+
+# Token counts for the trace: the provider's own when it reported them, local estimates otherwise
+def _trace_response(trace, api_type, model_name, user_message, system_message, response, cache_hit=False, usage=None):
+    usage = usage or {}
+    trace.prompt_tokens = usage.get("prompt_tokens") or _estimated_tokens(api_type, model_name, user_message, system_message)
+    trace.cached_tokens = usage.get("cached_tokens", 0)
+    trace.completion_tokens = count_tokens(response, api_type, model_name)
+    trace.cache_hit = cache_hit
+
+
+_SYNC_CALLS = {"openai": call_openai, "mistral": call_mistral, "gemini": call_gemini}
+_STREAM_CALLS = {"openai": stream_openai, "mistral": stream_mistral, "gemini": stream_gemini}
+_ASYNC_CALLS = {"openai": acall_openai, "mistral": acall_mistral, "gemini": acall_gemini}
+
+
+# Dispatch a call to the right provider; system_message=None means the provider's default,
+# user_message a prompt or a list of conversation messages (see _conversation).
+# Passing on_token and/or cancel_event switches to the provider's streaming API, so the
+# answer can be shown as it is written and the request abandoned part-way through.
+def call_model(api_type, model_name, user_message, system_message=None, on_token=None, cancel_event=None):
+    if api_type not in _SYNC_CALLS:
+        raise ValueError(f"Unknown api type: {api_type}")
+    with tracing.provider_call(api_type, model_name) as trace:
+        return _call_model(trace, api_type, model_name, user_message, system_message, on_token, cancel_event)
+
+
+def _call_model(trace, api_type, model_name, user_message, system_message, on_token, cancel_event):
+    key = _cache_key_for(api_type, model_name, user_message, system_message)
+    response = _cached_response(api_type, model_name, key)
+    if response is not None:
+        _trace_response(trace, api_type, model_name, user_message, system_message, response, cache_hit=True)
+        if on_token:
+            trace.first_token()
+            on_token(response)
+        return response
+
+    trial = _check_circuit(api_type, model_name)
+    estimated_tokens = _estimated_tokens(api_type, model_name, user_message, system_message)
+    usage = {}
+    _usage.set(usage)
+    emitted = []
+    if on_token is not None:
+        def on_token(token, forward=on_token):
+            if not emitted:
+                trace.first_token()
+            emitted.append(token)
+            forward(token)
+
+    attempt = 0
+    while True:
+        trace.retries = attempt
+        watch = _CancelWatch(cancel_event) if cancel_event is not None else None
+        _cancel_watch.set(watch)
+        try:
+            with rate_limit.provider_slot(api_type) as slot:
+                if watch is not None:
+                    watch.add(slot.release)
+                rate_limit.acquire(api_type, model_name, estimated_tokens)
+                if cancel_event is not None and cancel_event.is_set():
+                    # Abandoned while waiting for a slot or the rate limit: never sent
+                    raise ProviderError(api_type, model_name, "cancelled before it was sent")
+                if on_token is None and cancel_event is None:
+                    response = _SYNC_CALLS[api_type](model_name, user_message, system_message)
+                else:
+                    response = _STREAM_CALLS[api_type](model_name, user_message, system_message, on_token=on_token, cancel_event=cancel_event)
+            break
+        except Exception as e:
+            if cancel_event is not None and cancel_event.is_set():
+                # Abandoned on purpose: not a provider failure, and not worth a retry
+                trace.cancelled = True
+                if trial:
+                    rate_limit.release_trial(api_type, model_name)
+                raise ProviderError(api_type, model_name, "cancelled") from e
+            delay = _after_failure(api_type, model_name, e, attempt, bool(emitted))
+            if cancel_event is not None:
+                if cancel_event.wait(delay):
+                    trace.cancelled = True
+                    if trial:
+                        rate_limit.release_trial(api_type, model_name)
+                    raise ProviderError(api_type, model_name, "cancelled while waiting to retry") from e
+            else:
+                time.sleep(delay)
+            attempt += 1
+        finally:
+            if watch is not None:
+                watch.close()
+
+    rate_limit.record_success(api_type, model_name)
+    _trace_response(trace, api_type, model_name, user_message, system_message, response, usage=usage)
+    if cancel_event is not None and cancel_event.is_set():
+        # A cut-off answer is never cached
+        trace.cancelled = True
+        return response
+    _store_response(key, response)
+    return response
+
+
+async def acall_model(api_type, model_name, user_message, system_message=None):
+    if api_type not in _ASYNC_CALLS:
+        raise ValueError(f"Unknown api type: {api_type}")
+    with tracing.provider_call(api_type, model_name) as trace:
+        return await _acall_model(trace, api_type, model_name, user_message, system_message)
+
+
+# Take a provider slot from a worker thread. A task cancelled while it waits does not stop
+# that thread, so the slot it goes on to take is handed back as soon as it has it.
+async def _enter_slot(slot):
+    entering = asyncio.ensure_future(asyncio.to_thread(slot.__enter__))
+    try:
+        await asyncio.shield(entering)
+    except asyncio.CancelledError:
+        entering.add_done_callback(lambda _: slot.release())
+        raise
+
+
+async def _acall_model(trace, api_type, model_name, user_message, system_message):
+    key = _cache_key_for(api_type, model_name, user_message, system_message)
+    response = _cached_response(api_type, model_name, key)
+    if response is not None:
+        _trace_response(trace, api_type, model_name, user_message, system_message, response, cache_hit=True)
+        return response
+
+    trial = _check_circuit(api_type, model_name)
+    estimated_tokens = _estimated_tokens(api_type, model_name, user_message, system_message)
+    usage = {}
+    _usage.set(usage)
+    attempt = 0
+    try:
+        while True:
+            trace.retries = attempt
+            slot = rate_limit.provider_slot(api_type)
+            await _enter_slot(slot)
+            try:
+                await asyncio.to_thread(rate_limit.acquire, api_type, model_name, estimated_tokens)
+                response = await _ASYNC_CALLS[api_type](model_name, user_message, system_message)
+                break
+            except Exception as e:
+                delay = _after_failure(api_type, model_name, e, attempt, False)
+            finally:
+                slot.__exit__(None, None, None)
+            await asyncio.sleep(delay)
+            attempt += 1
+    except asyncio.CancelledError:
+        # The caller gave up (e.g. a service client went away): neither a success nor a failure
+        trace.cancelled = True
+        if trial:
+            rate_limit.release_trial(api_type, model_name)
+        raise
+
+    rate_limit.record_success(api_type, model_name)
+    _trace_response(trace, api_type, model_name, user_message, system_message, response, usage=usage)
+    _store_response(key, response)
+    return response
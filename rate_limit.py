@@ -0,0 +1,312 @@
+import os
+import random
+import threading
+import time
+
+# Rate limiting, retries and circuit breaking for provider calls.
+#
+# Pacing: every remote call takes one request from its model's request bucket and its
+# estimated token count from the model's token bucket before it is sent. Buckets refill
+# at the provider's requests/tokens-per-minute quota and allow short bursts, so
+# concurrent advisors go out together while sustained traffic stays under the quota.
+# Calls only wait when the quota is actually exhausted - there is no fixed sleep.
+#
+# Adaptation: a 429 halves the model's request rate and pauses its buckets for the
+# Retry-After period; every success then wins back a little of the configured rate.
+#
+# Retries: transient failures (429, 5xx, timeouts, dropped connections) are retried with
+# exponential backoff and full jitter, honouring Retry-After when the provider sends it.
+#
+# Circuit breaker: a model that keeps failing is taken out of the rosters for a
+# cool-down period, then given one trial call before it is trusted again.
+
+# Requests per minute, burst size and tokens per minute per provider;
+# override with e.g. MOI_RPM_MISTRAL=120, MOI_BURST_MISTRAL=10, MOI_TPM_OPENAI=800000
+DEFAULT_RPM = {"openai": 500, "mistral": 60, "gemini": 60}
+DEFAULT_BURST = {"openai": 20, "mistral": 5, "gemini": 10}
+DEFAULT_TPM = {"openai": 300000, "mistral": 500000, "gemini": 1000000}
+
+MAX_RETRIES = int(os.getenv("MOI_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("MOI_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.getenv("MOI_BACKOFF_MAX", "60"))
+CIRCUIT_FAILURES = int(os.getenv("MOI_CIRCUIT_FAILURES", "3"))
+CIRCUIT_COOLDOWN = float(os.getenv("MOI_CIRCUIT_COOLDOWN", "300"))
+
+# Exception class names (across the OpenAI, Mistral, Google and httpx SDKs) worth retrying
+_TRANSIENT_ERRORS = {
+    "APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError",
+    "TimeoutException", "ConnectTimeout", "ReadTimeout", "WriteTimeout", "PoolTimeout",
+    "ConnectError", "ReadError", "RemoteProtocolError",
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "TooManyRequests",
+}
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate_per_second = rate_per_second
+        self.configured_rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    # Take `amount` tokens, sleeping until they are available; returns the seconds spent waiting
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= amount:
+                        self._tokens -= amount
+                        return waited
+                    delay = (amount - self._tokens) / self.rate_per_second
+            time.sleep(delay)
+            waited += delay
+
+    # Hold every caller back for `seconds` (the provider asked us to, e.g. with Retry-After)
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    # Multiplicative decrease after a 429 ...
+    def slow_down(self, factor=0.5, floor=0.05):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate_per_second = max(self.configured_rate * floor, self.rate_per_second * factor)
+
+    # ... and additive recovery after each success
+    def recover(self, step=0.05):
+        with self._lock:
+            if self.rate_per_second < self.configured_rate:
+                self._refill(time.monotonic())
+                self.rate_per_second = min(self.configured_rate, self.rate_per_second + self.configured_rate * step)
+
+
+def _provider_setting(name, provider, defaults, fallback):
+    return float(os.getenv(f"MOI_{name}_{provider.upper()}", defaults.get(provider, fallback)))
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+# The (requests, tokens) buckets of a model, sized from its provider's quota
+def get_buckets(provider, model_name=None):
+    key = (provider, model_name)
+    with _buckets_lock:
+        if key not in _buckets:
+            rpm = _provider_setting("RPM", provider, DEFAULT_RPM, 60)
+            burst = _provider_setting("BURST", provider, DEFAULT_BURST, 5)
+            tpm = _provider_setting("TPM", provider, DEFAULT_TPM, 100000)
+            _buckets[key] = (TokenBucket(rpm / 60.0, burst), TokenBucket(tpm / 60.0, tpm))
+        return _buckets[key]
+
+
+# Wait for a request slot (and room for estimated_tokens) with the model; returns the seconds spent waiting
+def acquire(provider, model_name=None, estimated_tokens=0):
+    requests_bucket, tokens_bucket = get_buckets(provider, model_name)
+    waited = requests_bucket.acquire()
+    if estimated_tokens:
+        waited += tokens_bucket.acquire(estimated_tokens)
+    return waited
+
+
+# In-flight request caps per provider, on top of the pacing above. Unset means unlimited;
+# set with MOI_MAX_INFLIGHT_<PROVIDER> or set_concurrency_limits() (the batch runner does).
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def set_concurrency_limits(limits):
+    with _inflight_lock:
+        for provider, limit in limits.items():
+            _inflight[provider] = threading.BoundedSemaphore(limit) if limit else None
+
+
+def _inflight_semaphore(provider):
+    with _inflight_lock:
+        if provider not in _inflight:
+            limit = os.getenv(f"MOI_MAX_INFLIGHT_{provider.upper()}")
+            _inflight[provider] = threading.BoundedSemaphore(int(limit)) if limit else None
+        return _inflight[provider]
+
+
+# Hold one of the provider's in-flight slots for the duration of a request. release() frees
+# it early (e.g. for a cancelled request whose thread is still stuck on the network).
+class provider_slot:
+    def __init__(self, provider):
+        self._semaphore = _inflight_semaphore(provider)
+        self._lock = threading.Lock()
+        self._held = False
+
+    def __enter__(self):
+        if self._semaphore is not None:
+            self._semaphore.acquire()
+            self._held = True
+        return self
+
+    def release(self):
+        with self._lock:
+            held, self._held = self._held, False
+        if held:
+            self._semaphore.release()
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+
+# HTTP status of a provider exception, when it carries one
+def error_status(error):
+    for attribute in ("status_code", "code", "status"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+        value = getattr(value, "value", None)     # gRPC/HTTP status enums
+        if isinstance(value, int) and value >= 100:
+            return value
+    return None
+
+
+def is_rate_limited(error):
+    return error_status(error) == 429 or type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+def is_transient(error):
+    status = error_status(error)
+    if status is not None:
+        return status in (408, 409, 425, 429) or status >= 500
+    return type(error).__name__ in _TRANSIENT_ERRORS
+
+
+# Seconds the provider asked us to wait (Retry-After / retry-after-ms headers), if any
+def retry_after_seconds(error):
+    response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None     # an HTTP date; fall back to backoff
+    return None
+
+
+# Exponential backoff with full jitter for the given (zero-based) attempt
+def backoff_seconds(attempt):
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+# Seconds to wait before retrying after `error`, or None when it should not be retried
+def retry_delay(provider, model_name, error, attempt):
+    if attempt >= MAX_RETRIES or not is_transient(error):
+        return None
+    delay = retry_after_seconds(error)
+    if is_rate_limited(error):
+        requests_bucket, tokens_bucket = get_buckets(provider, model_name)
+        requests_bucket.slow_down()
+        if delay is not None:
+            requests_bucket.pause(delay)
+            tokens_bucket.pause(delay)
+    return delay if delay is not None else backoff_seconds(attempt)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=CIRCUIT_FAILURES, cooldown=CIRCUIT_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    # closed: healthy; open: cooling down, skip the model; half-open: one trial call allowed
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return "open"
+            return "half-open"
+
+    # True, "trial" for the single call let through while half-open, or False
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return "trial"
+
+    # The trial call ended without showing whether the model recovered (it was cancelled):
+    # the next call becomes the trial
+    def release_trial(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider, model_name):
+    with _breakers_lock:
+        key = (provider, model_name)
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker()
+        return _breakers[key]
+
+
+# False while the model's circuit is open (it is cooling down after repeated failures)
+def is_available(provider, model_name):
+    return get_breaker(provider, model_name).state() != "open"
+
+
+def record_success(provider, model_name):
+    get_breaker(provider, model_name).record_success()
+    get_buckets(provider, model_name)[0].recover()
+
+
+def record_failure(provider, model_name):
+    get_breaker(provider, model_name).record_failure()
+
+
+def release_trial(provider, model_name):
+    get_breaker(provider, model_name).release_trial()
+
+
+# Forget all pacing, concurrency and circuit state (between benchmark runs in one process)
+def reset():
+    with _buckets_lock:
+        _buckets.clear()
+    with _breakers_lock:
+        _breakers.clear()
+    with _inflight_lock:
+        _inflight.clear()
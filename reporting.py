@@ -0,0 +1,284 @@
+import html
+import json
+import os
+import pathlib
+import re
+import secrets
+import string
+import threading
+import time
+import webbrowser
+from datetime import datetime
+
+# HTML reports shared by all architectures.
+#
+# generate_html_response writes a run's final answer to MOI_REPORT_DIR (named after the
+# run id, so a resumed run rewrites its own report); with live=True it returns a LiveReport
+# that rewrites the page as the answer streams in. write_batch_report puts a whole batch
+# on one page: every problem with its phase timings, the intermediate answers from its run
+# journal (advisors, solutions, ballots, oracle turns) and the final answer.
+#
+# Answers are rendered as Markdown; HTML inside them is escaped, never interpreted, and
+# only http(s), mailto and in-page links are kept. The browser is opened only with
+# MOI_OPEN_BROWSER=1, so headless servers and batches just get the files.
+
+REPORT_DIR = os.getenv("MOI_REPORT_DIR", "reports")
+OPEN_BROWSER = os.getenv("MOI_OPEN_BROWSER", "0").lower() in ("1", "true", "yes", "on")
+LIVE_REFRESH_SECONDS = 2
+
+CYAN = '\033[96m'
+RESET_COLOR = '\033[0m'
+
+# How the run journal's intermediate results are titled in a batch report
+STEP_TITLES = {"advice": "Advisors' answers", "solution": "Solutions", "vote": "Ballots",
+               "turn": "Oracle turns", "node": "Graph nodes"}
+
+# Templates are parsed once, at import; the values put into them are escaped or rendered first
+_PAGE = string.Template('''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    $refresh
+    <title>✨ $title ✨</title>
+    <style>
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif, "Apple Color Emoji", "Segoe UI Emoji", "Segoe UI Symbol";
+            background-color: #f0f2f5; /* Light grey background */
+            margin: 0;
+            padding: 20px;
+            color: #1c1e21; /* Darker grey text */
+            display: flex;
+            justify-content: center;
+            align-items: flex-start; /* Align to top if content is short */
+            min-height: 100vh;
+        }
+        .container {
+            background-color: #ffffff; /* White container background */
+            border-radius: 12px; /* More rounded corners */
+            padding: 30px;
+            box-shadow: 0 8px 24px rgba(0,0,0,0.1); /* Softer, more prominent shadow */
+            width: 100%;
+            max-width: $width;
+            border: 1px solid #e0e0e0; /* Light border */
+        }
+        .answer { line-height: 1.6; overflow-wrap: anywhere; }
+        pre {
+            background-color: #282c34; /* Dark background for code block */
+            color: #abb2bf; /* Light text for code block */
+            border-radius: 8px; /* Rounded corners for code block */
+            padding: 20px;
+            font-family: 'Cascadia Code', 'Consolas', 'SFMono-Regular', 'Menlo', 'Courier New', monospace;
+            overflow: auto;
+            white-space: pre-wrap;
+            word-wrap: break-word;
+            font-size: 0.95em;
+        }
+        code { font-family: 'Cascadia Code', 'Consolas', 'SFMono-Regular', 'Menlo', 'Courier New', monospace; }
+        table { border-collapse: collapse; margin: 10px 0 20px; }
+        th, td { border: 1px solid #e0e0e0; padding: 6px 12px; text-align: left; }
+        th { background-color: #f7f8fa; }
+        td.number { text-align: right; }
+        .failed { color: #c0392b; }
+        details { margin: 8px 0; }
+        summary { cursor: pointer; font-weight: 600; }
+        section.problem { border-top: 1px solid #e0e0e0; margin-top: 30px; padding-top: 10px; }
+        h1 {
+            color: #007bff; /* Blue accent for heading */
+            text-align: center;
+            margin-bottom: 25px;
+            font-size: 2em;
+        }
+        p.intro {
+            line-height: 1.6;
+            color: #4b5563; /* Slightly lighter text for intro */
+            font-size: 1.1em;
+            text-align: center;
+            margin-bottom: 20px;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>✨ $title ✨</h1>
+        <p class="intro">$intro</p>
+        $body
+    </div>
+</body>
+</html>
+''')
+
+_REFRESH = string.Template('<meta http-equiv="refresh" content="$seconds">')
+_INTRO = string.Template('📄 This report presents the findings from the Mixture of Models (MOM) system, utilizing the <strong>$architecture</strong> architecture.')
+_BATCH_INTRO = string.Template('📦 $count problems solved with the <strong>$architecture</strong> architecture: $solved solved, $failed failed. Generated $generated.')
+_ANSWER = string.Template('<div class="answer">$answer</div>')
+_TABLE = string.Template('<table><tr>$header</tr>$rows</table>')
+_PROBLEM = string.Template('''<section class="problem" id="$anchor">
+    <h2>$title</h2>
+    <details><summary>Problem</summary><div class="answer">$problem</div></details>
+    $phases
+    $steps
+    <h3>$outcome</h3>
+    $answer
+</section>''')
+_STEP = string.Template('<details><summary>$title ($count)</summary>$items</details>')
+_ITEM = string.Template('<h4>$key</h4><div class="answer">$value</div>')
+
+# Link targets that survive rendering; anything else (javascript:, data:, ...) points nowhere
+_SAFE_LINK = re.compile(r'(https?://|mailto:|#)', re.IGNORECASE)
+
+_markdown_lock = threading.Lock()
+_markdown = None
+
+
+# Point the links and images of a rendered answer that are not http(s), mailto or in-page
+# nowhere. Only the <a> and <img> elements Markdown built are touched, so code and prose
+# that merely mention href="..." are left as written.
+def _sanitize_links(root, amp_substitute):
+    for tag, attribute in (("a", "href"), ("img", "src")):
+        for element in root.iter(tag):
+            # Markdown stores e-mail autolinks as character references behind a placeholder for "&"
+            target = html.unescape(element.get(attribute, "").replace(amp_substitute, "&")).strip()
+            if not _SAFE_LINK.match(target):
+                element.set(attribute, "#")
+
+
+# One Markdown converter, set up on first use: the extensions load once, raw HTML in an
+# answer is turned back into text, and links are sanitized once inline parsing has built them
+def _markdown_converter():
+    global _markdown
+    if _markdown is None:
+        import markdown
+        from markdown.treeprocessors import Treeprocessor
+
+        class LinkSanitizer(Treeprocessor):
+            def run(self, root):
+                _sanitize_links(root, markdown.util.AMP_SUBSTITUTE)
+
+        converter = markdown.Markdown(extensions=["fenced_code", "tables"])
+        converter.preprocessors.deregister("html_block")
+        converter.inlinePatterns.deregister("html")
+        converter.treeprocessors.register(LinkSanitizer(converter), "sanitize_links", 1)
+        _markdown = converter
+    return _markdown
+
+
+def render_markdown(text):
+    try:
+        with _markdown_lock:
+            return _markdown_converter().reset().convert(text)
+    except ImportError:
+        return f"<pre>{html.escape(text)}</pre>"
+
+
+def _page(title, intro, body, refresh_seconds=None, width="800px"):
+    refresh = _REFRESH.substitute(seconds=refresh_seconds) if refresh_seconds else ''
+    return _PAGE.substitute(refresh=refresh, title=html.escape(title), intro=intro, body=body, width=width)
+
+
+# Build the report page; refresh_seconds makes the browser reload it while a live report is being written
+def render_html(full_response, architecture_name, refresh_seconds=None):
+    return _page("AI Response Report", _INTRO.substitute(architecture=html.escape(architecture_name)),
+                 _ANSWER.substitute(answer=render_markdown(full_response)), refresh_seconds)
+
+
+# Write a file in one step, so a refreshing browser never sees half a page
+def _write_atomically(path, content):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as temp_file:
+        temp_file.write(content)
+    os.replace(temp_path, path)
+
+
+# <MOI_REPORT_DIR>/<run id>.html, or a new timestamped name for runs without a journal
+def report_path(architecture_name, run_id=None):
+    slug = re.sub(r"[^a-z0-9]+", "-", architecture_name.lower()).strip("-")
+    name = run_id or f"{slug}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+    return os.path.join(REPORT_DIR, f"{name}.html")
+
+
+def _publish(path, open_browser):
+    print(f"{CYAN}📄 Report written to {path}{RESET_COLOR}")
+    if open_browser:
+        webbrowser.open(pathlib.Path(path).resolve().as_uri())
+
+
+# A report page that is rewritten as the answer arrives; the page reloads itself until finish()
+class LiveReport:
+    def __init__(self, path, architecture_name, min_interval=0.5):
+        self.path = path
+        self.architecture_name = architecture_name
+        self.min_interval = min_interval
+        self._last_write = 0.0
+
+    def update(self, text, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_write < self.min_interval:
+            return
+        self._last_write = now
+        _write_atomically(self.path, render_html(text, self.architecture_name, refresh_seconds=LIVE_REFRESH_SECONDS))
+
+    def finish(self, text):
+        _write_atomically(self.path, render_html(text, self.architecture_name))
+
+
+# Write the report of one run; returns its path, or with live=True a LiveReport to update
+def generate_html_response(full_response, architecture_name, live=False, run_id=None, open_browser=OPEN_BROWSER):
+    path = report_path(architecture_name, run_id)
+    if live:
+        report = LiveReport(path, architecture_name)
+        report.update(full_response, force=True)
+        _publish(path, open_browser)
+        return report
+    _write_atomically(path, render_html(full_response, architecture_name))
+    _publish(path, open_browser)
+    return path
+
+
+def _seconds(value):
+    return "-" if value is None else f"{value:.1f}s"
+
+
+def _render_value(value):
+    if isinstance(value, str):
+        return render_markdown(value)
+    if isinstance(value, dict):
+        return "".join(_ITEM.substitute(key=html.escape(str(key)), value=_render_value(item)) for key, item in value.items())
+    return f"<pre>{html.escape(json.dumps(value, ensure_ascii=False, indent=2))}</pre>"
+
+
+def _problem_section(number, record):
+    phases = record.get("phases") or []
+    phase_table = _TABLE.substitute(
+        header="<th>phase</th><th>time</th>",
+        rows="".join(f'<tr><td>{html.escape(name)}</td><td class="number">{_seconds(seconds)}</td></tr>' for name, seconds in phases),
+    ) if phases else ""
+    steps = "".join(_STEP.substitute(title=html.escape(STEP_TITLES.get(phase, phase.title())), count=len(entries),
+                                     items=_render_value(entries))
+                    for phase, entries in (record.get("steps") or {}).items() if entries)
+    if record.get("error"):
+        outcome, answer = '<span class="failed">❌ Failed</span>', f'<pre>{html.escape(record["error"])}</pre>'
+    else:
+        outcome, answer = f"✅ Answer ({_seconds(record.get('seconds'))})", _ANSWER.substitute(answer=render_markdown(record.get("answer", "")))
+    return _PROBLEM.substitute(anchor=f"problem-{number}", title=html.escape(f"{number}. {record['title']}"),
+                               problem=render_markdown(record.get("problem", "")), phases=phase_table, steps=steps,
+                               outcome=outcome, answer=answer)
+
+
+# One page for a whole batch: an overview table, then every problem (see batch_runner)
+def write_batch_report(architecture_name, records, path, open_browser=OPEN_BROWSER):
+    failed = sum(1 for record in records if record.get("error"))
+    overview = _TABLE.substitute(
+        header="<th>#</th><th>problem</th><th>result</th><th>time</th>",
+        rows="".join(f'<tr><td class="number">{number}</td><td><a href="#problem-{number}">{html.escape(record["title"])}</a></td>'
+                     f'<td>{"<span class=failed>failed</span>" if record.get("error") else "solved"}</td>'
+                     f'<td class="number">{_seconds(record.get("seconds"))}</td></tr>'
+                     for number, record in enumerate(records, 1)),
+    )
+    sections = "".join(_problem_section(number, record) for number, record in enumerate(records, 1))
+    intro = _BATCH_INTRO.substitute(count=len(records), architecture=html.escape(architecture_name), solved=len(records) - failed,
+                                    failed=failed, generated=datetime.now().strftime("%Y-%m-%d %H:%M"))
+    _write_atomically(path, _page("Batch Report", intro, overview + sections, width="1000px"))
+    _publish(path, open_browser)
+    return path
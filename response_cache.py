@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Content-addressed cache for provider responses.
+#
+# A response is keyed on (provider, model, system message, prompt, temperature), so the
+# same advisor prompt sent by King, Duopoly or Democracy - in this run or a previous one -
+# is answered locally. There are two tiers: an in-memory LRU in front of an on-disk
+# SQLite table. Both expire entries after a TTL and evict the least recently used
+# entries once they are full.
+#
+# Several processes (sweep workers, several service instances) can share the SQLite file:
+# it runs in WAL mode with a busy timeout, reads never write (the recency of disk hits is
+# recorded in batches, with the next put or every TOUCH_BATCH hits), and a database error
+# only costs the cache hit or the stored response, never the call.
+
+DEFAULT_CACHE_DIR = ".moi_cache"
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MEMORY_ENTRIES = 256
+DEFAULT_DISK_ENTRIES = 10000
+# Seconds a process waits for another one's write lock, and disk hits whose recency is written at once
+BUSY_TIMEOUT = 30
+TOUCH_BATCH = 64
+
+YELLOW = '\033[93m'
+RESET_COLOR = '\033[0m'
+
+
+def cache_key(provider, model_name, system_message, prompt, temperature):
+    payload = json.dumps([provider, model_name, system_message, prompt, temperature], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=None, ttl=DEFAULT_TTL, memory_entries=DEFAULT_MEMORY_ENTRIES, disk_entries=DEFAULT_DISK_ENTRIES):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()    # key -> (stored_at, response)
+        self._lock = threading.Lock()
+        self._db = None
+        self._touched = {}              # key -> used_at of disk hits not yet written back
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=BUSY_TIMEOUT)
+            self._db.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT * 1000}")
+            self._db.execute("PRAGMA journal_mode = WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, stored_at REAL, used_at REAL, response TEXT)")
+            self._db.commit()
+
+    def _expired(self, stored_at, now):
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT stored_at, response FROM responses WHERE key = ?", (key,)).fetchone()
+                except sqlite3.Error as e:
+                    print(f"{YELLOW}⚠️  Response cache read failed, calling the provider instead: {e}{RESET_COLOR}")
+                    row = None
+                # Expired rows are left for the next prune
+                if row is not None and not self._expired(row[0], now):
+                    self._touched[key] = now
+                    if len(self._touched) >= TOUCH_BATCH:
+                        self._write_touches()
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[1]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, response)
+            if self._db is not None:
+                self._touched.pop(key, None)
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO responses (key, stored_at, used_at, response) VALUES (?, ?, ?, ?)",
+                                     (key, now, now, response))
+                    self._write_touches(commit=False)
+                    self._prune_disk(now)
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    self._rollback()
+                    print(f"{YELLOW}⚠️  Could not store the response in the cache: {e}{RESET_COLOR}")
+
+    # Write back the recency of the disk hits since the last write (called with the lock held)
+    def _write_touches(self, commit=True):
+        touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        try:
+            self._db.executemany("UPDATE responses SET used_at = ? WHERE key = ?", [(used_at, key) for key, used_at in touched.items()])
+            if commit:
+                self._db.commit()
+        except sqlite3.Error:
+            if commit:
+                self._rollback()    # recency is only a hint for eviction; losing it is harmless
+            else:
+                raise
+
+    def _rollback(self):
+        try:
+            self._db.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _remember(self, key, stored_at, response):
+        self._memory[key] = (stored_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self, now):
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE stored_at < ?", (now - self.ttl,))
+        self._db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                         (self.disk_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+
+# Build the process-wide cache from the environment:
+#   MOI_CACHE=0                 disables caching
+#   MOI_CACHE_DIR               where the SQLite file lives (default .moi_cache)
+#   MOI_CACHE_TTL               seconds an entry stays valid (default 7 days)
+#   MOI_CACHE_MEMORY_ENTRIES / MOI_CACHE_DISK_ENTRIES    tier sizes
+def cache_from_env():
+    if os.getenv("MOI_CACHE", "1").lower() in ("0", "false", "no", "off"):
+        return None
+    cache_dir = os.getenv("MOI_CACHE_DIR", DEFAULT_CACHE_DIR)
+    try:
+        return ResponseCache(
+            path=os.path.join(cache_dir, "responses.sqlite3"),
+            ttl=float(os.getenv("MOI_CACHE_TTL", DEFAULT_TTL)),
+            memory_entries=int(os.getenv("MOI_CACHE_MEMORY_ENTRIES", DEFAULT_MEMORY_ENTRIES)),
+            disk_entries=int(os.getenv("MOI_CACHE_DISK_ENTRIES", DEFAULT_DISK_ENTRIES)),
+        )
+    except (OSError, sqlite3.Error) as e:
+        print(f"{YELLOW}⚠️  Response cache unavailable, calls are not cached: {e}{RESET_COLOR}")
+        return None
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import secrets
+import threading
+from datetime import datetime
+
+# Append-only journal of a run's intermediate results, so a failed run can be resumed
+# instead of repeating every paid call.
+#
+# Each run writes <MOI_JOURNAL_DIR>/<run id>.jsonl: a header line naming the architecture
+# and the problem, then one line per result as it arrives (an advisor's answer, an oracle
+# turn, a solution, a ballot) and one line per completed phase. Running again with the
+# same run id replays what is recorded and only makes the calls still missing:
+#
+#     python moi.py duopoly problem.txt --run-id duopoly-20250101-120000-1a2b3c
+#
+#     journal = run_journal.open_run("king", problem, run_id)
+#     advice = journal.entries("advice")             # {model: answer} recorded so far
+#     journal.record("advice", model_key, answer)
+#     journal.complete("advisors")                    # the phase will not run again
+#     journal.completed("advisors")                   # -> True / the value passed
+
+JOURNAL_ENABLED = os.getenv("MOI_JOURNAL", "1").lower() not in ("0", "false", "no", "off")
+JOURNAL_DIR = os.getenv("MOI_JOURNAL_DIR", "runs")
+
+PINK = '\033[95m'
+CYAN = '\033[96m'
+YELLOW = '\033[93m'
+NEON_GREEN = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+_DONE = "_done"
+
+
+def _problem_hash(problem):
+    return hashlib.sha256(problem.encode("utf-8")).hexdigest()
+
+
+def new_run_id(architecture):
+    return f"{architecture}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+
+
+class RunJournal:
+    def __init__(self, path, run_id, architecture, problem):
+        self.path = path
+        self.run_id = run_id
+        self._lock = threading.Lock()
+        self._entries = {}      # phase -> {key: value}, in recording order
+        header = {"run_id": run_id, "architecture": architecture, "problem_sha256": _problem_hash(problem)}
+        if os.path.exists(path):
+            self._load(header)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._append(dict(header, started=datetime.now().isoformat(timespec="seconds")))
+        self.resumed = bool(self._entries)
+
+    def _load(self, header):
+        with open(self.path, 'r', encoding='utf-8') as infile:
+            content = infile.read()
+        if content and not content.endswith("\n"):
+            # The run died mid-line: later entries start on a line of their own
+            with open(self.path, 'a', encoding='utf-8') as outfile:
+                outfile.write("\n")
+        recorded = None
+        for line in content.splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue    # a line cut off when the run died
+            if not isinstance(entry, dict):
+                continue
+            if recorded is None:
+                if "phase" in entry:
+                    continue    # results are only trusted after the header naming their problem
+                recorded = entry
+                if recorded.get("architecture") != header["architecture"] or recorded.get("problem_sha256") != header["problem_sha256"]:
+                    raise ValueError(f"Run {self.run_id} ({self.path}) is a {recorded.get('architecture')} run of a different problem")
+            elif "phase" in entry:
+                self._entries.setdefault(entry["phase"], {})[entry["key"]] = entry["value"]
+        if recorded is None:
+            # Nothing readable yet (the header itself was cut off): the run starts afresh
+            self._append(dict(header, started=datetime.now().isoformat(timespec="seconds")))
+
+    def _append(self, entry):
+        with open(self.path, 'a', encoding='utf-8') as outfile:
+            outfile.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            outfile.flush()
+            os.fsync(outfile.fileno())
+
+    def record(self, phase, key, value):
+        with self._lock:
+            self._entries.setdefault(phase, {})[key] = value
+            self._append({"phase": phase, "key": key, "value": value})
+
+    def entries(self, phase):
+        with self._lock:
+            return dict(self._entries.get(phase, {}))
+
+    # Every recorded result, {phase: {key: value}}, without the phase completion markers
+    def results(self):
+        with self._lock:
+            return {phase: dict(entries) for phase, entries in self._entries.items() if phase != _DONE}
+
+    def complete(self, phase, value=True):
+        self.record(_DONE, phase, value)
+
+    # The value the phase was completed with (which may be empty or falsy), or None while it
+    # is not complete: test the result against None
+    def completed(self, phase):
+        with self._lock:
+            return self._entries.get(_DONE, {}).get(phase)
+
+
+# The journal of run_id (a new run when run_id is None), or None when journaling is off
+def open_run(architecture, problem, run_id=None):
+    if not JOURNAL_ENABLED:
+        return None
+    run_id = run_id or new_run_id(architecture)
+    journal = RunJournal(os.path.join(JOURNAL_DIR, f"{run_id}.jsonl"), run_id, architecture, problem)
+    if journal.resumed:
+        print(f"{NEON_GREEN}♻️  Resuming run {run_id} from {journal.path}{RESET_COLOR}")
+    else:
+        print(f"{CYAN}📒 Run journal: {journal.path} (resume with --run-id {run_id}){RESET_COLOR}")
+    return journal
@@ -0,0 +1,207 @@
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import consensus
+
+# Semantic cache of whole runs: a problem that is a near-duplicate of one solved before
+# (reworded, or the same bug with small edits) gets the earlier final answer.
+#
+# Each architecture keeps an index in <MOI_CACHE_DIR>/semantic/<architecture>/:
+#   vectors.f32      a memory-mapped float32 matrix, one embedding per past problem
+#   entries.sqlite3  the problem and final answer behind each row
+# A problem is embedded locally as a hashed word/bigram vector (the consensus check's
+# vectors, at DIMENSIONS dimensions) and compared with every stored row by one
+# matrix-vector product over the memmap, in blocks of SCAN_ROWS rows, so a lookup stays
+# in the tens of milliseconds with hundreds of thousands of entries and the index never
+# has to fit in memory. Several processes can share an index: rows are appended under a
+# SQLite write lock, and readers pick up new rows (and a grown file) on their next lookup.
+#
+# MOI_SEMANTIC_CACHE decides what a match at MOI_SEMANTIC_SIMILARITY or above does:
+#   off      the default: no lookups, nothing stored
+#   return   the earlier answer is returned straight away, without any model call
+#   seed     the run goes ahead with the earlier answer as extra advice (the King, the
+#            Duopoly) or as one more option on the ballot (the Democracy)
+#
+#     answer, seed = semantic_cache.consult("king", problem)
+#     ...
+#     semantic_cache.store("king", problem, final_answer)
+#
+#     python semantic_cache.py       # print the size of each index
+
+MODE = os.getenv("MOI_SEMANTIC_CACHE", "off").lower()
+SIMILARITY = float(os.getenv("MOI_SEMANTIC_SIMILARITY", "0.9"))
+CACHE_DIR = os.path.join(os.getenv("MOI_CACHE_DIR", ".moi_cache"), "semantic")
+DIMENSIONS = 512
+SCAN_ROWS = 65536
+INITIAL_ROWS = 1024
+
+PINK = '\033[95m'
+CYAN = '\033[96m'
+YELLOW = '\033[93m'
+NEON_GREEN = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+Match = collections.namedtuple("Match", "similarity problem answer")
+
+numpy = consensus.numpy
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _problem_hash(problem):
+    return hashlib.sha256(problem.strip().encode("utf-8")).hexdigest()
+
+
+def hashed_embedding(text, dimensions=DIMENSIONS):
+    return consensus.text_vectors([text], size=dimensions)[0]
+
+
+class SemanticIndex:
+    # embed(text) -> L2-normalized float32 vector of `dimensions` values; a local embedding
+    # model can be plugged in here, with its own directory (rows of different embeddings never mix)
+    def __init__(self, directory, embed=hashed_embedding, dimensions=DIMENSIONS):
+        self.directory = directory
+        self.embed = embed
+        self.dimensions = dimensions
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._capacity = 0
+        os.makedirs(directory, exist_ok=True)
+        # Autocommit mode, so writes can take the database's write lock up front (BEGIN IMMEDIATE)
+        self._db = sqlite3.connect(os.path.join(directory, "entries.sqlite3"), check_same_thread=False,
+                                   isolation_level=None, timeout=30)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (row INTEGER PRIMARY KEY, problem_sha256 TEXT UNIQUE, "
+                         "problem TEXT, answer TEXT, stored_at REAL)")
+
+    # Rows stored so far, by any process
+    def __len__(self):
+        with self._lock:
+            return self._rows()
+
+    def _rows(self):
+        return self._db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM entries").fetchone()[0]
+
+    # Map the vectors file, growing it (doubling) when it has fewer than `rows` rows
+    def _map(self, rows=0):
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        capacity = size // (4 * self.dimensions)
+        if capacity < rows:
+            capacity = max(INITIAL_ROWS, capacity)
+            while capacity < rows:
+                capacity *= 2
+            with open(self.vectors_path, 'ab') as outfile:
+                outfile.truncate(capacity * 4 * self.dimensions)
+        if capacity and capacity != self._capacity:
+            self._vectors = numpy.memmap(self.vectors_path, dtype=numpy.float32, mode="r+", shape=(capacity, self.dimensions))
+            self._capacity = capacity
+        return self._vectors
+
+    # The stored problem most similar to `problem`, if at least `similarity` similar
+    def lookup(self, problem, similarity=SIMILARITY):
+        query = numpy.asarray(self.embed(problem), dtype=numpy.float32)
+        with self._lock:
+            rows = self._rows()
+            if not rows:
+                return None
+            vectors = self._map() if self._capacity < rows else self._vectors
+            best_row, best_score = -1, -1.0
+            for start in range(0, rows, SCAN_ROWS):
+                scores = vectors[start:min(start + SCAN_ROWS, rows)] @ query
+                row = int(numpy.argmax(scores))
+                if scores[row] > best_score:
+                    best_row, best_score = start + row, float(scores[row])
+            if best_score < similarity:
+                return None
+            entry = self._db.execute("SELECT problem, answer FROM entries WHERE row = ?", (best_row,)).fetchone()
+        return Match(round(best_score, 4), entry[0], entry[1]) if entry else None
+
+    # Add a solved problem; a problem stored before keeps its row and gets the new answer
+    def add(self, problem, answer):
+        vector = numpy.asarray(self.embed(problem), dtype=numpy.float32)
+        digest = _problem_hash(problem)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self._db.execute("SELECT 1 FROM entries WHERE problem_sha256 = ?", (digest,)).fetchone():
+                    self._db.execute("UPDATE entries SET answer = ?, stored_at = ? WHERE problem_sha256 = ?", (answer, time.time(), digest))
+                else:
+                    # The vector is on disk before its row exists, so readers never see a row without one
+                    row = self._rows()
+                    vectors = self._map(row + 1)
+                    vectors[row] = vector
+                    vectors.flush()
+                    self._db.execute("INSERT INTO entries (row, problem_sha256, problem, answer, stored_at) VALUES (?, ?, ?, ?, ?)",
+                                     (row, digest, problem, answer, time.time()))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+
+def enabled():
+    return MODE in ("return", "seed") and numpy is not None
+
+
+# The process-wide index of an architecture, opened on first use
+def get_index(architecture):
+    with _indexes_lock:
+        if architecture not in _indexes:
+            _indexes[architecture] = SemanticIndex(os.path.join(CACHE_DIR, architecture))
+        return _indexes[architecture]
+
+
+def lookup(architecture, problem, similarity=SIMILARITY):
+    if not enabled():
+        return None
+    return get_index(architecture).lookup(problem, similarity)
+
+
+# Before a run: (answer, seed). In return mode, answer is the earlier answer to a
+# near-duplicate problem; in seed mode, seed is {label: earlier answer} for the run to use.
+def consult(architecture, problem):
+    if MODE in ("return", "seed") and numpy is None:
+        print(f"{YELLOW}⚠️  MOI_SEMANTIC_CACHE needs NumPy (pip install numpy), the semantic cache is off{RESET_COLOR}")
+        return None, {}
+    started = time.monotonic()
+    match = lookup(architecture, problem)
+    if match is None:
+        return None, {}
+    milliseconds = (time.monotonic() - started) * 1000
+    if MODE == "return":
+        print(f"{NEON_GREEN}🧠 A near-duplicate of this problem was solved before ({match.similarity:.0%} similar, found in {milliseconds:.0f} ms), "
+              f"returning its answer:{RESET_COLOR}\n{match.answer}")
+        return match.answer, {}
+    print(f"{CYAN}🧠 A near-duplicate of this problem was solved before ({match.similarity:.0%} similar), its answer joins this run{RESET_COLOR}")
+    return None, {f"An earlier answer to a {match.similarity:.0%} similar problem": match.answer}
+
+
+# After a run: remember its final answer
+def store(architecture, problem, answer):
+    if not enabled() or not answer:
+        return
+    try:
+        get_index(architecture).add(problem, answer)
+    except (OSError, sqlite3.Error) as e:
+        print(f"{YELLOW}⚠️  Could not add the answer to the semantic cache: {e}{RESET_COLOR}")
+
+
+def print_stats():
+    architectures = sorted(os.listdir(CACHE_DIR)) if os.path.isdir(CACHE_DIR) else []
+    if not architectures:
+        print(f"{YELLOW}No semantic cache yet ({CACHE_DIR}){RESET_COLOR}")
+        return
+    print(f"\n{NEON_GREEN}🧠 --- Semantic cache ({CACHE_DIR}, mode {MODE}, similarity {SIMILARITY}) --- 🧠{RESET_COLOR}")
+    for architecture in architectures:
+        index = get_index(architecture)
+        size = os.path.getsize(index.vectors_path) if os.path.exists(index.vectors_path) else 0
+        print(f"{CYAN}{architecture:<16}{RESET_COLOR} {len(index):>8} problems, {size / 1_000_000:.1f} MB of vectors")
+
+
+if __name__ == "__main__":
+    print_stats()
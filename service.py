@@ -0,0 +1,305 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+import providers
+import tracing
+from batch_runner import ARCHITECTURES, load_architecture
+
+# Long-running HTTP service exposing the architectures as an API.
+#
+#     python moi.py serve --port 8000
+#     curl -N -X POST localhost:8000/king -H 'Accept: text/event-stream' -d '{"problem": "..."}'
+#
+# POST /king, /duopoly, /democracy with {"problem": "..."} answers with
+# {"answer": ..., "seconds": ...}, or - with `Accept: text/event-stream` or ?stream=1 - with
+# Server-Sent Events while the run is in progress:
+#   queued   {"position": n}          waiting for a free slot
+#   started  {}                       the architecture is running
+#   partial  {"delta": ...} / {"text": ...}   the answer as it is written (text replaces, delta appends)
+#   result   {"answer": ..., "seconds": ...}
+#   error    {"error": ...}
+# GET /health reports load, GET /metrics the per-model provider metrics (Prometheus format).
+#
+# The process starts once: provider clients are built at startup and reused by every
+# request, together with the response cache and the rate limiters. Admission control
+# runs at most MOI_SERVICE_CONCURRENCY architectures at once, queues up to
+# MOI_SERVICE_QUEUE more, and turns further requests away with a 503 and Retry-After, so
+# a burst of users waits in line instead of piling onto the providers' rate limits.
+
+SERVICE_CONCURRENCY = int(os.getenv("MOI_SERVICE_CONCURRENCY", "4"))
+SERVICE_QUEUE = int(os.getenv("MOI_SERVICE_QUEUE", "16"))
+MAX_BODY_BYTES = 1_000_000
+
+PINK = '\033[95m'
+CYAN = '\033[96m'
+YELLOW = '\033[93m'
+NEON_GREEN = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+            500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Stands in for the live HTML report: the architectures call update(text) as their answer
+# streams in (from worker threads), and every update becomes an SSE event on the loop
+class EventReport:
+    def __init__(self, loop, events):
+        self._loop = loop
+        self._events = events
+        self._sent = ""
+
+    def update(self, text, force=False):
+        if text.startswith(self._sent):
+            event = ("partial", {"delta": text[len(self._sent):]})
+        else:
+            event = ("partial", {"text": text})
+        self._sent = text
+        if event[1].get("delta") != "":
+            self._loop.call_soon_threadsafe(self._events.put_nowait, event)
+
+    def finish(self, text):
+        self.update(text)
+
+
+# At most `capacity` runs at once and `queue_limit` waiting; positions are handed out in arrival order.
+# A request is counted in by admit() before anything awaits, so requests arriving together
+# cannot all pass the check; it then either acquire()s a run slot or is withdraw()n.
+class Admission:
+    def __init__(self, capacity, queue_limit):
+        self.capacity = capacity
+        self.queue_limit = queue_limit
+        self.running = 0
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(capacity)
+
+    # Count a request in; False when the queue is full
+    def admit(self):
+        if self.running + self.waiting >= self.capacity + self.queue_limit:
+            return False
+        self.waiting += 1
+        return True
+
+    # An admitted request that gives up before acquire()
+    def withdraw(self):
+        self.waiting -= 1
+
+    # Position in the queue of the requests admitted so far (0: the last one runs straight away)
+    def position(self):
+        return max(0, self.running + self.waiting - self.capacity)
+
+    # Wait for a run slot for an admitted request
+    async def acquire(self):
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    def release(self):
+        self.running -= 1
+        self._slots.release()
+
+
+class Service:
+    def __init__(self, concurrency=SERVICE_CONCURRENCY, queue_limit=SERVICE_QUEUE):
+        self.admission = Admission(concurrency, queue_limit)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="moi-run")
+        self.completed = 0
+        self.failed = 0
+        self.started_at = time.time()
+
+    # --- HTTP plumbing -------------------------------------------------------------------
+
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise RequestError(400, "Malformed request line")
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    async def _send(self, writer, status, payload, content_type="application/json", extra_headers=None):
+        body = payload if isinstance(payload, bytes) else (json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                                                           if content_type == "application/json" else payload.encode("utf-8"))
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}", "Connection: close"]
+        head += [f"{name}: {value}" for name, value in (extra_headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _start_events(self, writer):
+        writer.write(("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                      "Connection: close\r\nX-Accel-Buffering: no\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+    async def _send_event(self, writer, name, data):
+        writer.write(f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await writer.drain()
+
+    # --- requests ------------------------------------------------------------------------
+
+    async def handle(self, reader, writer):
+        try:
+            request = await self._read_request(reader)
+            if request is not None:
+                await self.route(writer, *request)
+        except RequestError as e:
+            await self._send(writer, e.status, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass    # the client went away
+        finally:
+            writer.close()
+
+    async def route(self, writer, method, target, headers, body):
+        url = urlparse(target)
+        path = url.path.rstrip("/") or "/"
+        if path == "/health":
+            await self._send(writer, 200, {"status": "ok", "running": self.admission.running, "queued": self.admission.waiting,
+                                           "capacity": self.admission.capacity, "queue_limit": self.admission.queue_limit,
+                                           "completed": self.completed, "failed": self.failed,
+                                           "uptime_seconds": round(time.time() - self.started_at, 1)})
+            return
+        if path == "/metrics":
+            await self._send(writer, 200, tracing.metrics_text(), content_type="text/plain; version=0.0.4")
+            return
+        architecture = path.lstrip("/")
+        if architecture not in ARCHITECTURES:
+            raise RequestError(404, f"Unknown endpoint {path}; use /{', /'.join(ARCHITECTURES)}, /health or /metrics")
+        if method != "POST":
+            raise RequestError(405, f"Use POST {path} with a JSON body {{\"problem\": ...}}")
+        try:
+            problem = json.loads(body or b"{}").get("problem", "")
+        except (json.JSONDecodeError, AttributeError):
+            raise RequestError(400, "The body must be JSON like {\"problem\": \"...\"}")
+        if not isinstance(problem, str) or not problem.strip():
+            raise RequestError(400, "Missing \"problem\"")
+
+        if not self.admission.admit():
+            await self._send(writer, 503, {"error": "The service is at capacity, try again shortly"},
+                             extra_headers={"Retry-After": "10"})
+            return
+        wants_events = "text/event-stream" in headers.get("accept", "") or parse_qs(url.query).get("stream") == ["1"]
+        if wants_events:
+            await self.solve_with_events(writer, architecture, problem)
+        else:
+            await self.solve(writer, architecture, problem)
+
+    async def _run(self, architecture, problem, report):
+        solve = load_architecture(architecture)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: solve(problem, stream=report is not None, report=report))
+
+    async def solve(self, writer, architecture, problem):
+        await self.admission.acquire()
+        started = time.monotonic()
+        try:
+            answer = await self._run(architecture, problem, None)
+        except Exception as e:
+            self.failed += 1
+            await self._send(writer, 500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        finally:
+            self.admission.release()
+        self.completed += 1
+        await self._send(writer, 200, {"architecture": architecture, "answer": answer,
+                                       "seconds": round(time.monotonic() - started, 3)})
+
+    async def solve_with_events(self, writer, architecture, problem):
+        events = asyncio.Queue()
+        position = self.admission.position()
+        try:
+            await self._start_events(writer)
+            if position:
+                await self._send_event(writer, "queued", {"position": position})
+        except BaseException:
+            self.admission.withdraw()
+            raise
+        await self.admission.acquire()
+        started = time.monotonic()
+
+        async def run():
+            try:
+                answer = await self._run(architecture, problem, EventReport(asyncio.get_running_loop(), events))
+                self.completed += 1
+                events.put_nowait(("result", {"architecture": architecture, "answer": answer,
+                                              "seconds": round(time.monotonic() - started, 3)}))
+            except Exception as e:
+                self.failed += 1
+                events.put_nowait(("error", {"error": f"{type(e).__name__}: {e}"}))
+            finally:
+                self.admission.release()
+
+        # The run carries on if the client disconnects, so its slot is released normally
+        task = asyncio.ensure_future(run())
+        await self._send_event(writer, "started", {})
+        while True:
+            name, data = await events.get()
+            try:
+                await self._send_event(writer, name, data)
+            except ConnectionError:
+                await task
+                return
+            if name in ("result", "error"):
+                return
+
+
+async def serve(host="127.0.0.1", port=8000, concurrency=SERVICE_CONCURRENCY, queue_limit=SERVICE_QUEUE):
+    service = Service(concurrency, queue_limit)
+    # Build every provider client (and import every architecture) before the first request
+    loop = asyncio.get_running_loop()
+    for provider in ("openai", "mistral", "gemini"):
+        try:
+            await loop.run_in_executor(None, providers.warm_up, (provider,))
+        except Exception as e:
+            print(f"{YELLOW}⚠️  Could not set up {provider} ahead of time, it will be retried on first use: {e}{RESET_COLOR}")
+    for architecture in ARCHITECTURES:
+        load_architecture(architecture)
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"{NEON_GREEN}🛰️  --- Mixture of Idiots service on http://{host}:{port} "
+          f"({concurrency} concurrent runs, {queue_limit} queued) --- 🛰️{RESET_COLOR}")
+    print(f"{CYAN}Endpoints: POST /{', POST /'.join(ARCHITECTURES)}, GET /health, GET /metrics{RESET_COLOR}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Mixture of Idiots architectures over HTTP.")
+    parser.add_argument("--host", default=os.getenv("MOI_SERVICE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOI_SERVICE_PORT", "8000")))
+    parser.add_argument("--concurrency", type=int, default=SERVICE_CONCURRENCY, help="architectures run at the same time")
+    parser.add_argument("--queue", type=int, default=SERVICE_QUEUE, help="requests allowed to wait for a free slot")
+    args = parser.parse_args(argv)
+    # A long-running process keeps only the per-model metrics, not a trace of every span
+    tracing.TRACE_ENABLED = False
+    try:
+        asyncio.run(serve(args.host, args.port, args.concurrency, args.queue))
+    except KeyboardInterrupt:
+        print(f"\n{YELLOW}👋 Service stopped{RESET_COLOR}")
+
+
+if __name__ == "__main__":
+    main()
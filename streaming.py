@@ -0,0 +1,68 @@
+import os
+import sys
+import threading
+
+from tqdm import tqdm
+
+# Console helpers for streamed model output.
+# Pass their on_token callbacks to providers.call_model so output is shown as it is written.
+
+# Stream by default; MOI_STREAM=0 waits for complete answers like before
+STREAM_OUTPUT = os.getenv("MOI_STREAM", "1").lower() not in ("0", "false", "no", "off")
+
+RESET_COLOR = '\033[0m'
+
+
+# Writes the tokens of a single stream (the King, an oracle, the summarizer) straight to the console
+class ConsoleStream:
+    def __init__(self, color="", also=None):
+        self.color = color
+        self.also = also            # optional extra on_token callback, e.g. a live report
+        self.parts = []
+        self._lock = threading.Lock()
+
+    def __call__(self, token):
+        with self._lock:
+            self.parts.append(token)
+            sys.stdout.write(f"{self.color}{token}{RESET_COLOR}")
+            sys.stdout.flush()
+        if self.also:
+            self.also("".join(self.parts))
+
+    def end(self):
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+
+# Collects several concurrent streams (advisors, voters) at once.
+# Each stream gets its own live tqdm counter instead of interleaving raw tokens on the
+# console, and its partial text stays available - so an advisor cut off by the deadline
+# can still contribute what it had written so far.
+class StreamBoard:
+    def __init__(self, labels, position_offset=1):
+        self._parts = {key: [] for key in labels}
+        self._lock = threading.Lock()
+        self._bars = {
+            key: tqdm(total=None, desc=f"✍️  {label}", unit="tok", position=position_offset + i, leave=False)
+            for i, (key, label) in enumerate(labels.items())
+        }
+
+    # The on_token callback for one stream
+    def feeder(self, key):
+        def on_token(token):
+            with self._lock:
+                self._parts[key].append(token)
+            self._bars[key].update()
+        return on_token
+
+    def partial(self, key):
+        with self._lock:
+            return "".join(self._parts[key]).strip()
+
+    def close(self):
+        for bar in self._bars.values():
+            bar.close()
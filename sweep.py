@@ -0,0 +1,317 @@
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import queue
+import socket
+import sys
+import time
+from datetime import datetime
+
+from tqdm import tqdm
+
+import rate_limit
+import tracing
+from batch_runner import ARCHITECTURES, load_architecture, load_problems, parse_provider_caps
+
+# Evaluation sweeps: every (architecture, problem, roster) combination, spread over a pool
+# of worker processes and, through a shared results directory, over several machines.
+#
+#     python sweep.py run king,duopoly,democracy example_problems.txt --rosters rosters.json --workers 8
+#     python sweep.py run all example_problems.txt --out /shared/sweeps/may --shard 0/3   # on three hosts
+#     python sweep.py report /shared/sweeps/may
+#
+# Each worker process imports the SDKs and builds the provider clients once, then runs an
+# asyncio loop that keeps --concurrency jobs going at a time, all sharing those warm clients.
+# Workers write their console output to <out>/logs/ instead of the terminal; the
+# coordinator only shows one progress bar. Results come back to the coordinator, which
+# appends them to <out>/results-<host>-<shard>.jsonl and adds every provider call the
+# workers made to its own latency/cost summary.
+#
+# A roster file names sets of model_registry.roster() settings to compare, e.g.
+#     {"default": {}, "small": {"size": 3}, "no-gemini": {"exclude": ["gemini"]}}
+# Jobs are split between hosts by a hash of their id (--shard i/n), and jobs with a
+# successful result anywhere in the directory are skipped, so a sweep resumes where it stopped.
+
+WORKERS = int(os.getenv("MOI_SWEEP_WORKERS", str(os.cpu_count() or 2)))
+CONCURRENCY = int(os.getenv("MOI_SWEEP_CONCURRENCY", "4"))
+DEFAULT_ROSTERS = {"default": {}}
+
+PINK = '\033[95m'
+CYAN = '\033[96m'
+YELLOW = '\033[93m'
+NEON_GREEN = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+# Summary fields that add up across hosts (percentiles do not, and are left out of merged summaries)
+_ADDITIVE_FIELDS = ("calls", "cache_hits", "errors", "retries", "prompt_tokens", "cached_tokens", "completion_tokens")
+
+
+def job_id(architecture, problem_id, roster_name):
+    return hashlib.sha256(f"{architecture}\0{problem_id}\0{roster_name}".encode("utf-8")).hexdigest()[:16]
+
+
+def build_jobs(architectures, problems, rosters):
+    return [{"job": job_id(architecture, problem["id"], roster_name), "architecture": architecture,
+             "roster": roster_name, "roster_settings": settings,
+             "problem_id": problem["id"], "title": problem["title"], "problem": problem["problem"]}
+            for architecture in architectures for problem in problems for roster_name, settings in rosters.items()]
+
+
+def in_shard(job, shard, shards):
+    return int(job["job"], 16) % shards == shard
+
+
+# "i/n" -> (i, n)
+def parse_shard(value):
+    shard, _, shards = value.partition("/")
+    shard, shards = int(shard), int(shards or 1)
+    if not 0 <= shard < shards:
+        raise ValueError(f"--shard looks like 0/3 (shard 0 of 3), got {value!r}")
+    return shard, shards
+
+
+def load_rosters(path):
+    if not path:
+        return dict(DEFAULT_ROSTERS)
+    with open(path, 'r', encoding='utf-8') as infile:
+        return json.load(infile)
+
+
+# Every result written to the directory so far, by any host; the latest record per job wins
+def load_results(directory):
+    records = {}
+    for path in sorted(glob.glob(os.path.join(directory, "results-*.jsonl"))):
+        with open(path, 'r', encoding='utf-8') as infile:
+            for line in infile:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue    # a line cut short by an interruption, or still being written
+                if record.get("job") not in records or not record.get("error"):
+                    records[record["job"]] = record
+    return records
+
+
+# --- worker processes ---------------------------------------------------------------------
+
+def _run_job(job, call_model_fn):
+    import model_registry
+    solve = load_architecture(job["architecture"])
+    record = {field: job[field] for field in ("job", "architecture", "roster", "problem_id", "title")}
+    started = time.monotonic()
+    try:
+        with model_registry.roster(**job["roster_settings"]):
+            record["answer"] = solve(job["problem"], call_model_fn=call_model_fn, stream=False)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.monotonic() - started, 3)
+    record["host"] = socket.gethostname()
+    record["worker"] = os.getpid()
+    return record
+
+
+async def _serve(job_queue, result_queue, concurrency, call_model_fn):
+    async def take_jobs():
+        while True:
+            job = await asyncio.to_thread(job_queue.get)
+            if job is None:
+                return
+            record = await asyncio.to_thread(_run_job, job, call_model_fn)
+            result_queue.put(("result", record))
+
+    await asyncio.gather(*(take_jobs() for _ in range(concurrency)))
+
+
+def _worker_main(job_queue, result_queue, concurrency, provider_caps, fake_delay, log_path):
+    log = open(log_path, 'a', encoding='utf-8', buffering=1)
+    sys.stdout = sys.stderr = log
+    if provider_caps:
+        rate_limit.set_concurrency_limits(provider_caps)
+    # Every provider call made here also reaches the coordinator's summary. Workers write no
+    # trace, so no span events pile up; the calls themselves are kept in a bounded deque.
+    tracing.TRACE_ENABLED = False
+    tracing.add_call_listener(lambda call: result_queue.put(("call", call)))
+    call_model_fn = None
+    if fake_delay is not None:
+        from fake_provider import FakeProvider
+        call_model_fn = FakeProvider(default_delay=fake_delay).call
+    else:
+        import providers
+        for provider in ("openai", "mistral", "gemini"):
+            try:
+                providers.warm_up((provider,))
+            except Exception as e:
+                print(f"{YELLOW}⚠️  Could not set up {provider} ahead of time, it will be retried on first use: {e}{RESET_COLOR}")
+    for architecture in ARCHITECTURES:
+        load_architecture(architecture)
+    try:
+        asyncio.run(_serve(job_queue, result_queue, concurrency, call_model_fn))
+    finally:
+        log.flush()
+
+
+# --- coordinator --------------------------------------------------------------------------
+
+# Run this host's share of the sweep; returns the records of the jobs run now.
+# fake_delay runs every call against fake_provider.FakeProvider instead of the real APIs.
+def run_sweep(architectures, problems, rosters, out_dir, workers=WORKERS, concurrency=CONCURRENCY,
+              shard=0, shards=1, provider_caps=None, fake_delay=None):
+    jobs = [job for job in build_jobs(architectures, problems, rosters) if in_shard(job, shard, shards)]
+    done = {job for job, record in load_results(out_dir).items() if not record.get("error")}
+    todo = [job for job in jobs if job["job"] not in done]
+    print(f"{NEON_GREEN}🧪 --- Sweep: {len(architectures)} architectures x {len(problems)} problems x {len(rosters)} rosters, "
+          f"shard {shard}/{shards}: {len(jobs)} jobs, {len(jobs) - len(todo)} already done, {len(todo)} to run --- 🧪{RESET_COLOR}")
+    if not todo:
+        return []
+
+    host = socket.gethostname()
+    # The provider summary written at the end covers this sweep only
+    tracing.reset()
+    os.makedirs(os.path.join(out_dir, "logs"), exist_ok=True)
+    workers = max(1, min(workers, math.ceil(len(todo) / concurrency)))
+    # Provider caps hold for the whole host, so each worker gets its share
+    worker_caps = {provider: max(1, limit // workers) for provider, limit in (provider_caps or {}).items()}
+    print(f"{CYAN}⚙️  {workers} worker processes x {concurrency} concurrent jobs, logs in {os.path.join(out_dir, 'logs')}{RESET_COLOR}")
+
+    # Fresh interpreters rather than forks, so no locks or client connections are inherited
+    context = multiprocessing.get_context("spawn")
+    job_queue, result_queue = context.Queue(), context.Queue()
+    for job in todo:
+        job_queue.put(job)
+    for _ in range(workers * concurrency):
+        job_queue.put(None)
+    processes = []
+    for number in range(workers):
+        log_path = os.path.join(out_dir, "logs", f"{host}-{shard}of{shards}-worker{number}.log")
+        process = context.Process(target=_worker_main, name=f"sweep-worker-{number}", daemon=True,
+                                  args=(job_queue, result_queue, concurrency, worker_caps, fake_delay, log_path))
+        process.start()
+        processes.append(process)
+
+    out_path = os.path.join(out_dir, f"results-{host}-{shard}of{shards}.jsonl")
+    records = []
+    progress_bar = tqdm(total=len(todo), desc="Sweep", unit="job")
+    with open(out_path, 'a', encoding='utf-8') as outfile:
+        while len(records) < len(todo):
+            try:
+                kind, payload = result_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break   # a worker died; its unfinished jobs run again on the next sweep
+                continue
+            if kind == "call":
+                # The worker already recorded the call in the model statistics (model_registry listens)
+                tracing.record_call(payload, notify=False)
+                continue
+            outfile.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            outfile.flush()
+            records.append(payload)
+            progress_bar.set_description(f"{payload['architecture']}/{payload['roster']}")
+            progress_bar.update()
+    progress_bar.close()
+    for process in processes:
+        process.join(timeout=10)
+
+    # This session's provider figures, merged with the other hosts' by `sweep.py report`
+    summary_path = os.path.join(out_dir, f"providers-{host}-{shard}of{shards}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(summary_path, 'w', encoding='utf-8') as outfile:
+        json.dump(tracing.summary(), outfile)
+    if len(records) < len(todo):
+        print(f"{YELLOW}⚠️  {len(todo) - len(records)} jobs got no result (a worker exited early); run the sweep again to retry them{RESET_COLOR}")
+    return records
+
+
+# Per (architecture, roster) results of everything in the directory
+def summarize(directory):
+    groups = {}
+    for record in load_results(directory).values():
+        groups.setdefault((record["architecture"], record["roster"]), []).append(record)
+    rows = []
+    for (architecture, roster_name), records in sorted(groups.items()):
+        seconds = [record["seconds"] for record in records if not record.get("error")]
+        rows.append({"architecture": architecture, "roster": roster_name, "jobs": len(records),
+                     "solved": len(seconds), "failed": len(records) - len(seconds),
+                     "p50_seconds": tracing.percentile(seconds, 0.5), "p95_seconds": tracing.percentile(seconds, 0.95)})
+    return rows
+
+
+# Provider figures of every host and session, added up per model
+def provider_totals(directory):
+    totals = {}
+    for path in sorted(glob.glob(os.path.join(directory, "providers-*.json"))):
+        with open(path, 'r', encoding='utf-8') as infile:
+            for row in json.load(infile):
+                total = totals.setdefault((row["provider"], row["model"]), {"provider": row["provider"], "model": row["model"], "cost_usd": None})
+                for field in _ADDITIVE_FIELDS:
+                    total[field] = total.get(field, 0) + row.get(field, 0)
+                if row.get("cost_usd") is not None:
+                    total["cost_usd"] = (total["cost_usd"] or 0) + row["cost_usd"]
+    return [totals[key] for key in sorted(totals)]
+
+
+def print_report(directory):
+    rows = summarize(directory)
+    if not rows:
+        print(f"{YELLOW}No sweep results in {directory}{RESET_COLOR}")
+        return
+    print(f"\n{NEON_GREEN}📋 --- Sweep results ({directory}) --- 📋{RESET_COLOR}")
+    print(f"{CYAN}{'architecture':<16} {'roster':<16} {'jobs':>5} {'solved':>7} {'failed':>7} {'p50':>9} {'p95':>9}{RESET_COLOR}")
+    for row in rows:
+        p50 = "-" if row["p50_seconds"] is None else f"{row['p50_seconds']:.1f}s"
+        p95 = "-" if row["p95_seconds"] is None else f"{row['p95_seconds']:.1f}s"
+        print(f"{row['architecture']:<16} {row['roster']:<16} {row['jobs']:>5} {row['solved']:>7} {row['failed']:>7} {p50:>9} {p95:>9}")
+    totals = provider_totals(directory)
+    if totals:
+        print(f"\n{CYAN}{'model':<48} {'calls':>6} {'errors':>6} {'tokens in/out':>17} {'cached':>7} {'cost':>9}{RESET_COLOR}")
+        for row in totals:
+            cost = "-" if row["cost_usd"] is None else f"${row['cost_usd']:.4f}"
+            cached = f"{row['cached_tokens'] / row['prompt_tokens']:.0%}" if row["prompt_tokens"] else "-"
+            print(f"{row['model']:<48} {row['calls']:>6} {row['errors']:>6} {str(row['prompt_tokens']) + '/' + str(row['completion_tokens']):>17} {cached:>7} {cost:>9}")
+        known_costs = [row["cost_usd"] for row in totals if row["cost_usd"] is not None]
+        if known_costs:
+            print(f"{PINK}Total cost (priced models): ${sum(known_costs):.4f}{RESET_COLOR}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(prog="sweep.py", description="Run evaluation sweeps across architectures, problems and rosters.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run this host's share of a sweep")
+    run.add_argument("architectures", help=f"comma-separated, or all ({', '.join(ARCHITECTURES)})")
+    run.add_argument("problems", help="problem set file (blank-line separated) or directory of .txt files")
+    run.add_argument("--rosters", help="JSON file of named roster settings (default: one default roster)")
+    run.add_argument("--out", default=os.path.join("results", "sweep"), help="results directory, shared between hosts (default: results/sweep)")
+    run.add_argument("--workers", type=int, default=WORKERS, help="worker processes on this host")
+    run.add_argument("--concurrency", type=int, default=CONCURRENCY, help="jobs each worker runs at the same time")
+    run.add_argument("--shard", default="0/1", help="this host's shard, e.g. 1/3 for the second of three hosts")
+    run.add_argument("--provider-cap", action="append", metavar="PROVIDER=N",
+                     help="max in-flight requests to a provider from this host, e.g. openai=8 (repeatable)")
+    run.add_argument("--fake", type=float, metavar="SECONDS", help="answer every call with the offline fake provider after this delay")
+    report = commands.add_parser("report", help="summarize the results of a sweep directory")
+    report.add_argument("directory")
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        return print_report(args.directory)
+    architectures = list(ARCHITECTURES) if args.architectures == "all" else [name.strip() for name in args.architectures.split(",")]
+    unknown = [name for name in architectures if name not in ARCHITECTURES]
+    if unknown:
+        parser.error(f"unknown architecture {unknown[0]!r}, choose from {', '.join(ARCHITECTURES)}")
+    shard, shards = parse_shard(args.shard)
+    started = time.monotonic()
+    records = run_sweep(architectures, load_problems(args.problems), load_rosters(args.rosters), args.out,
+                        workers=args.workers, concurrency=args.concurrency, shard=shard, shards=shards,
+                        provider_caps=parse_provider_caps(args.provider_cap), fake_delay=args.fake)
+    failed = sum(1 for record in records if record.get("error"))
+    print(f"\n{NEON_GREEN}✅ --- Sweep shard complete: {len(records) - failed} solved, {failed} failed in {time.monotonic() - started:.1f}s --- ✅{RESET_COLOR}")
+    tracing.print_summary()
+    print_report(args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import consensus
+
+
+def fenced(code, heading="**Final Answer:**"):
+    return f"{heading}\n```python\n{code}\n```"
+
+
+def test_extract_answer_reads_the_answer_on_the_same_line():
+    assert consensus.extract_answer("Some reasoning.\n\nFinal answer: 42.") == "42"
+    assert consensus.extract_answer("The final answer is **x = 3**") == "x = 3"
+    assert consensus.extract_answer("\\boxed{7}") == "7"
+
+
+def test_extract_answer_ignores_a_heading_followed_by_a_code_block():
+    assert consensus.extract_answer(fenced("print(1)")) is None
+    assert consensus.extract_answer("Final answer: ```python") is None
+    assert consensus.extract_answer("Final Answer: ...") is None
+
+
+def test_check_compares_different_code_under_the_same_heading_by_code():
+    answers = {"a": fenced("def f():\n    return 1"), "b": fenced("import os\nos.listdir('.')"), "c": fenced("class X:\n    pass")}
+    result = consensus.check(answers, threshold=0.6)
+    assert not result["reached"]
+    assert result["agreement"] < 0.6
+
+
+def test_check_code_decides_over_matching_final_answers():
+    answers = {"a": "Final answer: 42\n```python\nx = 42\n```",
+               "b": "Final answer: 42\n```python\nprint('something else')\n```",
+               "c": "Final answer: 42\n```python\nwhile True:\n    pass\n```"}
+    assert not consensus.check(answers, threshold=0.6)["reached"]
+
+
+def test_check_agrees_on_the_same_code_with_different_comments():
+    answers = {name: fenced(f"x = 42  # {name}\nprint(x)") for name in "abc"}
+    result = consensus.check(answers, threshold=0.6)
+    assert result["reached"]
+    assert result["reason"] == "3/3 advisors agree (code)"
+
+
+def test_check_agrees_on_the_same_stated_answer():
+    answers = {"a": "It is four. Final answer: 4", "b": "Adding them gives: the answer is 4.", "c": "Final answer: **4**"}
+    result = consensus.check(answers, threshold=0.6)
+    assert result["reached"]
+    assert result["group"] == ["a", "b", "c"]
@@ -0,0 +1,31 @@
+from discussion import Discussion
+
+
+def convergence(earlier, latest):
+    discussion = Discussion(["Oracle A", "Oracle B"], "opening", "problem")
+    discussion.add("Oracle A", earlier)
+    discussion.add("Oracle B", latest)
+    return discussion.convergence()
+
+
+def test_a_shared_heading_over_different_code_is_not_convergence():
+    assert convergence("Final Answer:\n```python\ndef f(x):\n    return sorted(x)\n```",
+                       "Final Answer:\n```python\nimport heapq\nheapq.nsmallest(3, items)\n```") is None
+
+
+def test_the_same_stated_answer_with_different_code_is_not_convergence():
+    assert convergence("Final answer: 42\n```python\nx = 1\n```",
+                       "Final answer: 42\n```python\nwhile True:\n    retry()\n```") is None
+
+
+def test_the_same_code_converges():
+    assert convergence("Final answer: 42\n```python\nx = compute(6, 7)\n```",
+                       "Agreed. Final answer: 42\n```python\nx = compute(6, 7)  # checked\n```") == "both propose the same code"
+
+
+def test_the_same_stated_answer_without_code_converges():
+    assert convergence("So the final answer is 12.", "Agreed, final answer: 12") == "both state the final answer '12'"
+
+
+def test_an_agree_line_converges():
+    assert convergence("Use a heap.", "That works for me.\nAGREE") == "Oracle B agreed"
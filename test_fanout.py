@@ -0,0 +1,75 @@
+import threading
+import time
+
+from fake_provider import FakeProvider
+from fanout import BackgroundFanOut, fan_out
+
+
+def jobs(*models):
+    return {model: ("openai", model, "What is 2+2?") for model in models}
+
+
+def test_results_come_back_in_job_order_with_the_skipped_jobs():
+    fake = FakeProvider(delays={"slow": 0.1}, failures={"broken"})
+    results, skipped = fan_out(jobs("slow", "fast", "broken"), fake.call)
+    assert list(results) == ["slow", "fast"]
+    assert skipped == {"broken": "error: Fake failure from broken"}
+
+
+def test_a_timed_out_job_is_cancelled_straight_away():
+    cancelled_at = {}
+
+    def worker(api_type, model_name, prompt, cancel_event=None):
+        if model_name == "stalled":
+            cancel_event.wait(5)
+            cancelled_at[model_name] = time.monotonic()
+            return "too late"
+        time.sleep(0.5)
+        return "ok"
+
+    started = time.monotonic()
+    results, skipped = fan_out(jobs("stalled", "steady"), worker, per_call_timeout={"stalled": 0.1, "default": 2}, cancellable=True)
+    assert results == {"steady": "ok"}
+    assert skipped == {"stalled": "timed out"}
+    # Told to stop at its own timeout, not when the whole fan-out ended
+    assert cancelled_at["stalled"] - started < 0.4
+
+
+def test_the_deadline_returns_what_has_arrived():
+    fake = FakeProvider(delays={"slow": 5.0}, default_delay=0.0)
+    started = time.monotonic()
+    results, skipped = fan_out(jobs("slow", "fast"), fake.call, deadline=0.2, cancellable=True)
+    assert time.monotonic() - started < 1.0
+    assert list(results) == ["fast"]
+    assert skipped == {"slow": "deadline"}
+
+
+def test_stop_when_abandons_the_remaining_jobs():
+    fake = FakeProvider(delays={"slow": 5.0})
+    events = {}
+    slow_started = threading.Event()
+
+    def worker(api_type, model_name, prompt, cancel_event=None):
+        events[model_name] = cancel_event
+        if model_name == "slow":
+            slow_started.set()
+        else:
+            slow_started.wait(1)
+        return fake.call(api_type, model_name, prompt, cancel_event=cancel_event)
+
+    started = time.monotonic()
+    results, skipped = fan_out(jobs("fast", "slow"), worker, stop_when=lambda results, pending: "fast" in results, cancellable=True)
+    assert time.monotonic() - started < 1.0
+    assert list(results) == ["fast"] and skipped == {"slow": "stopped early"}
+    assert events["slow"].is_set()
+
+
+def test_background_fan_out_hands_out_new_results_and_cancels_the_rest():
+    fake = FakeProvider(delays={"slow": 5.0})
+    advisors = BackgroundFanOut(jobs("fast", "slow"), fake.call, cancellable=True)
+    assert advisors.wait_for(1, timeout=2) == 1
+    assert advisors.take_new() == {"fast": "Fake answer from fast (openai)"}
+    assert advisors.take_new() == {}
+    assert advisors.close() == {"slow": "not needed"}
+    assert advisors._cancel_events["slow"].is_set()
+    assert not advisors._cancel_events["fast"].is_set()
@@ -0,0 +1,68 @@
+import time
+
+import rate_limit
+
+
+def opened(cooldown=60):
+    breaker = rate_limit.CircuitBreaker(failure_threshold=2, cooldown=cooldown)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_the_circuit_opens_after_repeated_failures():
+    breaker = rate_limit.CircuitBreaker(failure_threshold=2, cooldown=60)
+    breaker.record_failure()
+    assert breaker.state() == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state() == "open"
+    assert not breaker.allow()
+
+
+def test_a_success_resets_the_failure_count():
+    breaker = rate_limit.CircuitBreaker(failure_threshold=2, cooldown=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state() == "closed"
+
+
+def test_half_open_lets_a_single_trial_through():
+    breaker = opened(cooldown=0)
+    assert breaker.state() == "half-open"
+    assert breaker.allow() == "trial"
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state() == "closed" and breaker.allow() is True
+
+
+def test_a_failed_trial_opens_the_circuit_again():
+    breaker = opened(cooldown=0.05)
+    time.sleep(0.06)
+    assert breaker.allow() == "trial"
+    breaker.record_failure()
+    assert breaker.state() == "open"
+
+
+def test_a_released_trial_lets_the_next_call_try():
+    breaker = opened(cooldown=0)
+    assert breaker.allow() == "trial"
+    breaker.release_trial()
+    assert breaker.state() == "half-open"
+    assert breaker.allow() == "trial"
+
+
+def test_provider_slot_release_is_idempotent():
+    rate_limit.reset()
+    rate_limit.set_concurrency_limits({"openai": 1})
+    try:
+        with rate_limit.provider_slot("openai") as slot:
+            slot.release()
+            slot.release()
+            # The slot was handed back early, so another request can take it
+            with rate_limit.provider_slot("openai"):
+                pass
+        assert rate_limit._inflight_semaphore("openai").acquire(blocking=False)
+        assert not rate_limit._inflight_semaphore("openai").acquire(blocking=False)
+    finally:
+        rate_limit.reset()
@@ -0,0 +1,34 @@
+import pytest
+
+import reporting
+
+pytest.importorskip("markdown")
+
+
+def test_unsafe_links_and_images_point_nowhere():
+    rendered = reporting.render_markdown("[bad](javascript:alert(1)) [spaced]( JavaScript:alert(1)) ![img](data:image/png;base64,AA)")
+    assert 'href="#"' in rendered and 'src="#"' in rendered
+    assert "javascript" not in rendered.lower()
+    assert "data:" not in rendered
+
+
+def test_web_mail_and_in_page_links_are_kept():
+    rendered = reporting.render_markdown("[docs](https://example.org/a) [top](#top) ![chart](http://example.org/c.png) <someone@example.org>")
+    assert 'href="https://example.org/a"' in rendered
+    assert 'href="#top"' in rendered
+    assert 'src="http://example.org/c.png"' in rendered
+    assert 'href="#"' not in rendered
+
+
+def test_href_text_in_code_and_prose_is_left_as_written():
+    rendered = reporting.render_markdown('Use `<a href="javascript:go()">` here, or write href="javascript:x" in prose.\n\n'
+                                         '```html\n<img src="data:image/png;base64,AA">\n```')
+    assert '&lt;a href="javascript:go()"&gt;' in rendered
+    assert 'href="javascript:x"' in rendered
+    assert "src=&quot;data:image/png;base64,AA&quot;" in rendered
+
+
+def test_raw_html_is_shown_as_text():
+    rendered = reporting.render_markdown("<script>alert(1)</script>\n\n<b onclick=\"x()\">bold</b>")
+    assert "<script>" not in rendered and "&lt;script&gt;" in rendered
+    assert "<b " not in rendered
@@ -0,0 +1,55 @@
+import pytest
+
+import run_journal
+
+
+def journal(path, problem="What is 2+2?", architecture="king"):
+    return run_journal.RunJournal(str(path), "run-1", architecture, problem)
+
+
+def test_a_resumed_run_gets_back_its_results_and_completed_phases(tmp_path):
+    path = tmp_path / "run-1.jsonl"
+    first = journal(path)
+    assert not first.resumed
+    first.record("advice", "gpt-4o", "four")
+    first.record("advice", "mistral-large-latest", "4")
+    first.complete("advisors")
+
+    resumed = journal(path)
+    assert resumed.resumed
+    assert resumed.entries("advice") == {"gpt-4o": "four", "mistral-large-latest": "4"}
+    assert resumed.completed("advisors") is True
+    assert resumed.completed("answer") is None
+    assert resumed.results() == {"advice": {"gpt-4o": "four", "mistral-large-latest": "4"}}
+
+
+def test_an_empty_answer_still_counts_as_completed(tmp_path):
+    path = tmp_path / "run-1.jsonl"
+    journal(path).complete("answer", "")
+    assert journal(path).completed("answer") == ""
+
+
+def test_a_run_of_another_problem_is_refused(tmp_path):
+    path = tmp_path / "run-1.jsonl"
+    journal(path)
+    with pytest.raises(ValueError):
+        journal(path, problem="What is 3+3?")
+
+
+def test_a_line_cut_off_mid_write_is_skipped(tmp_path):
+    path = tmp_path / "run-1.jsonl"
+    journal(path).record("advice", "gpt-4o", "four")
+    with open(path, "a", encoding="utf-8") as outfile:
+        outfile.write('{"phase": "advice", "key": "gemini", "val')
+    resumed = journal(path)
+    resumed.record("advice", "mistral-large-latest", "4")
+    assert journal(path).entries("advice") == {"gpt-4o": "four", "mistral-large-latest": "4"}
+
+
+def test_a_cut_off_header_starts_the_run_afresh(tmp_path):
+    path = tmp_path / "run-1.jsonl"
+    path.write_text('{"run_id": "run-1", "archi', encoding="utf-8")
+    restarted = journal(path)
+    assert not restarted.resumed
+    restarted.record("advice", "gpt-4o", "four")
+    assert journal(path).entries("advice") == {"gpt-4o": "four"}
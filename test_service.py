@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+service = pytest.importorskip("service")
+
+
+def test_admission_is_reserved_before_the_first_await():
+    async def scenario():
+        admission = service.Admission(capacity=1, queue_limit=1)
+        # A burst arriving in the same loop iteration: only capacity + queue_limit get in
+        admitted = [admission.admit() for _ in range(5)]
+        assert admitted == [True, True, False, False, False]
+        assert admission.position() == 1
+
+        await admission.acquire()
+        assert (admission.running, admission.waiting) == (1, 1)
+        second = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        assert not second.done()
+        admission.release()
+        await second
+        assert (admission.running, admission.waiting) == (1, 0)
+        admission.release()
+        assert (admission.running, admission.waiting) == (0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_a_withdrawn_request_frees_its_place():
+    async def scenario():
+        admission = service.Admission(capacity=1, queue_limit=0)
+        assert admission.admit()
+        assert not admission.admit()
+        admission.withdraw()
+        assert admission.admit()
+
+    asyncio.run(scenario())
+
+
+def test_a_request_cancelled_in_the_queue_frees_its_place():
+    async def scenario():
+        admission = service.Admission(capacity=1, queue_limit=1)
+        assert admission.admit()
+        await admission.acquire()
+        assert admission.admit()
+        waiting = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert (admission.running, admission.waiting) == (1, 0)
+        assert admission.admit()
+
+    asyncio.run(scenario())
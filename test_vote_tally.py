@@ -0,0 +1,62 @@
+import vote_tally
+
+OPTIONS = vote_tally.option_ids(["GPT-4o", "Mistral Large", "Gemini Pro"])
+
+
+def ballot(*ranking, confidence=1.0):
+    return {"ranking": list(ranking), "confidence": confidence}
+
+
+def test_parse_ballot_reads_json_and_free_text():
+    assert vote_tally.parse_ballot('Here is my ballot: {"ranking": ["B", "a"], "confidence": 0.7}', OPTIONS) == ballot("B", "A", confidence=0.7)
+    assert vote_tally.parse_ballot('{"choice": "Option C"}', OPTIONS) == ballot("C")
+    assert vote_tally.parse_ballot("Mistral Large has the best solution.", OPTIONS) == ballot("B")
+    assert vote_tally.parse_ballot("Option A or Option B, hard to say.", OPTIONS) is None
+    assert vote_tally.parse_ballot("", OPTIONS) is None
+
+
+def test_schemes_score_differently():
+    ballots = [ballot("A", "B", "C", confidence=0.5), ballot("B", "C", "A", confidence=1.0), ballot("A", "C", "B", confidence=0.4)]
+    assert vote_tally.tally(dict(enumerate(ballots)), OPTIONS, "plurality")["winner"] == "A"
+    assert vote_tally.tally(dict(enumerate(ballots)), OPTIONS, "confidence")["winner"] == "B"
+    assert vote_tally.scores(ballots, OPTIONS, "borda") == {"A": 4.0, "B": 3.0, "C": 2.0}
+
+
+def test_ties_are_broken_by_first_choices_then_confidence_then_roster_order():
+    result = vote_tally.tally({"x": ballot("B", confidence=0.9), "y": ballot("A", confidence=0.9)}, OPTIONS)
+    assert result["winner"] == "A"
+    assert result["tie_broken"]
+    result = vote_tally.tally({"x": ballot("B", confidence=0.9), "y": ballot("A", confidence=0.3)}, OPTIONS)
+    assert result["winner"] == "B"
+
+
+def test_is_decided_once_the_runner_up_cannot_catch_up():
+    assert not vote_tally.is_decided([ballot("A"), ballot("A")], 2, OPTIONS)
+    assert vote_tally.is_decided([ballot("A"), ballot("A"), ballot("A")], 2, OPTIONS)
+
+
+def test_is_decided_counts_unparsed_ballots_as_pending():
+    # Two unreadable ballots may still be read as votes for B by the vote counter model
+    assert not vote_tally.is_decided([ballot("A"), ballot("A"), None, None], 0, OPTIONS)
+    assert vote_tally.is_decided([ballot("A"), ballot("A"), ballot("A"), None], 0, OPTIONS)
+
+
+def test_unparsed_ballots_are_repaired_from_the_counter_models_answer():
+    repaired = vote_tally.apply_repair('{"voter 1": "C", "voter 2": null}', {"voter 1": "...", "voter 2": "..."}, OPTIONS)
+    assert repaired == {"voter 1": ballot("C"), "voter 2": None}
+    assert vote_tally.apply_repair("no idea", {"voter 1": "..."}, OPTIONS) == {"voter 1": None}
+
+
+def test_no_valid_ballot_falls_back_to_the_first_option():
+    result = vote_tally.tally({"x": None, "y": None}, OPTIONS)
+    assert result["winner"] == "A"
+    assert result["fallback"]
+    answer = vote_tally.format_result(result, OPTIONS, {"GPT-4o": "solution A", "Mistral Large": "b", "Gemini Pro": "c"})
+    assert "No valid ballots were cast" in answer
+    assert answer.endswith("solution A")
+
+
+def test_an_elected_winner_is_not_a_fallback():
+    result = vote_tally.tally({"x": ballot("C"), "y": None}, OPTIONS)
+    assert (result["winner"], result["fallback"], result["invalid"]) == ("C", False, ["y"])
+    assert vote_tally.format_result(result, OPTIONS, {"Gemini Pro": "solution C"}).startswith("**Winning solution: Option C from Gemini Pro**")
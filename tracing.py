@@ -0,0 +1,350 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# Timing and token instrumentation for a run.
+#
+# Every provider call (see providers.call_model) and every architecture phase is recorded
+# as a span: wall time, time to first token, prompt and completion tokens, retries and
+# cache hits. At the end of a run the spans are written as a Chrome trace-event JSON
+# file (open it in chrome://tracing or https://ui.perfetto.dev), optionally together with
+# a Prometheus text-format metrics file, and a per-model latency/cost summary is printed.
+#
+#     phase = tracing.start_span("advisors", "phase")
+#     ...
+#     phase.end()
+#     tracing.finish_run("king")
+
+# Write a trace per run to MOI_TRACE_DIR (MOI_TRACE=0 turns tracing off);
+# MOI_METRICS_FILE additionally writes Prometheus metrics there
+TRACE_ENABLED = os.getenv("MOI_TRACE", "1").lower() not in ("0", "false", "no", "off")
+TRACE_DIR = os.getenv("MOI_TRACE_DIR", "traces")
+METRICS_FILE = os.getenv("MOI_METRICS_FILE")
+# Provider calls kept for the latency percentiles; older ones are dropped (bounds memory in
+# the service). Call, error and token counts are running totals, so they never go down.
+MAX_CALLS = int(os.getenv("MOI_TRACE_MAX_CALLS", "100000"))
+
+# USD per million (prompt, completion) tokens. List prices at the time of writing; free
+# experimental models and models missing here are reported without a cost. Prompt tokens
+# served from a provider's prompt cache are billed at CACHED_PROMPT_PRICE of the prompt price.
+PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4-turbo-preview": (10.00, 30.00),
+    "mistral-large-latest": (2.00, 6.00),
+    "mistral-small-latest": (0.20, 0.60),
+    "open-mixtral-8x22b": (2.00, 6.00),
+    "models/gemini-1.5-flash-latest": (0.075, 0.30),
+    "models/gemini-1.5-pro-latest": (1.25, 5.00),
+}
+
+CACHED_PROMPT_PRICE = 0.5
+
+PINK = '\033[95m'
+CYAN = '\033[96m'
+YELLOW = '\033[93m'
+NEON_GREEN = '\033[92m'
+RESET_COLOR = '\033[0m'
+
+_lock = threading.Lock()
+_events = []
+_calls = deque(maxlen=MAX_CALLS)     # one dict per finished provider call, for the latency percentiles
+_totals = {}    # (provider, model) -> counts and tokens of every call so far, for the summary and metrics
+_thread_ids = {}
+_call_listeners = []    # called with each finished provider call (see model_registry)
+_origin = time.perf_counter()
+_phase_log = contextvars.ContextVar("phase_log", default=None)
+
+
+def _now_us():
+    return (time.perf_counter() - _origin) * 1_000_000
+
+
+# Small stable ids for threads, so the trace viewer shows one row per worker
+def _thread_id():
+    ident = threading.get_ident()
+    with _lock:
+        if ident not in _thread_ids:
+            _thread_ids[ident] = len(_thread_ids) + 1
+            _events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": _thread_ids[ident],
+                            "args": {"name": threading.current_thread().name}})
+        return _thread_ids[ident]
+
+
+class Span:
+    def __init__(self, name, category, **args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.tid = _thread_id()
+        self.started = _now_us()
+        self.ended = None
+
+    def end(self, **args):
+        if self.ended is not None:
+            return
+        self.ended = _now_us()
+        self.args.update(args)
+        phases = _phase_log.get()
+        if phases is not None and self.category in ("phase", "node"):
+            phases.append((self.name if self.category == "phase" else f"{self.category} {self.name}", round(self.seconds, 3)))
+        if TRACE_ENABLED:
+            with _lock:
+                _events.append({"name": self.name, "cat": self.category, "ph": "X", "pid": os.getpid(), "tid": self.tid,
+                                "ts": round(self.started, 1), "dur": round(self.ended - self.started, 1), "args": self.args})
+
+    @property
+    def seconds(self):
+        return ((self.ended if self.ended is not None else _now_us()) - self.started) / 1_000_000
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc is not None:
+            self.args["error"] = f"{exc_type.__name__}: {exc}"
+        self.end()
+        return False
+
+
+def start_span(name, category="phase", **args):
+    return Span(name, category, **args)
+
+
+# Collect the (name, seconds) of every phase and graph node that ends inside the block,
+# in this context and the ones copied from it (e.g. the time of each phase of one problem
+# of a batch, for its report)
+@contextlib.contextmanager
+def collect_phases():
+    phases = []
+    token = _phase_log.set(phases)
+    try:
+        yield phases
+    finally:
+        _phase_log.reset(token)
+
+
+# A span around one provider call. call_model fills in the token counts, retries and
+# cache hit, and calls first_token() when a streamed answer starts arriving.
+class ProviderCallSpan(Span):
+    def __init__(self, api_type, model_name):
+        super().__init__(model_name, "provider", provider=api_type, model=model_name)
+        self.api_type = api_type
+        self.model_name = model_name
+        self.first_token_at = None
+        self.prompt_tokens = 0
+        self.cached_tokens = 0      # of the prompt tokens, those the provider served from its prompt cache
+        self.completion_tokens = 0
+        self.retries = 0
+        self.cache_hit = False
+        self.cancelled = False      # abandoned by the caller (a hedge loser, a ballot no longer needed)
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = _now_us()
+
+    def end(self, **args):
+        if self.ended is not None:
+            return
+        ttft = None if self.first_token_at is None else round((self.first_token_at - self.started) / 1_000_000, 3)
+        super().end(ttft_seconds=ttft, prompt_tokens=self.prompt_tokens, cached_tokens=self.cached_tokens,
+                    completion_tokens=self.completion_tokens, retries=self.retries, cache_hit=self.cache_hit,
+                    cancelled=self.cancelled, **args)
+        record_call({"provider": self.api_type, "model": self.model_name, "seconds": self.seconds,
+                     "ttft": ttft, "prompt_tokens": self.prompt_tokens, "cached_tokens": self.cached_tokens,
+                     "completion_tokens": self.completion_tokens,
+                     "retries": self.retries, "cache_hit": self.cache_hit, "cancelled": self.cancelled,
+                     "error": "error" in self.args and not self.cancelled})
+
+
+def provider_call(api_type, model_name):
+    return ProviderCallSpan(api_type, model_name)
+
+
+# Add the summary record of a finished provider call; also used for calls made in another
+# process (see sweep.py), so their figures show up in this process's summary and metrics.
+# notify=False leaves out the call listeners, e.g. for a call that process already handled.
+def record_call(call, notify=True):
+    with _lock:
+        _calls.append(call)
+        totals = _totals.setdefault((call["provider"], call["model"]), dict.fromkeys(
+            ("calls", "cache_hits", "errors", "retries", "prompt_tokens", "cached_tokens", "completion_tokens"), 0))
+        totals["calls"] += 1
+        totals["errors"] += 1 if call["error"] else 0
+        totals["retries"] += call["retries"]
+        if call["cache_hit"]:
+            totals["cache_hits"] += 1
+        else:
+            totals["prompt_tokens"] += call["prompt_tokens"]
+            totals["cached_tokens"] += call.get("cached_tokens", 0)
+            totals["completion_tokens"] += call["completion_tokens"]
+    if not notify:
+        return
+    for listener in list(_call_listeners):
+        listener(call)
+
+
+# Have listener(call) called with the summary record of every finished provider call
+def add_call_listener(listener):
+    _call_listeners.append(listener)
+
+
+def cost_usd(model_name, prompt_tokens, completion_tokens, cached_tokens=0):
+    if model_name not in PRICES:
+        return None
+    prompt_price, completion_price = PRICES[model_name]
+    prompt_cost = (prompt_tokens - cached_tokens) * prompt_price + cached_tokens * prompt_price * CACHED_PROMPT_PRICE
+    return (prompt_cost + completion_tokens * completion_price) / 1_000_000
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = fraction * (len(ordered) - 1)
+    low = int(index)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (index - low)
+
+
+# Per (provider, model) latency, token and cost figures of the calls made so far.
+# Cache hits count as calls but are left out of the latency percentiles and the cost;
+# the percentiles cover the last MAX_CALLS calls, the counts and costs every call.
+def summary():
+    with _lock:
+        calls = list(_calls)
+        totals = {key: dict(model_totals) for key, model_totals in _totals.items()}
+    by_model = {}
+    for call in calls:
+        if not call["cache_hit"]:
+            by_model.setdefault((call["provider"], call["model"]), []).append(call)
+    rows = []
+    for (provider, model_name), model_totals in sorted(totals.items()):
+        remote = by_model.get((provider, model_name), [])
+        ttfts = [call["ttft"] for call in remote if call["ttft"] is not None]
+        rows.append({
+            "provider": provider,
+            "model": model_name,
+            **model_totals,
+            "p50_seconds": percentile([call["seconds"] for call in remote], 0.5),
+            "p95_seconds": percentile([call["seconds"] for call in remote], 0.95),
+            "p50_ttft_seconds": percentile(ttfts, 0.5),
+            "cost_usd": cost_usd(model_name, model_totals["prompt_tokens"], model_totals["completion_tokens"], model_totals["cached_tokens"]),
+        })
+    return rows
+
+
+# Share of the prompt tokens sent that providers served from their prompt caches
+def cached_token_ratio(rows=None):
+    rows = summary() if rows is None else rows
+    prompt_tokens = sum(row["prompt_tokens"] for row in rows)
+    return sum(row["cached_tokens"] for row in rows) / prompt_tokens if prompt_tokens else 0.0
+
+
+def _seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+
+def print_summary(rows=None):
+    rows = summary() if rows is None else rows
+    if not rows:
+        return
+    print(f"\n{NEON_GREEN}⏱️  --- Latency and Cost per Model --- ⏱️{RESET_COLOR}")
+    print(f"{CYAN}{'model':<48} {'calls':>5} {'cached':>6} {'p50':>8} {'p95':>8} {'ttft p50':>8} {'tokens in/out':>15} {'cost':>9}{RESET_COLOR}")
+    for row in rows:
+        cost = "-" if row["cost_usd"] is None else f"${row['cost_usd']:.4f}"
+        tokens = f"{row['prompt_tokens']}/{row['completion_tokens']}"
+        retries = f" {YELLOW}({row['retries']} retries, {row['errors']} errors){RESET_COLOR}" if row["retries"] or row["errors"] else ""
+        print(f"{row['model']:<48} {row['calls']:>5} {row['cache_hits']:>6} {_seconds(row['p50_seconds']):>8} "
+              f"{_seconds(row['p95_seconds']):>8} {_seconds(row['p50_ttft_seconds']):>8} {tokens:>15} {cost:>9}{retries}")
+    cached_tokens = sum(row["cached_tokens"] for row in rows)
+    print(f"{CYAN}📦 Provider prompt caches: {cached_tokens} of {sum(row['prompt_tokens'] for row in rows)} prompt tokens "
+          f"({cached_token_ratio(rows):.0%}) served from cache{RESET_COLOR}")
+    known_costs = [row["cost_usd"] for row in rows if row["cost_usd"] is not None]
+    if known_costs:
+        print(f"{PINK}Total cost (priced models): ${sum(known_costs):.4f}{RESET_COLOR}")
+
+
+def write_trace(path, run_name):
+    with _lock:
+        events = list(_events)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as outfile:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                   "otherData": {"run": run_name, "summary": summary(), "cached_token_ratio": cached_token_ratio()}}, outfile, ensure_ascii=False)
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+# Prometheus text exposition format
+def metrics_text(rows=None):
+    rows = summary() if rows is None else rows
+    metrics = [
+        ("moi_provider_calls_total", "counter", "Provider calls, including cache hits", "calls"),
+        ("moi_provider_cache_hits_total", "counter", "Provider calls answered from the response cache", "cache_hits"),
+        ("moi_provider_errors_total", "counter", "Provider calls that failed after retries", "errors"),
+        ("moi_provider_retries_total", "counter", "Retried provider requests", "retries"),
+        ("moi_provider_prompt_tokens_total", "counter", "Prompt tokens sent (as reported by the provider, else estimated locally)", "prompt_tokens"),
+        ("moi_provider_cached_prompt_tokens_total", "counter", "Prompt tokens served from the provider's prompt cache", "cached_tokens"),
+        ("moi_provider_completion_tokens_total", "counter", "Completion tokens received (estimated locally)", "completion_tokens"),
+        ("moi_provider_cost_usd_total", "counter", "Estimated cost in USD", "cost_usd"),
+    ]
+    lines = []
+    for name, kind, description, field in metrics:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for row in rows:
+            if row[field] is not None:
+                lines.append(f'{name}{{provider="{_label_value(row["provider"])}",model="{_label_value(row["model"])}"}} {row[field]}')
+    lines.append("# HELP moi_provider_latency_seconds Provider call wall time")
+    lines.append("# TYPE moi_provider_latency_seconds summary")
+    for row in rows:
+        for quantile, field in (("0.5", "p50_seconds"), ("0.95", "p95_seconds")):
+            if row[field] is not None:
+                lines.append(f'moi_provider_latency_seconds{{provider="{_label_value(row["provider"])}",model="{_label_value(row["model"])}",quantile="{quantile}"}} {row[field]:.6f}')
+    return "\n".join(lines) + "\n"
+
+
+# Metrics file, e.g. for node_exporter's textfile collector
+def write_metrics(path, rows=None):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as outfile:
+        outfile.write(metrics_text(rows))
+
+
+# End of a run: print the per-model summary and write the trace (and metrics) files.
+# Returns the trace path, or None when tracing is off.
+def finish_run(run_name):
+    rows = summary()
+    print_summary(rows)
+    if not TRACE_ENABLED:
+        return None
+    path = os.path.join(TRACE_DIR, f"{run_name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json")
+    write_trace(path, run_name)
+    print(f"{CYAN}🧭 Trace written to {path} (open it in https://ui.perfetto.dev or chrome://tracing){RESET_COLOR}")
+    if METRICS_FILE:
+        write_metrics(METRICS_FILE, rows)
+        print(f"{CYAN}📈 Metrics written to {METRICS_FILE}{RESET_COLOR}")
+    return path
+
+
+# The finished spans recorded so far (Chrome "X" events), optionally of one category
+def spans(category=None):
+    with _lock:
+        return [dict(event) for event in _events if event["ph"] == "X" and (category is None or event["cat"] == category)]
+
+
+# Forget everything recorded so far (e.g. between independent runs in one process)
+def reset():
+    with _lock:
+        _events[:] = [event for event in _events if event["ph"] == "M"]
+        _calls.clear()
+        _totals.clear()
@@ -0,0 +1,242 @@
+import json
+import re
+import string
+
+# Local, deterministic vote counting for the Democracy.
+#
+# Every solution becomes an option with a letter id (A, B, C, ...) assigned in roster
+# order. Voters answer with a JSON ballot:
+#
+#     {"ranking": ["B", "A", "C"], "confidence": 0.8}
+#
+# which is parsed and validated here and counted under one of three schemes:
+#   plurality   one point for each ballot's first choice
+#   borda       n-1 points for a first choice, n-2 for a second, ... (unranked options get 0)
+#   confidence  each ballot's first choice gets the voter's confidence (0-1)
+# Ties are broken by first-choice count, then total confidence, then roster order, so the
+# same ballots always elect the same winner. Only ballots that cannot be parsed at all
+# need a model to read them (see repair_prompt / apply_repair).
+
+SCHEMES = ("plurality", "borda", "confidence")
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+# {option id: option name} for the options in roster order
+def option_ids(option_names):
+    letters = string.ascii_uppercase
+    return {(letters[i] if i < len(letters) else f"O{i + 1}"): name for i, name in enumerate(option_names)}
+
+
+# The ballot format voters are asked to answer in
+def ballot_instructions(options):
+    ids = ", ".join(f'"{option_id}"' for option_id in options)
+    return (f"Answer with a JSON ballot and nothing else, ranking the options from best to worst by their ids ({ids}) "
+            f"and giving your confidence (0 to 1) that your first choice is the best:\n"
+            f'{{"ranking": [{ids}], "confidence": 0.8}}')
+
+
+def _option_id(value, options):
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if value.upper() in options:
+        return value.upper()
+    value = re.sub(r"^option\s+", "", value, flags=re.IGNORECASE).strip()
+    if value.upper() in options:
+        return value.upper()
+    for option_id, name in options.items():
+        if value == name:
+            return option_id
+    return None
+
+
+def _parse_json_ballot(text, options):
+    match = _JSON_OBJECT.search(text)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    ranking = []
+    raw_ranking = data.get("ranking")
+    if isinstance(raw_ranking, list):
+        for value in raw_ranking:
+            option_id = _option_id(value, options)
+            if option_id is not None and option_id not in ranking:
+                ranking.append(option_id)
+    choice = _option_id(data.get("choice") or data.get("option"), options)
+    if choice is not None:
+        ranking = [choice] + [option_id for option_id in ranking if option_id != choice]
+    if not ranking:
+        return None
+    try:
+        confidence = min(1.0, max(0.0, float(data.get("confidence", 1.0))))
+    except (TypeError, ValueError):
+        confidence = 1.0
+    return {"ranking": ranking, "confidence": confidence}
+
+
+# A free-text ballot counts for the one option it names most often (by full name or as
+# "Option X"); it is unparseable when it names none, or several equally often
+def _parse_text_ballot(text, options):
+    mentions = {}
+    for option_id, name in options.items():
+        count = text.count(name) + len(re.findall(rf"\bOption {re.escape(option_id)}\b", text))
+        if count:
+            mentions[option_id] = count
+    if not mentions:
+        return None
+    best = max(mentions.values())
+    leaders = [option_id for option_id, count in mentions.items() if count == best]
+    if len(leaders) != 1:
+        return None
+    return {"ranking": leaders, "confidence": 1.0}
+
+
+# {"ranking": [option ids, best first], "confidence": 0-1}, or None when the ballot is unparseable
+def parse_ballot(text, options):
+    if not text:
+        return None
+    return _parse_json_ballot(text, options) or _parse_text_ballot(text, options)
+
+
+def _points(ballot, option_count, scheme):
+    if scheme == "plurality":
+        return {ballot["ranking"][0]: 1.0}
+    if scheme == "confidence":
+        return {ballot["ranking"][0]: ballot["confidence"]}
+    if scheme == "borda":
+        return {option_id: float(option_count - 1 - position) for position, option_id in enumerate(ballot["ranking"])}
+    raise ValueError(f"Unknown voting scheme: {scheme}")
+
+
+# The most points one more ballot can give an option
+def _max_points(option_count, scheme):
+    return float(option_count - 1) if scheme == "borda" else 1.0
+
+
+def scores(ballots, options, scheme="plurality"):
+    totals = {option_id: 0.0 for option_id in options}
+    for ballot in ballots:
+        if ballot is not None:
+            for option_id, points in _points(ballot, len(options), scheme).items():
+                totals[option_id] += points
+    return totals
+
+
+# Options from winner to last: by score, then first-choice count, then total confidence, then roster order
+def rank_options(ballots, options, scheme="plurality"):
+    ballots = [ballot for ballot in ballots if ballot is not None]
+    totals = scores(ballots, options, scheme)
+    first_choices = {option_id: 0 for option_id in options}
+    confidence = {option_id: 0.0 for option_id in options}
+    for ballot in ballots:
+        first_choices[ballot["ranking"][0]] += 1
+        confidence[ballot["ranking"][0]] += ballot["confidence"]
+    order = list(options)
+    return sorted(options, key=lambda option_id: (-round(totals[option_id], 9), -first_choices[option_id],
+                                                  -round(confidence[option_id], 9), order.index(option_id)))
+
+
+# True once the leader has more points than the runner-up could reach with every pending ballot.
+# Unparseable ballots (None) count as pending: the vote counter model may still read them.
+def is_decided(ballots, pending_count, options, scheme="plurality"):
+    pending_count += sum(1 for ballot in ballots if ballot is None)
+    ballots = [ballot for ballot in ballots if ballot is not None]
+    if not ballots or len(options) < 2:
+        return bool(ballots)
+    totals = sorted(scores(ballots, options, scheme).values(), reverse=True)
+    return totals[0] > totals[1] + pending_count * _max_points(len(options), scheme)
+
+
+# Count parsed ballots ({voter: ballot or None}). Returns the result as a dict:
+# winner (option id), scores, ranking, first_choices, counted, invalid (voters), tie_broken
+# and fallback (no valid ballot: the winner is the first option, not an elected one).
+def tally(ballots_by_voter, options, scheme="plurality"):
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown voting scheme: {scheme}")
+    valid = [ballot for ballot in ballots_by_voter.values() if ballot is not None]
+    totals = scores(valid, options, scheme)
+    ranking = rank_options(valid, options, scheme)
+    first_choices = {option_id: sum(1 for ballot in valid if ballot["ranking"][0] == option_id) for option_id in options}
+    # Without a single valid ballot the first option in roster order is taken, so a run
+    # still ends with a solution (marked as not elected)
+    winner = (ranking[0] if ranking else None) if valid else next(iter(options), None)
+    tied = [option_id for option_id in options if round(totals[option_id], 9) == round(totals[winner], 9)] if valid and winner else []
+    return {
+        "scheme": scheme,
+        "winner": winner,
+        "scores": totals,
+        "ranking": ranking,
+        "first_choices": first_choices,
+        "counted": len(valid),
+        "invalid": sorted(voter for voter, ballot in ballots_by_voter.items() if ballot is None),
+        "tie_broken": len(tied) > 1,
+        "fallback": not valid and winner is not None,
+    }
+
+
+# A short prompt asking a model to read the ballots that could not be parsed. Only the
+# option ids, names and those ballots are sent - not the solutions.
+def repair_prompt(unparsed_votes, options):
+    option_list = "\n".join(f"{option_id}: {name}" for option_id, name in options.items())
+    ballots = "\n\n".join(f"BALLOT FROM {voter}:\n{text}" for voter, text in unparsed_votes.items())
+    voters = ", ".join(f'"{voter}": "A"' for voter in unparsed_votes)
+    return (f"The following ballots each vote for one of these options:\n{option_list}\n\n{ballots}\n\n"
+            f"For every ballot, state which option id it voted for (null if it did not clearly vote for one). "
+            f"Answer with JSON only, e.g. {{{voters}}}")
+
+
+# Ballots recovered from the model's answer to repair_prompt: {voter: ballot or None}
+def apply_repair(answer, unparsed_votes, options):
+    repaired = {voter: None for voter in unparsed_votes}
+    match = _JSON_OBJECT.search(answer or "")
+    if not match:
+        return repaired
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return repaired
+    if not isinstance(data, dict):
+        return repaired
+    for voter in unparsed_votes:
+        option_id = _option_id(data.get(voter), options)
+        if option_id is not None:
+            repaired[voter] = {"ranking": [option_id], "confidence": 1.0}
+    return repaired
+
+
+def _format_points(value):
+    return f"{value:g}" if value == int(value) else f"{value:.2f}"
+
+
+# Markdown summary of a tally, followed by the winning solution
+def format_result(result, options, solutions):
+    if result["winner"] is None:
+        return "No solutions were proposed, so no solution could be elected."
+    if result["fallback"]:
+        invalid = f" (ballots not counted: {', '.join(result['invalid'])})" if result["invalid"] else ""
+        return (f"**No valid ballots were cast{invalid}; falling back to Option {result['winner']} from "
+                f"{options[result['winner']]}, the first solution in roster order.**\n\n{solutions[options[result['winner']]]}")
+    unit = {"plurality": "votes", "borda": "Borda points", "confidence": "confidence-weighted votes"}[result["scheme"]]
+    winner_name = options[result["winner"]]
+    lines = [f"**Winning solution: Option {result['winner']} from {winner_name}** "
+             f"({_format_points(result['scores'][result['winner']])} {unit}, {result['counted']} ballots counted)", ""]
+    for option_id in result["ranking"]:
+        lines.append(f"- Option {option_id} ({options[option_id]}): {_format_points(result['scores'][option_id])} {unit}, "
+                     f"first choice of {result['first_choices'][option_id]} ballot(s)")
+    notes = []
+    if result["tie_broken"]:
+        notes.append("the top score was tied and broken by first-choice votes, then confidence, then roster order")
+    if result["invalid"]:
+        notes.append("ballots not counted: " + ", ".join(result["invalid"]))
+    if notes:
+        lines.append("")
+        lines.append("*Note: " + "; ".join(notes) + ".*")
+    lines.append("")
+    lines.append(solutions[winner_name])
+    return "\n".join(lines)